@@ -0,0 +1,219 @@
+"""
+كاتب سجلات النشاط والتدقيق لبرنامج البدر للإنارة
+يجمع السجلات في الذاكرة ويكتبها على دفعات في معاملة واحدة بدلاً من اتصال لكل سجل
+"""
+
+import atexit
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Tuple
+import logging
+
+# إعداد نظام السجلات
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+class AuditLogWriter:
+    """كاتب سجلات مُخزَّن مؤقتاً يعمل في الخلفية"""
+    
+    def __init__(self, batch_size: int = 200, flush_interval: float = 2.0, max_pending: int = 10000,
+                 retry_delay: float = 1.0, max_retry_delay: float = 60.0):
+        """
+        تهيئة كاتب السجلات
+        
+        Args:
+            batch_size: عدد السجلات الذي يُطلق الكتابة فوراً
+            flush_interval: أقصى مدة بالثواني يبقى فيها السجل في الذاكرة
+            max_pending: الحد الأقصى للسجلات المعلقة قبل الكتابة المباشرة من خيط المستدعي
+            retry_delay: مهلة أول إعادة محاولة بعد فشل الكتابة (تتضاعف مع تكرار الفشل)
+            max_retry_delay: أقصى مهلة بين محاولات الكتابة
+        """
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        
+        self._pending: List[Tuple[str, str, Dict]] = []
+        self._condition = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._worker = None
+        self._closed = False
+        
+        # الفشل المتتالي وموعد المحاولة التالية
+        self._failures = 0
+        self._retry_at = 0.0
+        
+        # إحصائيات الكتابة (failed: سجلات فشلت كتابتها وأُعيدت إلى الانتظار)
+        self.stats = {'written': 0, 'flushes': 0, 'failed': 0}
+    
+    @staticmethod
+    def current_timestamp() -> str:
+        """طابع زمني بصيغة CURRENT_TIMESTAMP في SQLite (UTC)"""
+        return datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+    
+    def write(self, db_path: str, table: str, record: Dict):
+        """
+        إضافة سجل إلى قائمة الانتظار
+        
+        Args:
+            db_path: مسار قاعدة البيانات
+            table: اسم الجدول
+            record: الأعمدة وقيمها
+        """
+        with self._condition:
+            self._pending.append((db_path, table, record))
+            closed = self._closed
+            
+            if not closed:
+                self._ensure_worker()
+                
+                if len(self._pending) >= self.batch_size:
+                    self._condition.notify()
+            
+            pending_count = len(self._pending)
+        
+        # بعد الإغلاق تُكتب السجلات مباشرة حتى لا تضيع
+        if closed or pending_count >= self.max_pending:
+            self.flush()
+    
+    def _ensure_worker(self):
+        """تشغيل خيط الكتابة في الخلفية عند أول سجل"""
+        if self._worker and self._worker.is_alive():
+            return
+        
+        self._worker = threading.Thread(target=self._run, name="audit-log-writer", daemon=True)
+        self._worker.start()
+    
+    def _run(self):
+        """حلقة خيط الكتابة: تكتب عند امتلاء الدفعة أو انقضاء المهلة"""
+        while True:
+            with self._condition:
+                # بعد فشل الكتابة لا تُعاد المحاولة قبل انقضاء مهلة التراجع
+                deadline = max(time.monotonic() + self.flush_interval, self._retry_at)
+                
+                while not self._closed:
+                    now = time.monotonic()
+                    if len(self._pending) >= self.batch_size and now >= self._retry_at:
+                        break
+                    remaining = deadline - now
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+                
+                closed = self._closed
+            
+            self.flush()
+            
+            if closed:
+                return
+    
+    def flush(self) -> int:
+        """
+        كتابة جميع السجلات المعلقة، معاملة واحدة لكل قاعدة بيانات
+        
+        سجلات قاعدة البيانات التي فشلت كتابتها تُعاد إلى بداية الانتظار بترتيبها
+        وتُعاد محاولتها بتراجع متزايد، فلا يضيع سجل تدقيق بصمت.
+        
+        Returns:
+            عدد السجلات المكتوبة
+        """
+        with self._flush_lock:
+            with self._condition:
+                batch, self._pending = self._pending, []
+            
+            if not batch:
+                return 0
+            
+            # تجميع السجلات حسب قاعدة البيانات ثم الجدول والأعمدة
+            groups: Dict[str, Dict[Tuple[str, Tuple[str, ...]], List[tuple]]] = {}
+            for db_path, table, record in batch:
+                columns = tuple(record)
+                groups.setdefault(db_path, {}).setdefault((table, columns), []).append(
+                    tuple(record[column] for column in columns)
+                )
+            
+            written = 0
+            failed_dbs = set()
+            for db_path, tables in groups.items():
+                count = sum(len(rows) for rows in tables.values())
+                
+                try:
+                    conn = sqlite3.connect(db_path, timeout=30)
+                    cursor = conn.cursor()
+                    
+                    for (table, columns), rows in tables.items():
+                        placeholders = ', '.join('?' for _ in columns)
+                        cursor.executemany(
+                            f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders})",
+                            rows
+                        )
+                    
+                    conn.commit()
+                    conn.close()
+                    
+                    written += count
+                
+                except Exception as e:
+                    failed_dbs.add(db_path)
+                    self.stats['failed'] += count
+                    logger.error(f"خطأ في كتابة {count} سجل إلى {db_path}، ستُعاد المحاولة: {str(e)}")
+            
+            if failed_dbs:
+                with self._condition:
+                    self._pending[:0] = [entry for entry in batch if entry[0] in failed_dbs]
+                
+                self._failures += 1
+                delay = min(self.max_retry_delay, self.retry_delay * 2 ** (self._failures - 1))
+                self._retry_at = time.monotonic() + delay
+            else:
+                self._failures = 0
+                self._retry_at = 0.0
+            
+            self.stats['written'] += written
+            self.stats['flushes'] += 1
+            
+            return written
+    
+    def close(self, timeout: float = 10):
+        """
+        إيقاف خيط الكتابة بعد تفريغ جميع السجلات المعلقة
+        
+        Args:
+            timeout: مهلة انتظار الخيط بالثواني
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        
+        if self._worker:
+            self._worker.join(timeout)
+            self._worker = None
+        
+        self.flush()
+        
+        with self._condition:
+            remaining = len(self._pending)
+        if remaining:
+            logger.error(f"تعذرت كتابة {remaining} سجل تدقيق قبل الإغلاق")
+    
+    def get_status(self) -> Dict:
+        """حالة كاتب السجلات وإحصائياته"""
+        with self._condition:
+            pending = len(self._pending)
+        
+        return {
+            'pending': pending,
+            'running': bool(self._worker and self._worker.is_alive()),
+            'consecutive_failures': self._failures,
+            **self.stats
+        }
+
+
+# كاتب السجلات المشترك بين أنظمة البرنامج
+audit_log_writer = AuditLogWriter()
+
+# تفريغ السجلات المعلقة عند إغلاق البرنامج
+atexit.register(audit_log_writer.close)
@@ -0,0 +1,171 @@
+"""
+سياسة الاحتفاظ بالنسخ الاحتياطية لبرنامج البدر للإنارة
+جد-أب-ابن (ساعي/يومي/أسبوعي/شهري) مع حد أقصى لمساحة التخزين، وتراعي سلاسل النسخ
+التزايدية فلا تُحذف نسخة أساسية ما دامت فروقات محتفظ بها تعتمد عليها
+"""
+
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Set
+import logging
+
+# إعداد نظام السجلات
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# أنواع النسخ حسب بادئة اسم الملف
+BACKUP_SERIES = [
+    ("full_backup_", "full"),
+    ("backup_db_", "db"),
+    ("backup_json_", "json"),
+    ("backup_excel_", "excel"),
+    ("backup_csv_", "csv")
+]
+
+# ملفات سلسلة النسخ التزايدية (تشترك ملفات النسخة الواحدة في طابعها الزمني)
+INCREMENTAL_PREFIXES = ("manifest_", "base_", "delta_")
+
+
+class RetentionPolicy:
+    """عدد النسخ المحتفظ بها في كل مستوى والحد الأقصى للمساحة"""
+    
+    # (اسم المستوى، مفتاح الفترة الزمنية)
+    LEVELS = [
+        ('hourly', lambda t: (t.year, t.month, t.day, t.hour)),
+        ('daily', lambda t: (t.year, t.month, t.day)),
+        ('weekly', lambda t: tuple(t.isocalendar())[:2]),
+        ('monthly', lambda t: (t.year, t.month))
+    ]
+    
+    def __init__(self, hourly: int = 24, daily: int = 7, weekly: int = 4, monthly: int = 12,
+                 max_bytes: Optional[int] = None):
+        """
+        Args:
+            hourly: عدد الساعات الأخيرة (التي فيها نسخ) المحتفظ بآخر نسخة من كل منها
+            daily: عدد الأيام
+            weekly: عدد الأسابيع
+            monthly: عدد الأشهر
+            max_bytes: الحد الأقصى لمجموع أحجام النسخ المحتفظ بها (None بلا حد)
+        """
+        self.hourly = hourly
+        self.daily = daily
+        self.weekly = weekly
+        self.monthly = monthly
+        self.max_bytes = max_bytes
+    
+    def select(self, points: List[Dict]) -> Set[str]:
+        """
+        اختيار النسخ المحتفظ بها من سلسلة واحدة: أحدث نسخة في كل فترة من آخر N فترات
+        
+        Args:
+            points: [{'id', 'time'}]
+        
+        Returns:
+            معرفات النسخ المحتفظ بها (أحدث نسخة دائماً منها)
+        """
+        ordered = sorted(points, key=lambda point: point['time'], reverse=True)
+        keep = {ordered[0]['id']} if ordered else set()
+        
+        for level, period_key in self.LEVELS:
+            count = getattr(self, level)
+            periods = set()
+            
+            for point in ordered:
+                period = period_key(point['time'])
+                if period in periods:
+                    continue
+                if len(periods) >= count:
+                    break
+                
+                periods.add(period)
+                keep.add(point['id'])
+        
+        return keep
+
+
+def _with_dependencies(ids: Iterable[str], points_by_id: Dict[str, Dict]) -> Set[str]:
+    """إضافة النسخ التي تعتمد عليها النسخ المختارة (الأساسية والفروقات السابقة)"""
+    result = set()
+    stack = list(ids)
+    
+    while stack:
+        point_id = stack.pop()
+        if point_id in result or point_id not in points_by_id:
+            continue
+        result.add(point_id)
+        stack.extend(points_by_id[point_id].get('depends', []))
+    
+    return result
+
+
+def _files_of(ids: Iterable[str], points_by_id: Dict[str, Dict]) -> Dict[str, int]:
+    files = {}
+    for point_id in ids:
+        files.update(points_by_id[point_id]['files'])
+    return files
+
+
+def plan_retention(points: List[Dict], policy: RetentionPolicy) -> Dict:
+    """
+    خطة الاحتفاظ والحذف
+    
+    تُطبق السياسة على كل سلسلة (نوع نسخة) وحدها، ثم تُضاف النسخ التي تعتمد عليها
+    النسخ المختارة. إذا تجاوز المجموع الحد الأقصى للمساحة تُستبعد أقدم النسخ
+    المختارة واحدة تلو الأخرى (مع ما لا يحتاجه غيرها) وتبقى أحدث نسخة دائماً.
+    
+    Args:
+        points: [{'id', 'series', 'time', 'files': {مسار أو معرف: الحجم}, 'depends': [معرفات]}]
+        policy: سياسة الاحتفاظ
+    
+    Returns:
+        {'keep', 'delete', 'delete_files', 'kept_bytes', 'freed_bytes', 'over_budget'}
+    """
+    points_by_id = {point['id']: point for point in points}
+    
+    series: Dict[str, List[Dict]] = {}
+    for point in points:
+        series.setdefault(point['series'], []).append(point)
+    
+    selected = set()
+    for series_points in series.values():
+        selected |= policy.select(series_points)
+    
+    keep = _with_dependencies(selected, points_by_id)
+    kept_bytes = sum(_files_of(keep, points_by_id).values())
+    
+    if policy.max_bytes is not None and kept_bytes > policy.max_bytes:
+        newest = max(points, key=lambda point: point['time'])['id']
+        
+        for point in sorted((points_by_id[point_id] for point_id in selected), key=lambda point: point['time']):
+            if kept_bytes <= policy.max_bytes:
+                break
+            if point['id'] == newest:
+                continue
+            
+            selected.discard(point['id'])
+            keep = _with_dependencies(selected, points_by_id)
+            kept_bytes = sum(_files_of(keep, points_by_id).values())
+    
+    kept_files = _files_of(keep, points_by_id)
+    delete = [point['id'] for point in points if point['id'] not in keep]
+    delete_files = {
+        name: size for name, size in _files_of(delete, points_by_id).items() if name not in kept_files
+    }
+    
+    return {
+        'keep': sorted(keep),
+        'delete': sorted(delete),
+        'delete_files': sorted(delete_files),
+        'kept_bytes': kept_bytes,
+        'freed_bytes': sum(delete_files.values()),
+        'over_budget': policy.max_bytes is not None and kept_bytes > policy.max_bytes
+    }
+
+
+def parse_backup_time(value: str) -> Optional[datetime]:
+    """قراءة الطابع الزمني من اسم ملف النسخة (YYYYmmdd_HHMMSS مع ميكروثانية اختيارياً)"""
+    for fmt, length in (("%Y%m%d_%H%M%S_%f", 22), ("%Y%m%d_%H%M%S", 15)):
+        try:
+            return datetime.strptime(value[:length], fmt)
+        except ValueError:
+            continue
+    return None
@@ -0,0 +1,537 @@
+"""
+مجدول النسخ الاحتياطي التلقائي لبرنامج البدر للإنارة
+يشغّل النسخ حسب تعبيرات cron داخل البرنامج بأولوية منخفضة ومعدل قراءة محدود
+حتى لا تتأثر سرعة البيع أثناء ساعات العمل
+"""
+
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional
+import logging
+
+# إعداد نظام السجلات
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class CronExpression:
+    """
+    تعبير cron من خمسة حقول: الدقيقة الساعة اليوم الشهر يوم-الأسبوع
+    
+    يدعم * و */n و a-b و a-b/n والقوائم المفصولة بفواصل، ويوم الأسبوع 0 أو 7 للأحد.
+    """
+    
+    FIELD_RANGES = [(0, 59), (0, 23), (1, 31), (1, 12), (0, 7)]
+    
+    ALIASES = {
+        '@hourly': '0 * * * *',
+        '@daily': '0 0 * * *',
+        '@weekly': '0 0 * * 0',
+        '@monthly': '0 0 1 * *'
+    }
+    
+    def __init__(self, expression: str):
+        self.expression = expression
+        fields = self.ALIASES.get(expression.strip(), expression).split()
+        
+        if len(fields) != 5:
+            raise ValueError(f"تعبير cron غير صالح: {expression}")
+        
+        self.minutes, self.hours, self.days, self.months, weekdays = (
+            self._parse_field(field, low, high) for field, (low, high) in zip(fields, self.FIELD_RANGES)
+        )
+        self.weekdays = {day % 7 for day in weekdays}
+        
+        # إذا حُدد اليوم ويوم الأسبوع معاً يكفي تطابق أحدهما كما في cron
+        self._any_day = fields[2] == '*'
+        self._any_weekday = fields[4] == '*'
+    
+    @staticmethod
+    def _parse_field(field: str, low: int, high: int) -> set:
+        values = set()
+        
+        for part in field.split(','):
+            part_range, _, step = part.partition('/')
+            step = int(step) if step else 1
+            
+            if part_range == '*':
+                start, end = low, high
+            elif '-' in part_range:
+                start, end = (int(value) for value in part_range.split('-', 1))
+            else:
+                start = int(part_range)
+                end = high if step > 1 else start
+            
+            if start < low or end > high or start > end or step < 1:
+                raise ValueError(f"حقل cron خارج النطاق: {field}")
+            
+            values.update(range(start, end + 1, step))
+        
+        return values
+    
+    def _day_matches(self, dt: datetime) -> bool:
+        day_ok = dt.day in self.days
+        weekday_ok = (dt.weekday() + 1) % 7 in self.weekdays
+        
+        if self._any_day and self._any_weekday:
+            return True
+        if self._any_day:
+            return weekday_ok
+        if self._any_weekday:
+            return day_ok
+        return day_ok or weekday_ok
+    
+    def matches(self, dt: datetime) -> bool:
+        """هل يطابق التعبير هذه الدقيقة"""
+        return (dt.minute in self.minutes and dt.hour in self.hours
+                and dt.month in self.months and self._day_matches(dt))
+    
+    def next_after(self, dt: datetime) -> datetime:
+        """
+        أول موعد بعد الوقت المحدد (بدقة الدقيقة)
+        
+        يتخطى الأشهر والأيام والساعات غير المطابقة دفعة واحدة بدلاً من المرور بكل دقيقة.
+        """
+        candidate = dt.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = candidate + timedelta(days=366 * 5)
+        
+        while candidate < limit:
+            if candidate.month not in self.months:
+                year = candidate.year + (candidate.month == 12)
+                candidate = candidate.replace(year=year, month=candidate.month % 12 + 1, day=1, hour=0, minute=0)
+            elif not self._day_matches(candidate):
+                candidate = (candidate + timedelta(days=1)).replace(hour=0, minute=0)
+            elif candidate.hour not in self.hours:
+                candidate = (candidate + timedelta(hours=1)).replace(minute=0)
+            elif candidate.minute not in self.minutes:
+                candidate += timedelta(minutes=1)
+            else:
+                return candidate
+        
+        raise ValueError(f"لا يوجد موعد قادم لتعبير cron: {self.expression}")
+
+
+class IntervalSchedule:
+    """مواعيد بفترة ثابتة بالساعات من آخر تشغيل (بديل cron للفترات التي لا تقسم اليوم)"""
+    
+    def __init__(self, hours: float):
+        if hours <= 0:
+            raise ValueError(f"الفترة بين النسخ يجب أن تكون أكبر من صفر: {hours}")
+        self.hours = hours
+        self.expression = None
+    
+    def next_after(self, dt: datetime) -> datetime:
+        """الموعد التالي بعد الوقت المحدد بفترة كاملة"""
+        return dt + timedelta(hours=self.hours)
+
+
+class IOThrottle:
+    """تحديد معدل القراءة بالبايت في الثانية بالانتظار بين الدفعات"""
+    
+    def __init__(self, bytes_per_second: float):
+        self.bytes_per_second = bytes_per_second
+        self.reset()
+    
+    def reset(self):
+        """بدء قياس جديد (يُستدعى مع كل نسخة)"""
+        self._started = time.monotonic()
+        self.bytes = 0
+        self.waited = 0.0
+    
+    def record(self, nbytes: int):
+        """تسجيل قراءة دون انتظار"""
+        self.bytes += nbytes
+    
+    def throttle(self, nbytes: int):
+        """تسجيل قراءة والانتظار إذا تجاوز المعدل الحد المسموح"""
+        self.record(nbytes)
+        
+        if not self.bytes_per_second:
+            return
+        
+        delay = self.bytes / self.bytes_per_second - (time.monotonic() - self._started)
+        if delay > 0:
+            time.sleep(delay)
+            self.waited += delay
+
+
+class ActivityGate:
+    """
+    تتبع العمليات النشطة (مثل إتمام البيع) لتتوقف المهام الخلفية أثناءها
+    
+    يُستخدم كمزخرف للدوال أو عبر active() كمدير سياق.
+    """
+    
+    def __init__(self):
+        self._active = 0
+        self._last_finished = 0.0
+        self._condition = threading.Condition()
+    
+    @contextmanager
+    def active(self):
+        with self._condition:
+            self._active += 1
+        
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._active -= 1
+                self._last_finished = time.monotonic()
+                self._condition.notify_all()
+    
+    def track(self, func: Callable) -> Callable:
+        """مزخرف يعلّم الدالة كعملية نشطة طوال تنفيذها"""
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with self.active():
+                return func(*args, **kwargs)
+        
+        return wrapper
+    
+    @property
+    def busy(self) -> bool:
+        with self._condition:
+            return self._active > 0
+    
+    def wait_idle(self, quiet_seconds: float = 0.2, max_wait: float = 5.0) -> float:
+        """
+        الانتظار حتى لا توجد عمليات نشطة منذ مدة قصيرة
+        
+        Args:
+            quiet_seconds: مدة الهدوء المطلوبة بعد آخر عملية
+            max_wait: أقصى انتظار حتى لا تتوقف المهمة الخلفية بلا نهاية في أوقات الذروة
+        
+        Returns:
+            مدة الانتظار بالثواني
+        """
+        started = time.monotonic()
+        deadline = started + max_wait
+        
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                if now >= deadline:
+                    break
+                
+                if self._active:
+                    self._condition.wait(deadline - now)
+                    continue
+                
+                quiet_left = self._last_finished + quiet_seconds - now
+                if quiet_left <= 0:
+                    break
+                self._condition.wait(min(quiet_left, deadline - now))
+        
+        return time.monotonic() - started
+
+
+# عمليات البيع الجارية، تتوقف النسخ الاحتياطية المجدولة أثناءها
+checkout_activity = ActivityGate()
+
+
+class BackupScheduler:
+    """
+    مجدول النسخ الاحتياطي داخل البرنامج
+    
+    - مواعيد بتعبيرات cron أو بفترة ثابتة بالساعات لكل مهمة
+    - تعويض المواعيد الفائتة أثناء إغلاق البرنامج بنسخة واحدة عند التشغيل
+    - نسخة واحدة فقط في كل وقت حتى بين أكثر من نسخة من البرنامج (ملف قفل)
+    - أولوية منخفضة للخيط ومعدل قراءة محدود مع التوقف أثناء عمليات البيع
+    """
+    
+    # نسخة بهذا العمر تُعد متوقفة ويُتجاوز قفلها
+    STALE_LOCK_SECONDS = 6 * 3600
+    
+    def __init__(self, backup_system, read_bytes_per_second: float = 8 * 1024 * 1024,
+                 activity_gate: Optional[ActivityGate] = checkout_activity, low_priority: bool = True,
+                 on_backup_created: Optional[Callable[[str, str], None]] = None):
+        """
+        تهيئة المجدول
+        
+        Args:
+            backup_system: نظام النسخ الاحتياطي المحلي
+            read_bytes_per_second: أقصى معدل قراءة من قاعدة البيانات (0 بلا حد)
+            activity_gate: العمليات التي تتوقف النسخ أثناءها
+            low_priority: تشغيل النسخ بأولوية منخفضة
+            on_backup_created: دالة تُستدعى بمسار النسخة ونوعها بعد نجاحها (مثل الرفع)
+        """
+        self.backup_system = backup_system
+        self.io_throttle = IOThrottle(read_bytes_per_second)
+        self.activity_gate = activity_gate
+        self.low_priority = low_priority
+        self.on_backup_created = on_backup_created
+        
+        self.state_path = os.path.join(backup_system.backup_dir, "scheduler_state.json")
+        self.lock_path = os.path.join(backup_system.backup_dir, ".backup.lock")
+        
+        self._jobs: Dict[str, Dict] = {}
+        self._state = self._load_state()
+        self._state_lock = threading.Lock()
+        self._run_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._wakeup = threading.Event()
+        self._thread = None
+    
+    def _load_state(self) -> Dict:
+        if not os.path.exists(self.state_path):
+            return {}
+        
+        try:
+            with open(self.state_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            logger.error(f"خطأ في قراءة حالة مجدول النسخ: {str(e)}")
+            return {}
+    
+    def _save_state(self):
+        temp_path = self.state_path + ".tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(self._state, f, ensure_ascii=False, indent=2)
+        os.replace(temp_path, self.state_path)
+    
+    def add_job(self, name: str, cron: Optional[str] = None, backup_type: str = "full",
+                catch_up: bool = True, interval_hours: Optional[float] = None):
+        """
+        إضافة مهمة نسخ احتياطي
+        
+        Args:
+            name: اسم المهمة (مفتاح حالتها المحفوظة)
+            cron: تعبير cron للمواعيد
+            backup_type: نوع النسخة (json, excel, csv, db, full, incremental)
+            catch_up: تعويض الموعد الفائت بنسخة واحدة عند التشغيل
+            interval_hours: فترة ثابتة بالساعات بين النسخ بدلاً من cron
+        """
+        if (cron is None) == (interval_hours is None):
+            raise ValueError("يجب تحديد تعبير cron أو فترة بالساعات (أحدهما فقط)")
+        
+        self._jobs[name] = {
+            'schedule': CronExpression(cron) if cron is not None else IntervalSchedule(interval_hours),
+            'backup_type': backup_type,
+            'catch_up': catch_up,
+            'next_run': None
+        }
+        self._wakeup.set()
+    
+    def _schedule_next(self, name: str, now: datetime):
+        """حساب الموعد القادم للمهمة، مع موعد فائت واحد على الأكثر"""
+        job = self._jobs[name]
+        last_scheduled = self._state.get(name, {}).get('last_scheduled')
+        
+        if last_scheduled is None:
+            # أول تشغيل للمهمة: لا يوجد ما يُعوَّض
+            job['next_run'] = job['schedule'].next_after(now)
+            return
+        
+        due = job['schedule'].next_after(datetime.fromisoformat(last_scheduled))
+        if due <= now and not job['catch_up']:
+            due = job['schedule'].next_after(now)
+        
+        job['next_run'] = due
+    
+    def start(self):
+        """تشغيل خيط المجدول"""
+        if self._thread and self._thread.is_alive():
+            return
+        
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="backup-scheduler", daemon=True)
+        self._thread.start()
+    
+    def stop(self, timeout: float = 10):
+        """إيقاف خيط المجدول (النسخة الجارية تكتمل)"""
+        self._stop.set()
+        self._wakeup.set()
+        
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+    
+    def _run(self):
+        if self.low_priority:
+            self._lower_thread_priority()
+        
+        while not self._stop.is_set():
+            now = datetime.now()
+            
+            for name, job in list(self._jobs.items()):
+                if job['next_run'] is None:
+                    self._schedule_next(name, now)
+                
+                if job['next_run'] <= now:
+                    self._run_job(name)
+                    self._schedule_next(name, datetime.now())
+            
+            next_runs = [job['next_run'] for job in self._jobs.values() if job['next_run']]
+            timeout = 60.0
+            if next_runs:
+                timeout = min(timeout, max((min(next_runs) - datetime.now()).total_seconds(), 0.1))
+            
+            self._wakeup.wait(timeout)
+            self._wakeup.clear()
+    
+    @staticmethod
+    def _lower_thread_priority():
+        """خفض أولوية خيط النسخ على أنظمة Linux"""
+        try:
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), 10)
+        except (AttributeError, OSError):
+            pass
+    
+    def _acquire_file_lock(self) -> bool:
+        """قفل على مستوى الملفات حتى لا تتداخل نسختان من البرنامج"""
+        for _ in range(2):
+            try:
+                fd = os.open(self.lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                with os.fdopen(fd, 'w') as f:
+                    f.write(f"{os.getpid()} {datetime.now().isoformat()}")
+                return True
+            except FileExistsError:
+                try:
+                    if time.time() - os.path.getmtime(self.lock_path) < self.STALE_LOCK_SECONDS:
+                        return False
+                    logger.warning(f"تجاوز قفل نسخ احتياطي قديم: {self.lock_path}")
+                    os.remove(self.lock_path)
+                except FileNotFoundError:
+                    pass
+        
+        return False
+    
+    def run_now(self, backup_type: str = "full", job_name: str = "manual") -> Optional[str]:
+        """
+        تشغيل نسخة فوراً إذا لم تكن هناك نسخة جارية
+        
+        Returns:
+            مسار النسخة أو None إذا كانت هناك نسخة جارية أو فشلت النسخة
+        """
+        if not self._run_lock.acquire(blocking=False):
+            logger.info("توجد نسخة احتياطية جارية، تم تخطي الطلب")
+            return None
+        
+        try:
+            if not self._acquire_file_lock():
+                logger.info("توجد نسخة احتياطية جارية من برنامج آخر، تم تخطي الطلب")
+                return None
+            
+            try:
+                return self._create_backup(job_name, backup_type)
+            finally:
+                os.remove(self.lock_path)
+        finally:
+            self._run_lock.release()
+    
+    def _run_job(self, name: str):
+        job = self._jobs[name]
+        self.run_now(job['backup_type'], name)
+        
+        with self._state_lock:
+            # يُسجل الموعد حتى عند الفشل حتى لا تتكرر المحاولة في كل دورة
+            self._state.setdefault(name, {})['last_scheduled'] = datetime.now().isoformat()
+            self._save_state()
+    
+    def _create_backup(self, name: str, backup_type: str) -> Optional[str]:
+        backup_methods = {
+            'json': self.backup_system.backup_database_to_json,
+            'excel': self.backup_system.backup_database_to_excel,
+            'csv': self.backup_system.backup_database_to_csv,
+            'db': self.backup_system.backup_database_file,
+            'incremental': self.backup_system.create_incremental_backup,
+            'full': self.backup_system.create_full_backup
+        }
+        
+        self.io_throttle.reset()
+        self.backup_system.io_throttle = self.io_throttle
+        self.backup_system.activity_gate = self.activity_gate
+        
+        started_at = datetime.now()
+        started = time.monotonic()
+        backup_path = None
+        error = None
+        
+        try:
+            backup_path = backup_methods[backup_type]()
+            self.backup_system.cleanup_old_backups()
+        except Exception as e:
+            error = str(e)
+            logger.error(f"خطأ في النسخ الاحتياطي المجدول ({name}): {error}")
+        finally:
+            self.backup_system.io_throttle = None
+            self.backup_system.activity_gate = None
+        
+        duration = time.monotonic() - started
+        
+        with self._state_lock:
+            state = self._state.setdefault(name, {})
+            state.update({
+                'backup_type': backup_type,
+                'last_run': started_at.isoformat(),
+                'last_duration': round(duration, 3),
+                'last_bytes_read': self.io_throttle.bytes,
+                'last_bytes_written': self._backup_size(backup_path),
+                'last_throttle_wait': round(self.io_throttle.waited, 3),
+                'last_status': 'failed' if error else 'success',
+                'last_error': error,
+                'runs': state.get('runs', 0) + 1,
+                'failures': state.get('failures', 0) + bool(error)
+            })
+            if not error:
+                state['last_backup'] = backup_path if isinstance(backup_path, str) else None
+            self._save_state()
+        
+        if error:
+            return None
+        
+        logger.info(f"تمت النسخة الاحتياطية المجدولة ({name}) خلال {duration:.1f} ثانية")
+        
+        if self.on_backup_created and isinstance(backup_path, str):
+            try:
+                self.on_backup_created(backup_path, backup_type)
+            except Exception as e:
+                logger.error(f"خطأ في معالجة النسخة الاحتياطية بعد إنشائها: {str(e)}")
+        
+        return backup_path
+    
+    @staticmethod
+    def _backup_size(backup_path) -> int:
+        """حجم ملفات النسخة (CSV ينتج قائمة ملفات، والتزايدية بياناً وملف فروقات)"""
+        if not backup_path:
+            return 0
+        
+        paths: List[str] = list(backup_path) if isinstance(backup_path, list) else [backup_path]
+        
+        if isinstance(backup_path, str) and backup_path.endswith(".json") and "incremental" in backup_path:
+            with open(backup_path, 'r', encoding='utf-8') as f:
+                data_file = json.load(f).get('file')
+            if data_file:
+                paths.append(os.path.join(os.path.dirname(backup_path), data_file))
+        
+        return sum(os.path.getsize(path) for path in paths if os.path.exists(path))
+    
+    def get_metrics(self) -> Dict:
+        """مواعيد المهام وإحصائيات آخر تشغيل لكل منها"""
+        with self._state_lock:
+            state = json.loads(json.dumps(self._state))
+        
+        jobs = {}
+        for name, job in self._jobs.items():
+            jobs[name] = {
+                'cron': job['schedule'].expression,
+                'interval_hours': job['schedule'].hours if isinstance(job['schedule'], IntervalSchedule) else None,
+                'backup_type': job['backup_type'],
+                'next_run': job['next_run'].isoformat() if job['next_run'] else None,
+                **state.pop(name, {})
+            }
+        
+        return {
+            'running': bool(self._thread and self._thread.is_alive()),
+            'backup_in_progress': self._run_lock.locked(),
+            'read_bytes_per_second': self.io_throttle.bytes_per_second,
+            'jobs': jobs,
+            # مهام غير مجدولة حالياً (مثل التشغيل اليدوي)
+            'other': state
+        }
@@ -4,20 +4,45 @@
 """
 
 import os
+import io
+import csv
 import json
+import gzip
+import base64
 import sqlite3
+import hashlib
+import zlib
+import itertools
+import queue
+import tempfile
+import threading
 import pandas as pd
+from openpyxl import Workbook
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import shutil
 import zipfile
 from typing import Dict, List, Optional
 import logging
+from contextlib import contextmanager
+
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    ZSTD_AVAILABLE = False
 
 # إعداد نظام السجلات
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 class BackupSystem:
+    # عدد الصفوف (حسب rowid) في كل جزء يُقارن في النسخ التزايدي
+    INCREMENTAL_CHUNK_ROWS = 1000
+    
+    # اسم العمود الذي يحفظ rowid الأصلي داخل ملفات الفروقات
+    ROWID_COLUMN = "__backup_rowid"
+    
     def __init__(self, db_path: str, backup_dir: str = "backups"):
         """
         تهيئة نظام النسخ الاحتياطي
@@ -28,6 +53,14 @@ class BackupSystem:
         """
         self.db_path = db_path
         self.backup_dir = backup_dir
+        
+        # يضبطهما مجدول النسخ أثناء النسخ المجدولة (انظر backup_scheduler)
+        self.io_throttle = None
+        self.activity_gate = None
+        
+        # سياسة الاحتفاظ (None للسياسة الافتراضية في backup_retention)
+        self.retention_policy = None
+        
         self.ensure_backup_directory()
         
     def ensure_backup_directory(self):
@@ -40,54 +73,173 @@ class BackupSystem:
         """الحصول على طابع زمني للنسخة الاحتياطية"""
         return datetime.now().strftime("%Y%m%d_%H%M%S")
     
-    def backup_database_to_json(self) -> str:
+    def _open_backup_file(self, path: str, mode: str, compression: Optional[str] = "auto"):
+        """
+        فتح ملف نسخة احتياطية نصي مع الضغط المناسب
+        
+        Args:
+            path: مسار الملف
+            mode: 'r' للقراءة أو 'w' للكتابة
+            compression: gzip أو zstd أو None، و auto للتحديد حسب الامتداد
+        """
+        if compression == "auto":
+            compression = {'.gz': 'gzip', '.zst': 'zstd'}.get(os.path.splitext(path)[1])
+        
+        if compression == "gzip":
+            return gzip.open(path, mode + 't', encoding='utf-8', compresslevel=6)
+        
+        if compression == "zstd":
+            if not ZSTD_AVAILABLE:
+                raise ImportError("مكتبة zstandard غير متوفرة. يرجى تثبيتها باستخدام: pip install zstandard")
+            
+            raw = open(path, mode + 'b')
+            if mode == 'w':
+                stream = zstandard.ZstdCompressor().stream_writer(raw)
+            else:
+                stream = zstandard.ZstdDecompressor().stream_reader(raw)
+            return io.TextIOWrapper(stream, encoding='utf-8')
+        
+        return open(path, mode, encoding='utf-8')
+    
+    @staticmethod
+    def _json_default(value):
+        """ترميز القيم الثنائية (BLOB) بصيغة base64 داخل JSON"""
+        if isinstance(value, (bytes, memoryview)):
+            return {'$base64': base64.b64encode(value).decode('ascii')}
+        raise TypeError(f"قيمة غير قابلة للتحويل إلى JSON: {type(value).__name__}")
+    
+    @staticmethod
+    def _decode_json_value(value):
+        """استرجاع القيم الثنائية المرمزة بـ base64"""
+        if isinstance(value, dict) and '$base64' in value:
+            return base64.b64decode(value['$base64'])
+        return value
+    
+    @contextmanager
+    def _source_database(self):
+        """
+        مسار قاعدة البيانات التي تُقرأ منها نسخ JSON و Excel و CSV
+        
+        في النسخ المجدولة (io_throttle أو activity_gate مضبوطان) تُؤخذ أولاً لقطة
+        بمعدل قراءة محدود تتوقف أثناء عمليات البيع، ثم تُقرأ الصيغة من اللقطة بدلاً
+        من قراءة قاعدة البيانات الحية بأقصى سرعة. الاستدعاء المباشر يقرأ قاعدة
+        البيانات نفسها.
+        
+        Yields:
+            مسار قاعدة البيانات أو اللقطة
+        """
+        if not (self.io_throttle or self.activity_gate):
+            yield self.db_path
+            return
+        
+        snapshot_path = os.path.join(self.backup_dir, f"snapshot_{self.get_timestamp()}_{threading.get_ident()}.tmp")
+        try:
+            self.snapshot_database(snapshot_path)
+            yield snapshot_path
+        finally:
+            if os.path.exists(snapshot_path):
+                os.remove(snapshot_path)
+    
+    def _get_table_names(self, cursor) -> List[str]:
+        """أسماء جداول المستخدم بدون جداول النظام"""
+        cursor.execute(r"SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite\_%' ESCAPE '\'")
+        return [row[0] for row in cursor.fetchall()]
+    
+    def _iter_table_rows(self, cursor, table_name: str, batch_size: int = 1000):
+        """قراءة صفوف الجدول على دفعات بدلاً من تحميله كاملاً في الذاكرة"""
+        cursor.execute(f'SELECT * FROM "{table_name}"')
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield from rows
+    
+    def _write_json_stream(self, f, tables, json_lines: bool = False):
+        """
+        كتابة الجداول بصيغة JSON أو JSON Lines إلى ملف مفتوح
+        
+        Args:
+            f: ملف نصي مفتوح للكتابة
+            tables: مولد (اسم الجدول، وصف الأعمدة من PRAGMA table_info، الصفوف)
+            json_lines: الكتابة بصيغة JSON Lines
+        """
+        if not json_lines:
+            f.write("{")
+        
+        for table_index, (table_name, table_info, rows) in enumerate(tables):
+            columns = [column[1] for column in table_info]
+            
+            if json_lines:
+                f.write(json.dumps({
+                    'table': table_name,
+                    'columns': columns,
+                    'types': [column[2] for column in table_info]
+                }, ensure_ascii=False) + "\n")
+            else:
+                separator = "," if table_index else ""
+                f.write(f"{separator}\n{json.dumps(table_name, ensure_ascii=False)}: [")
+            
+            for row_index, row in enumerate(rows):
+                if json_lines:
+                    f.write(json.dumps(row, ensure_ascii=False, default=self._json_default) + "\n")
+                else:
+                    separator = "," if row_index else ""
+                    f.write(separator + "\n  " + json.dumps(
+                        dict(zip(columns, row)), ensure_ascii=False, default=self._json_default
+                    ))
+            
+            if not json_lines:
+                f.write("\n]")
+        
+        if not json_lines:
+            f.write("\n}\n")
+    
+    def backup_database_to_json(self, compression: Optional[str] = "gzip", json_lines: bool = False,
+                                batch_size: int = 1000) -> str:
         """
         نسخ احتياطي لقاعدة البيانات بصيغة JSON
         
+        تُقرأ الصفوف على دفعات وتُكتب مباشرة إلى الملف المضغوط، فيبقى استهلاك
+        الذاكرة ثابتاً مهما كبر حجم قاعدة البيانات. القيم الثنائية تُرمز بـ base64.
+        
+        - JSON: نفس بنية {الجدول: [صفوف]} السابقة
+        - JSON Lines: سطر وصف لكل جدول (الأعمدة وأنواعها) ثم سطر لكل صف كمصفوفة
+        
+        Args:
+            compression: gzip أو zstd أو None بدون ضغط
+            json_lines: الكتابة بصيغة JSON Lines
+            batch_size: عدد الصفوف المقروءة في كل دفعة
+        
         Returns:
             مسار ملف النسخة الاحتياطية
         """
         try:
             timestamp = self.get_timestamp()
-            backup_filename = f"backup_json_{timestamp}.json"
+            extension = ".jsonl" if json_lines else ".json"
+            extension += {'gzip': '.gz', 'zstd': '.zst'}.get(compression, '')
+            backup_filename = f"backup_json_{timestamp}{extension}"
             backup_path = os.path.join(self.backup_dir, backup_filename)
             
-            # الاتصال بقاعدة البيانات
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            # الحصول على أسماء الجداول
-            cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
-            tables = cursor.fetchall()
-            
-            backup_data = {}
-            
-            for table in tables:
-                table_name = table[0]
-                if table_name != 'sqlite_sequence':  # تجاهل جداول النظام
-                    # الحصول على بيانات الجدول
-                    cursor.execute(f"SELECT * FROM {table_name}")
-                    rows = cursor.fetchall()
-                    
-                    # الحصول على أسماء الأعمدة
-                    cursor.execute(f"PRAGMA table_info({table_name})")
-                    columns = [column[1] for column in cursor.fetchall()]
-                    
-                    # تحويل البيانات إلى قائمة من القواميس
-                    table_data = []
-                    for row in rows:
-                        row_dict = {}
-                        for i, value in enumerate(row):
-                            row_dict[columns[i]] = value
-                        table_data.append(row_dict)
-                    
-                    backup_data[table_name] = table_data
-            
-            conn.close()
-            
-            # حفظ البيانات في ملف JSON
-            with open(backup_path, 'w', encoding='utf-8') as f:
-                json.dump(backup_data, f, ensure_ascii=False, indent=2)
+            with self._source_database() as source_path:
+                # الاتصال بقاعدة البيانات
+                conn = sqlite3.connect(source_path)
+                cursor = conn.cursor()
+                
+                # الحصول على أسماء الجداول
+                tables = self._get_table_names(cursor)
+                
+                def read_tables():
+                    for table_name in tables:
+                        # الحصول على أسماء الأعمدة وأنواعها
+                        cursor.execute(f'PRAGMA table_info("{table_name}")')
+                        table_info = cursor.fetchall()
+                        yield table_name, table_info, self._iter_table_rows(cursor, table_name, batch_size)
+                
+                try:
+                    with self._open_backup_file(backup_path, 'w', compression) as f:
+                        self._write_json_stream(f, read_tables(), json_lines)
+                finally:
+                    conn.close()
             
             logger.info(f"تم إنشاء نسخة احتياطية JSON: {backup_path}")
             return backup_path
@@ -96,6 +248,37 @@ class BackupSystem:
             logger.error(f"خطأ في إنشاء النسخة الاحتياطية JSON: {str(e)}")
             raise
     
+    def iter_json_lines_backup(self, backup_path: str):
+        """
+        قراءة نسخة JSON Lines جدولاً جدولاً دون تحميلها كاملة
+        
+        Yields:
+            (اسم الجدول، الأعمدة، مولد الصفوف)
+        """
+        with self._open_backup_file(backup_path, 'r') as f:
+            pending_header = None
+            
+            def table_rows():
+                nonlocal pending_header
+                for line in f:
+                    record = json.loads(line)
+                    if isinstance(record, dict):
+                        pending_header = record
+                        return
+                    yield tuple(self._decode_json_value(value) for value in record)
+            
+            line = f.readline()
+            pending_header = json.loads(line) if line.strip() else None
+            
+            while pending_header is not None:
+                header, pending_header = pending_header, None
+                rows = table_rows()
+                yield header['table'], header['columns'], rows
+                
+                # استهلاك ما تبقى من صفوف الجدول إذا لم يقرأها المستدعي
+                for _ in rows:
+                    pass
+    
     def backup_database_to_excel(self) -> str:
         """
         نسخ احتياطي لقاعدة البيانات بصيغة Excel
@@ -108,26 +291,28 @@ class BackupSystem:
             backup_filename = f"backup_excel_{timestamp}.xlsx"
             backup_path = os.path.join(self.backup_dir, backup_filename)
             
-            # الاتصال بقاعدة البيانات
-            conn = sqlite3.connect(self.db_path)
-            
-            # الحصول على أسماء الجداول
-            cursor = conn.cursor()
-            cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
-            tables = cursor.fetchall()
-            
-            # إنشاء ملف Excel مع أوراق متعددة
-            with pd.ExcelWriter(backup_path, engine='openpyxl') as writer:
-                for table in tables:
-                    table_name = table[0]
-                    if table_name != 'sqlite_sequence':  # تجاهل جداول النظام
-                        # قراءة بيانات الجدول
-                        df = pd.read_sql_query(f"SELECT * FROM {table_name}", conn)
-                        
-                        # كتابة البيانات في ورقة منفصلة
-                        df.to_excel(writer, sheet_name=table_name, index=False)
-            
-            conn.close()
+            with self._source_database() as source_path:
+                # الاتصال بقاعدة البيانات
+                conn = sqlite3.connect(source_path)
+                
+                # الحصول على أسماء الجداول
+                cursor = conn.cursor()
+                cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
+                tables = cursor.fetchall()
+                
+                try:
+                    # إنشاء ملف Excel مع أوراق متعددة
+                    with pd.ExcelWriter(backup_path, engine='openpyxl') as writer:
+                        for table in tables:
+                            table_name = table[0]
+                            if table_name != 'sqlite_sequence':  # تجاهل جداول النظام
+                                # قراءة بيانات الجدول
+                                df = pd.read_sql_query(f"SELECT * FROM {table_name}", conn)
+                                
+                                # كتابة البيانات في ورقة منفصلة
+                                df.to_excel(writer, sheet_name=table_name, index=False)
+                finally:
+                    conn.close()
             
             logger.info(f"تم إنشاء نسخة احتياطية Excel: {backup_path}")
             return backup_path
@@ -148,29 +333,31 @@ class BackupSystem:
             csv_dir = os.path.join(self.backup_dir, f"backup_csv_{timestamp}")
             os.makedirs(csv_dir, exist_ok=True)
             
-            # الاتصال بقاعدة البيانات
-            conn = sqlite3.connect(self.db_path)
-            
-            # الحصول على أسماء الجداول
-            cursor = conn.cursor()
-            cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
-            tables = cursor.fetchall()
-            
             backup_files = []
             
-            for table in tables:
-                table_name = table[0]
-                if table_name != 'sqlite_sequence':  # تجاهل جداول النظام
-                    # قراءة بيانات الجدول
-                    df = pd.read_sql_query(f"SELECT * FROM {table_name}", conn)
-                    
-                    # حفظ البيانات في ملف CSV
-                    csv_filename = f"{table_name}.csv"
-                    csv_path = os.path.join(csv_dir, csv_filename)
-                    df.to_csv(csv_path, index=False, encoding='utf-8-sig')
-                    backup_files.append(csv_path)
-            
-            conn.close()
+            with self._source_database() as source_path:
+                # الاتصال بقاعدة البيانات
+                conn = sqlite3.connect(source_path)
+                
+                # الحصول على أسماء الجداول
+                cursor = conn.cursor()
+                cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
+                tables = cursor.fetchall()
+                
+                try:
+                    for table in tables:
+                        table_name = table[0]
+                        if table_name != 'sqlite_sequence':  # تجاهل جداول النظام
+                            # قراءة بيانات الجدول
+                            df = pd.read_sql_query(f"SELECT * FROM {table_name}", conn)
+                            
+                            # حفظ البيانات في ملف CSV
+                            csv_filename = f"{table_name}.csv"
+                            csv_path = os.path.join(csv_dir, csv_filename)
+                            df.to_csv(csv_path, index=False, encoding='utf-8-sig')
+                            backup_files.append(csv_path)
+                finally:
+                    conn.close()
             
             logger.info(f"تم إنشاء نسخ احتياطية CSV في: {csv_dir}")
             return backup_files
@@ -191,8 +378,8 @@ class BackupSystem:
             backup_filename = f"backup_db_{timestamp}.sqlite"
             backup_path = os.path.join(self.backup_dir, backup_filename)
             
-            # نسخ ملف قاعدة البيانات
-            shutil.copy2(self.db_path, backup_path)
+            # لقطة متسقة بدلاً من نسخ الملف أثناء الكتابة عليه
+            self.snapshot_database(backup_path)
             
             logger.info(f"تم إنشاء نسخة احتياطية لقاعدة البيانات: {backup_path}")
             return backup_path
@@ -201,50 +388,378 @@ class BackupSystem:
             logger.error(f"خطأ في نسخ ملف قاعدة البيانات: {str(e)}")
             raise
     
+    # ------------------------------------------------------------------
+    # النسخة الشاملة: قراءة واحدة وتوزيع الصفوف على كاتبي الصيغ
+    # ------------------------------------------------------------------
+    
+    # نهاية تدفق الصفوف في طوابير الكاتبين
+    _END_OF_STREAM = object()
+    
+    @staticmethod
+    def _to_text_value(value):
+        """القيم الثنائية تُكتب في CSV و Excel كنص base64"""
+        if isinstance(value, (bytes, memoryview)):
+            return base64.b64encode(value).decode('ascii')
+        return value
+    
+    def _read_tables_once(self, snapshot_path: str, queues: List[queue.Queue], failed: threading.Event,
+                          batch_size: int = 1000):
+        """
+        قراءة كل جدول مرة واحدة من اللقطة وإرسال دفعات الصفوف إلى جميع الكاتبين
+        
+        الطوابير محدودة الحجم فيتوقف القارئ مؤقتاً إذا تأخر أحد الكاتبين.
+        """
+        def put(item):
+            for q in queues:
+                while True:
+                    try:
+                        q.put(item, timeout=0.5)
+                        break
+                    except queue.Full:
+                        if failed.is_set():
+                            raise RuntimeError("توقف أحد كاتبي النسخة الاحتياطية")
+        
+        conn = sqlite3.connect(snapshot_path)
+        cursor = conn.cursor()
+        
+        try:
+            for table_name in self._get_table_names(cursor):
+                cursor.execute(f'PRAGMA table_info("{table_name}")')
+                put(('table', table_name, cursor.fetchall()))
+                
+                cursor.execute(f'SELECT * FROM "{table_name}"')
+                while True:
+                    rows = cursor.fetchmany(batch_size)
+                    if not rows:
+                        break
+                    put(('rows', rows))
+        finally:
+            conn.close()
+            
+            # إنهاء الكاتبين حتى عند الفشل؛ طابور الكاتب المتوقف يُفرغ ليتسع لعلامة النهاية
+            for q in queues:
+                while True:
+                    try:
+                        q.put(self._END_OF_STREAM, timeout=0.5)
+                        break
+                    except queue.Full:
+                        if failed.is_set():
+                            while not q.empty():
+                                q.get_nowait()
+    
+    @classmethod
+    def _iter_queued_tables(cls, q: queue.Queue):
+        """
+        تحويل رسائل الطابور إلى مولد جداول
+        
+        Yields:
+            (اسم الجدول، وصف الأعمدة، مولد الصفوف)
+        """
+        pending = q.get()
+        
+        while pending is not cls._END_OF_STREAM:
+            _, table_name, table_info = pending
+            pending = None
+            
+            def rows():
+                nonlocal pending
+                while True:
+                    item = q.get()
+                    if item is cls._END_OF_STREAM or item[0] == 'table':
+                        pending = item
+                        return
+                    yield from item[1]
+            
+            table_rows = rows()
+            yield table_name, table_info, table_rows
+            
+            # استهلاك الصفوف التي لم يقرأها الكاتب
+            for _ in table_rows:
+                pass
+    
+    def _write_json_part(self, q: queue.Queue, spool) -> None:
+        """كاتب JSON: يكتب إلى ملف مؤقت في الذاكرة مضغوطاً بـ gzip"""
+        with gzip.GzipFile(fileobj=spool, mode='wb', compresslevel=6) as raw:
+            with io.TextIOWrapper(raw, encoding='utf-8') as f:
+                self._write_json_stream(f, self._iter_queued_tables(q))
+    
+    def _write_excel_part(self, q: queue.Queue, spool) -> None:
+        """كاتب Excel: ورقة لكل جدول بوضع الكتابة فقط لتقليل الذاكرة، يُحفظ في ملف مؤقت بالذاكرة"""
+        workbook = Workbook(write_only=True)
+        
+        for table_name, table_info, rows in self._iter_queued_tables(q):
+            sheet = workbook.create_sheet(title=table_name[:31])
+            sheet.append([column[1] for column in table_info])
+            for row in rows:
+                sheet.append([self._to_text_value(value) for value in row])
+        
+        workbook.save(spool)
+    
+    def _write_csv_part(self, q: queue.Queue, zipf: zipfile.ZipFile, zip_lock: threading.Lock) -> None:
+        """كاتب CSV: يكتب كل جدول مباشرة داخل الملف المضغوط"""
+        for table_name, table_info, rows in self._iter_queued_tables(q):
+            with zip_lock:
+                with zipf.open(f"csv/{table_name}.csv", 'w', force_zip64=True) as raw:
+                    with io.TextIOWrapper(raw, encoding='utf-8-sig', newline='') as f:
+                        writer = csv.writer(f)
+                        writer.writerow([column[1] for column in table_info])
+                        for row in rows:
+                            writer.writerow([self._to_text_value(value) for value in row])
+    
+    # ------------------------------------------------------------------
+    # بيان النسخة الشاملة والتحقق منها
+    # ------------------------------------------------------------------
+    
+    @property
+    def manifests_dir(self) -> str:
+        """مجلد نسخ بيانات النسخ الشاملة للمقارنة السريعة دون فتح الملف المضغوط"""
+        return os.path.join(self.backup_dir, "manifests")
+    
+    def _hash_tables_part(self, q: queue.Queue, tables: Dict[str, Dict]) -> None:
+        """حساب عدد الصفوف وبصمة SHA-256 لكل جدول من تدفق الصفوف"""
+        for table_name, _, rows in self._iter_queued_tables(q):
+            content_hash = hashlib.sha256()
+            row_count = 0
+            for row in rows:
+                content_hash.update(repr(row).encode('utf-8'))
+                row_count += 1
+            tables[table_name] = {'rows': row_count, 'hash': content_hash.hexdigest()}
+    
+    @staticmethod
+    def _file_sha256(path: str) -> str:
+        file_hash = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                file_hash.update(chunk)
+        return file_hash.hexdigest()
+    
+    def _build_manifest(self, snapshot_path: str, tables: Dict[str, Dict], integrity: str) -> Dict:
+        """
+        بناء بيان النسخة: عدد الصفوف وبصمة كل جدول وبصمة المخطط ونتيجة فحص السلامة
+        
+        content_hash لا يعتمد على الوقت، فيتطابق بين نسختين لم تتغير بياناتهما.
+        """
+        conn = sqlite3.connect(snapshot_path)
+        schema_rows = conn.execute(
+            "SELECT type, name, sql FROM sqlite_master WHERE sql IS NOT NULL ORDER BY type, name"
+        ).fetchall()
+        conn.close()
+        
+        schema_hash = hashlib.sha256(repr(schema_rows).encode('utf-8')).hexdigest()
+        content_hash = hashlib.sha256(json.dumps(
+            {'schema_hash': schema_hash, 'tables': tables}, sort_keys=True
+        ).encode('utf-8')).hexdigest()
+        
+        return {
+            'created_at': datetime.now().isoformat(),
+            'database': os.path.basename(snapshot_path),
+            'database_sha256': self._file_sha256(snapshot_path),
+            'schema_hash': schema_hash,
+            'integrity_check': integrity,
+            'tables': tables,
+            'content_hash': content_hash
+        }
+    
+    def get_backup_manifest(self, zip_path: str) -> Optional[Dict]:
+        """
+        قراءة بيان نسخة شاملة (من المجلد الجانبي أولاً ثم من داخل الملف المضغوط)
+        
+        Returns:
+            البيان أو None للنسخ القديمة التي لا تحتوي على بيان
+        """
+        sidecar_path = os.path.join(self.manifests_dir, os.path.splitext(os.path.basename(zip_path))[0] + ".json")
+        
+        if os.path.exists(sidecar_path):
+            with open(sidecar_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        
+        with zipfile.ZipFile(zip_path) as zipf:
+            if 'manifest.json' not in zipf.namelist():
+                return None
+            return json.loads(zipf.read('manifest.json').decode('utf-8'))
+    
+    def verify_backup(self, zip_path: str) -> Dict:
+        """
+        التحقق من نسخة شاملة بقراءتها كتدفق دون استخراج أي ملف
+        
+        - يُقرأ كل ملف داخل الأرشيف للتحقق من CRC
+        - يُعد صفوف كل ملف CSV ويُقارن بالبيان
+        - تُحسب بصمة ملف قاعدة البيانات وتُقارن بالبيان
+        - يُراجع فحص السلامة المسجل وقت إنشاء النسخة
+        
+        Args:
+            zip_path: مسار ملف النسخة الشاملة
+            
+        Returns:
+            {'ok', 'errors', 'checked_files', 'content_hash'}
+        """
+        errors = []
+        checked_files = 0
+        manifest = None
+        
+        try:
+            with zipfile.ZipFile(zip_path) as zipf:
+                if 'manifest.json' not in zipf.namelist():
+                    return {'ok': False, 'errors': ["النسخة لا تحتوي على بيان"], 'checked_files': 0,
+                            'content_hash': None}
+                
+                manifest = json.loads(zipf.read('manifest.json').decode('utf-8'))
+                
+                if manifest['integrity_check'] != 'ok':
+                    errors.append(f"فحص السلامة وقت النسخ: {manifest['integrity_check']}")
+                
+                csv_tables = set()
+                
+                for info in zipf.infolist():
+                    if info.filename == 'manifest.json':
+                        continue
+                    
+                    with zipf.open(info) as f:
+                        if info.filename.startswith("csv/") and info.filename.endswith(".csv"):
+                            table_name = info.filename[len("csv/"):-len(".csv")]
+                            csv_tables.add(table_name)
+                            
+                            reader = csv.reader(io.TextIOWrapper(f, encoding='utf-8-sig', newline=''))
+                            rows = sum(1 for _ in reader) - 1
+                            expected = manifest['tables'].get(table_name, {}).get('rows')
+                            if rows != expected:
+                                errors.append(f"{info.filename}: {rows} صف بدلاً من {expected}")
+                        
+                        elif info.filename == manifest['database']:
+                            file_hash = hashlib.sha256()
+                            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                                file_hash.update(chunk)
+                            if file_hash.hexdigest() != manifest['database_sha256']:
+                                errors.append(f"{info.filename}: بصمة قاعدة البيانات غير مطابقة")
+                        
+                        else:
+                            # القراءة حتى النهاية تتحقق من CRC
+                            while f.read(1024 * 1024):
+                                pass
+                    
+                    checked_files += 1
+                
+                for table_name in manifest['tables']:
+                    if table_name not in csv_tables:
+                        errors.append(f"csv/{table_name}.csv غير موجود في النسخة")
+        
+        except (zipfile.BadZipFile, zlib.error, OSError, KeyError, ValueError) as e:
+            errors.append(str(e))
+        
+        result = {
+            'ok': not errors,
+            'errors': errors,
+            'checked_files': checked_files,
+            'content_hash': manifest['content_hash'] if manifest else None
+        }
+        
+        if errors:
+            logger.error(f"فشل التحقق من النسخة الاحتياطية {zip_path}: {errors}")
+        else:
+            logger.info(f"تم التحقق من النسخة الاحتياطية: {zip_path}")
+        
+        return result
+    
+    @staticmethod
+    def _stored_member(name: str) -> zipfile.ZipInfo:
+        """عنصر في الملف المضغوط بدون ضغط (للملفات المضغوطة مسبقاً)"""
+        info = zipfile.ZipInfo(name, date_time=datetime.now().timetuple()[:6])
+        info.compress_type = zipfile.ZIP_STORED
+        return info
+    
     def create_full_backup(self) -> str:
         """
         إنشاء نسخة احتياطية شاملة (جميع الصيغ مضغوطة في ملف واحد)
         
+        تُؤخذ لقطة متسقة واحدة ويُقرأ كل جدول منها مرة واحدة وتُوزع الصفوف على
+        كاتبي JSON و CSV و Excel في خيوط متوازية. يُكتب CSV مباشرة داخل الملف
+        المضغوط، ويُبنى JSON و Excel في ملفات مؤقتة بالذاكرة (تنتقل إلى القرص عند
+        كبرها) لأن الملف المضغوط لا يقبل أكثر من كاتب في وقت واحد. يُضاف إلى النسخة بيان manifest.json بعدد صفوف كل
+        جدول وبصمته وبصمة المخطط ونتيجة فحص السلامة.
+        
         Returns:
             مسار ملف النسخة الاحتياطية المضغوطة
         """
         try:
             timestamp = self.get_timestamp()
             
-            # إنشاء النسخ الاحتياطية بجميع الصيغ
-            json_backup = self.backup_database_to_json()
-            excel_backup = self.backup_database_to_excel()
-            csv_backups = self.backup_database_to_csv()
-            db_backup = self.backup_database_file()
-            
-            # إنشاء ملف مضغوط
             zip_filename = f"full_backup_{timestamp}.zip"
             zip_path = os.path.join(self.backup_dir, zip_filename)
             
-            with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-                # إضافة ملف JSON
-                zipf.write(json_backup, os.path.basename(json_backup))
-                
-                # إضافة ملف Excel
-                zipf.write(excel_backup, os.path.basename(excel_backup))
-                
-                # إضافة ملفات CSV
-                for csv_file in csv_backups:
-                    arcname = f"csv/{os.path.basename(csv_file)}"
-                    zipf.write(csv_file, arcname)
+            # اللقطة هي نفسها ملف قاعدة البيانات داخل النسخة
+            snapshot_path = os.path.join(self.backup_dir, f"backup_db_{timestamp}.sqlite")
+            self.snapshot_database(snapshot_path)
+            
+            conn = sqlite3.connect(snapshot_path)
+            integrity = "\n".join(row[0] for row in conn.execute("PRAGMA integrity_check"))
+            conn.close()
+            if integrity != 'ok':
+                logger.warning(f"فحص سلامة قاعدة البيانات أثناء النسخ: {integrity}")
+            
+            json_spool = tempfile.SpooledTemporaryFile(max_size=16 * 1024 * 1024)
+            excel_spool = tempfile.SpooledTemporaryFile(max_size=16 * 1024 * 1024)
+            
+            try:
+                with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
+                    zip_lock = threading.Lock()
+                    failed = threading.Event()
+                    queues = [queue.Queue(maxsize=8) for _ in range(4)]
+                    tables = {}
+                    
+                    def guarded(writer, *args):
+                        try:
+                            writer(*args)
+                        except Exception:
+                            failed.set()
+                            raise
+                    
+                    with ThreadPoolExecutor(max_workers=5, thread_name_prefix="full-backup") as executor:
+                        writers = [
+                            executor.submit(guarded, self._write_json_part, queues[0], json_spool),
+                            executor.submit(guarded, self._write_csv_part, queues[1], zipf, zip_lock),
+                            executor.submit(guarded, self._hash_tables_part, queues[2], tables),
+                            executor.submit(guarded, self._write_excel_part, queues[3], excel_spool)
+                        ]
+                        reader = executor.submit(self._read_tables_once, snapshot_path, queues, failed)
+                        
+                        for future in writers + [reader]:
+                            future.result()
+                    
+                    # إضافة ملف JSON (مضغوط مسبقاً فيُخزن دون ضغط ثانٍ)
+                    json_spool.seek(0)
+                    with zipf.open(self._stored_member(f"backup_json_{timestamp}.json.gz"), 'w',
+                                   force_zip64=True) as target:
+                        shutil.copyfileobj(json_spool, target, 1024 * 1024)
+                    
+                    # إضافة ملف Excel (xlsx ملف مضغوط أصلاً)
+                    excel_spool.seek(0)
+                    with zipf.open(self._stored_member(f"backup_excel_{timestamp}.xlsx"), 'w',
+                                   force_zip64=True) as target:
+                        shutil.copyfileobj(excel_spool, target, 1024 * 1024)
+                    
+                    # إضافة ملف قاعدة البيانات
+                    zipf.write(snapshot_path, os.path.basename(snapshot_path))
+                    
+                    # إضافة البيان
+                    manifest = self._build_manifest(snapshot_path, tables, integrity)
+                    manifest['backup'] = zip_filename
+                    zipf.writestr('manifest.json', json.dumps(manifest, ensure_ascii=False, indent=2))
                 
-                # إضافة ملف قاعدة البيانات
-                zipf.write(db_backup, os.path.basename(db_backup))
+                os.makedirs(self.manifests_dir, exist_ok=True)
+                sidecar_path = os.path.join(self.manifests_dir, f"full_backup_{timestamp}.json")
+                with open(sidecar_path, 'w', encoding='utf-8') as f:
+                    json.dump(manifest, f, ensure_ascii=False, indent=2)
             
-            # حذف الملفات المؤقتة
-            os.remove(json_backup)
-            os.remove(excel_backup)
-            os.remove(db_backup)
+            except Exception:
+                if os.path.exists(zip_path):
+                    os.remove(zip_path)
+                raise
             
-            # حذف مجلد CSV
-            csv_dir = os.path.dirname(csv_backups[0]) if csv_backups else None
-            if csv_dir and os.path.exists(csv_dir):
-                shutil.rmtree(csv_dir)
+            finally:
+                json_spool.close()
+                excel_spool.close()
+                if os.path.exists(snapshot_path):
+                    os.remove(snapshot_path)
             
             logger.info(f"تم إنشاء نسخة احتياطية شاملة: {zip_path}")
             return zip_path
@@ -253,25 +768,541 @@ class BackupSystem:
             logger.error(f"خطأ في إنشاء النسخة الاحتياطية الشاملة: {str(e)}")
             raise
     
-    def schedule_automatic_backup(self, backup_type: str = "full", interval_hours: int = 24):
+    # ------------------------------------------------------------------
+    # النسخ الاحتياطي التزايدي
+    # ------------------------------------------------------------------
+    
+    @property
+    def incremental_dir(self) -> str:
+        """مجلد سلسلة النسخ التزايدية (نسخة أساسية + فروقات)"""
+        return os.path.join(self.backup_dir, "incremental")
+    
+    def snapshot_database(self, dest_path: str, pages: int = 256):
+        """
+        أخذ لقطة متسقة من قاعدة البيانات عبر واجهة النسخ الاحتياطي في SQLite
+        
+        تُنسخ الصفحات على دفعات مع استراحة قصيرة بينها فلا تُحجب عمليات
+        الكتابة أثناء النسخ كما يحدث مع نسخ الملف مباشرة.
+        
+        Args:
+            dest_path: مسار ملف اللقطة
+            pages: عدد الصفحات المنسوخة في كل خطوة
+        """
+        source = sqlite3.connect(self.db_path)
+        target = sqlite3.connect(dest_path)
+        page_size = source.execute("PRAGMA page_size").fetchone()[0]
+        
+        restarts = [0, None]
+        
+        def progress(status, remaining, total):
+            # أي كتابة على قاعدة البيانات أثناء النسخ تعيده من البداية، فبعد
+            # ثلاث إعادات يُكمل بأقصى سرعة حتى لا يطول النسخ بلا نهاية
+            copied = (restarts[1] if restarts[1] is not None else total) - remaining
+            if copied < 0:
+                restarts[0] += 1
+                copied = total - remaining
+            restarts[1] = remaining
+            
+            if restarts[0] >= 3:
+                if self.io_throttle:
+                    self.io_throttle.record(copied * page_size)
+                return
+            
+            # في النسخ المجدولة: تحديد معدل القراءة والتوقف أثناء عمليات البيع
+            if self.io_throttle:
+                self.io_throttle.throttle(copied * page_size)
+            if self.activity_gate:
+                self.activity_gate.wait_idle()
+        
+        try:
+            source.backup(target, pages=pages, progress=progress, sleep=0.005)
+        finally:
+            target.close()
+            source.close()
+    
+    def _read_table_schemas(self, conn) -> Dict[str, Dict]:
+        """
+        قراءة تعريفات الجداول وفهارسها ومشغلاتها
+        
+        Returns:
+            {اسم الجدول: {'table_sql', 'extra_sql'}}
+        """
+        cursor = conn.execute(r"""
+            SELECT type, tbl_name, sql FROM sqlite_master
+            WHERE sql IS NOT NULL AND tbl_name NOT LIKE 'sqlite\_%' ESCAPE '\'
+            ORDER BY type = 'table' DESC, name
+        """)
+        
+        schemas = {}
+        for object_type, table_name, sql in cursor.fetchall():
+            if object_type == 'table':
+                schemas[table_name] = {'table_sql': sql, 'extra_sql': []}
+            elif table_name in schemas:
+                schemas[table_name]['extra_sql'].append(sql)
+        
+        return schemas
+    
+    def _fingerprint_table(self, conn, table_name: str, schema: Dict) -> Dict:
+        """
+        حساب بصمة الجدول: بصمة لكل جزء من الصفوف حسب rowid
+        
+        الجداول WITHOUT ROWID تُعامل كجزء واحد وتُنسخ كاملة عند تغيرها.
+        """
+        schema_hash = hashlib.sha1(
+            "\n".join([schema['table_sql']] + schema['extra_sql']).encode('utf-8')
+        ).hexdigest()
+        
+        try:
+            cursor = conn.execute(f'SELECT rowid, * FROM "{table_name}" ORDER BY rowid')
+            has_rowid = True
+        except sqlite3.OperationalError:
+            cursor = conn.execute(f'SELECT * FROM "{table_name}"')
+            has_rowid = False
+        
+        chunks = {}
+        current_chunk = None
+        chunk_hash = hashlib.sha1()
+        row_count = 0
+        
+        while True:
+            rows = cursor.fetchmany(1000)
+            if not rows:
+                break
+            
+            for row in rows:
+                chunk = row[0] // self.INCREMENTAL_CHUNK_ROWS if has_rowid else 0
+                if chunk != current_chunk:
+                    if current_chunk is not None:
+                        chunks[str(current_chunk)] = chunk_hash.hexdigest()
+                    current_chunk = chunk
+                    chunk_hash = hashlib.sha1()
+                chunk_hash.update(repr(row).encode('utf-8'))
+            
+            row_count += len(rows)
+        
+        if current_chunk is not None:
+            chunks[str(current_chunk)] = chunk_hash.hexdigest()
+        
+        table_hash = hashlib.sha1(
+            "".join(f"{key}:{value}" for key, value in sorted(chunks.items())).encode('utf-8')
+        ).hexdigest()
+        
+        return {
+            'schema_hash': schema_hash,
+            'has_rowid': has_rowid,
+            'rows': row_count,
+            'hash': table_hash,
+            'chunks': chunks
+        }
+    
+    def _load_incremental_manifest(self, manifest_name: str) -> Dict:
+        with open(os.path.join(self.incremental_dir, manifest_name), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    
+    def get_latest_incremental_manifest(self) -> Optional[Dict]:
+        """آخر بيان في سلسلة النسخ التزايدية أو None إذا لم توجد"""
+        if not os.path.exists(self.incremental_dir):
+            return None
+        
+        manifests = sorted(
+            name for name in os.listdir(self.incremental_dir)
+            if name.startswith("manifest_") and name.endswith(".json")
+        )
+        return self._load_incremental_manifest(manifests[-1]) if manifests else None
+    
+    def _copy_changes_to_delta(self, conn, delta_path: str, changes: Dict):
+        """نسخ الأجزاء المتغيرة من اللقطة إلى ملف الفروقات"""
+        conn.execute("ATTACH DATABASE ? AS delta", (delta_path,))
+        
+        try:
+            for table_name, change in changes.items():
+                rowid_select = f"rowid AS {self.ROWID_COLUMN}, " if change['has_rowid'] else ""
+                conn.execute(f'''
+                    CREATE TABLE delta."{table_name}" AS
+                    SELECT {rowid_select}* FROM main."{table_name}" WHERE 0
+                ''')
+                
+                if change['mode'] == 'full':
+                    conn.execute(f'''
+                        INSERT INTO delta."{table_name}"
+                        SELECT {rowid_select}* FROM main."{table_name}"
+                    ''')
+                else:
+                    conn.executemany(f'''
+                        INSERT INTO delta."{table_name}"
+                        SELECT {rowid_select}* FROM main."{table_name}"
+                        WHERE rowid >= ? AND rowid < ?
+                    ''', [
+                        (chunk * self.INCREMENTAL_CHUNK_ROWS, (chunk + 1) * self.INCREMENTAL_CHUNK_ROWS)
+                        for chunk in change['chunks']
+                    ])
+            
+            conn.commit()
+        finally:
+            conn.execute("DETACH DATABASE delta")
+    
+    def create_incremental_backup(self, max_chain_length: int = 7) -> str:
+        """
+        إنشاء نسخة احتياطية تزايدية
+        
+        تؤخذ لقطة متسقة ثم تُقارن بصمات أجزاء كل جدول بآخر بيان في السلسلة،
+        ويُحفظ في ملف الفروقات ما تغير من أجزاء فقط. تبدأ سلسلة جديدة بنسخة
+        أساسية كاملة عند عدم وجود سلسلة أو عند بلوغ طولها الحد الأقصى.
+        
+        Args:
+            max_chain_length: أقصى عدد فروقات قبل إنشاء نسخة أساسية جديدة
+            
+        Returns:
+            مسار بيان النسخة (manifest)
+        """
+        try:
+            os.makedirs(self.incremental_dir, exist_ok=True)
+            
+            # دقة الميكروثانية لأن النسخ التزايدية قد تتقارب زمنياً
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+            snapshot_path = os.path.join(self.incremental_dir, f"snapshot_{timestamp}.tmp")
+            self.snapshot_database(snapshot_path)
+            
+            conn = sqlite3.connect(snapshot_path)
+            schemas = self._read_table_schemas(conn)
+            tables = {
+                table_name: self._fingerprint_table(conn, table_name, schema)
+                for table_name, schema in schemas.items()
+            }
+            
+            parent = self.get_latest_incremental_manifest()
+            
+            manifest = {
+                'name': f"manifest_{timestamp}.json",
+                'created_at': datetime.now().isoformat(),
+                'tables': tables
+            }
+            
+            if parent is None or parent['chain_length'] >= max_chain_length:
+                conn.close()
+                
+                manifest.update({
+                    'type': 'base',
+                    'parent': None,
+                    'chain_length': 0,
+                    'file': f"base_{timestamp}.sqlite"
+                })
+                os.replace(snapshot_path, os.path.join(self.incremental_dir, manifest['file']))
+            
+            else:
+                changes = {}
+                
+                for table_name, current in tables.items():
+                    previous = parent['tables'].get(table_name)
+                    
+                    unchanged = (previous and previous['hash'] == current['hash']
+                                 and previous['schema_hash'] == current['schema_hash'])
+                    if unchanged:
+                        continue
+                    
+                    change = {'has_rowid': current['has_rowid']}
+                    
+                    if (previous is None or previous['schema_hash'] != current['schema_hash']
+                            or not current['has_rowid']):
+                        change.update({
+                            'mode': 'full',
+                            'table_sql': schemas[table_name]['table_sql'],
+                            'extra_sql': schemas[table_name]['extra_sql']
+                        })
+                    else:
+                        changed_chunks = set(previous['chunks']) | set(current['chunks'])
+                        change.update({
+                            'mode': 'chunks',
+                            'chunks': sorted(
+                                int(chunk) for chunk in changed_chunks
+                                if previous['chunks'].get(chunk) != current['chunks'].get(chunk)
+                            )
+                        })
+                    
+                    changes[table_name] = change
+                
+                delta_file = None
+                if changes:
+                    delta_file = f"delta_{timestamp}.sqlite"
+                    self._copy_changes_to_delta(conn, os.path.join(self.incremental_dir, delta_file), changes)
+                
+                conn.close()
+                os.remove(snapshot_path)
+                
+                manifest.update({
+                    'type': 'delta',
+                    'parent': parent['name'],
+                    'chain_length': parent['chain_length'] + 1,
+                    'file': delta_file,
+                    'changes': changes,
+                    'dropped': [name for name in parent['tables'] if name not in tables]
+                })
+            
+            manifest_path = os.path.join(self.incremental_dir, manifest['name'])
+            with open(manifest_path, 'w', encoding='utf-8') as f:
+                json.dump(manifest, f, ensure_ascii=False, indent=2)
+            
+            logger.info(f"تم إنشاء نسخة احتياطية تزايدية ({manifest['type']}): {manifest_path}")
+            return manifest_path
+            
+        except Exception as e:
+            logger.error(f"خطأ في إنشاء النسخة الاحتياطية التزايدية: {str(e)}")
+            raise
+    
+    def _apply_incremental_delta(self, conn, manifest: Dict):
+        """تطبيق ملف فروقات واحد على قاعدة البيانات المستعادة"""
+        for table_name in manifest.get('dropped', []):
+            conn.execute(f'DROP TABLE IF EXISTS main."{table_name}"')
+        
+        if not manifest['file']:
+            conn.commit()
+            return
+        
+        conn.execute("ATTACH DATABASE ? AS delta",
+                     (os.path.join(self.incremental_dir, manifest['file']),))
+        
+        try:
+            for table_name, change in manifest['changes'].items():
+                columns = [
+                    row[1] for row in conn.execute(f'PRAGMA delta.table_info("{table_name}")')
+                    if row[1] != self.ROWID_COLUMN
+                ]
+                
+                # الصفوف في ملف الفروقات هي نتيجة المشغلات (triggers) أصلاً، فلا
+                # تُشغَّل مرة أخرى أثناء الإدراج: في الوضع الكامل تُنشأ الفهارس
+                # والمشغلات بعد الإدراج، وفي وضع الأجزاء تُحذف مؤقتاً ثم تُعاد
+                if change['mode'] == 'full':
+                    conn.execute(f'DROP TABLE IF EXISTS main."{table_name}"')
+                    conn.execute(change['table_sql'])
+                    after_sql = change['extra_sql']
+                else:
+                    triggers = conn.execute(
+                        "SELECT name, sql FROM main.sqlite_master WHERE type = 'trigger' AND tbl_name = ?",
+                        (table_name,)
+                    ).fetchall()
+                    after_sql = [sql for _, sql in triggers]
+                    for trigger_name, _ in triggers:
+                        conn.execute(f'DROP TRIGGER main."{trigger_name}"')
+                    
+                    conn.executemany(f'DELETE FROM main."{table_name}" WHERE rowid >= ? AND rowid < ?', [
+                        (chunk * self.INCREMENTAL_CHUNK_ROWS, (chunk + 1) * self.INCREMENTAL_CHUNK_ROWS)
+                        for chunk in change['chunks']
+                    ])
+                
+                column_list = ", ".join(f'"{column}"' for column in columns)
+                if change['has_rowid']:
+                    conn.execute(f'''
+                        INSERT INTO main."{table_name}" (rowid, {column_list})
+                        SELECT {self.ROWID_COLUMN}, {column_list} FROM delta."{table_name}"
+                    ''')
+                else:
+                    conn.execute(f'''
+                        INSERT INTO main."{table_name}" ({column_list})
+                        SELECT {column_list} FROM delta."{table_name}"
+                    ''')
+                
+                for sql in after_sql:
+                    conn.execute(sql)
+            
+            conn.commit()
+        finally:
+            conn.execute("DETACH DATABASE delta")
+    
+    def restore_incremental_backup(self, manifest_path: str = None, target_path: str = None) -> str:
+        """
+        استعادة قاعدة البيانات من سلسلة النسخ التزايدية
+        
+        تُنسخ النسخة الأساسية ثم تُطبق الفروقات بالترتيب حتى البيان المطلوب،
+        وتُستبدل قاعدة البيانات الهدف دفعة واحدة بعد اكتمال الاستعادة.
+        
+        Args:
+            manifest_path: مسار البيان المراد الاستعادة إليه (افتراضياً الأحدث)
+            target_path: مسار قاعدة البيانات المستعادة (افتراضياً قاعدة البيانات الحالية)
+            
+        Returns:
+            مسار قاعدة البيانات المستعادة
+        """
+        try:
+            if manifest_path:
+                manifest = self._load_incremental_manifest(os.path.basename(manifest_path))
+            else:
+                manifest = self.get_latest_incremental_manifest()
+                if manifest is None:
+                    raise FileNotFoundError("لا توجد نسخ احتياطية تزايدية")
+            
+            # تتبع السلسلة حتى النسخة الأساسية
+            chain = [manifest]
+            while chain[-1]['parent']:
+                chain.append(self._load_incremental_manifest(chain[-1]['parent']))
+            chain.reverse()
+            
+            target_path = target_path or self.db_path
+            temp_path = f"{target_path}.restore_tmp"
+            shutil.copy2(os.path.join(self.incremental_dir, chain[0]['file']), temp_path)
+            
+            conn = sqlite3.connect(temp_path)
+            try:
+                for delta in chain[1:]:
+                    self._apply_incremental_delta(conn, delta)
+            finally:
+                conn.close()
+            
+            os.replace(temp_path, target_path)
+            
+            logger.info(f"تم استعادة {len(chain) - 1} فروقات فوق النسخة الأساسية إلى: {target_path}")
+            return target_path
+            
+        except Exception as e:
+            logger.error(f"خطأ في استعادة النسخة الاحتياطية التزايدية: {str(e)}")
+            raise
+    
+    def schedule_automatic_backup(self, backup_type: str = "full", interval_hours: int = 24,
+                                  cron: Optional[str] = None, read_bytes_per_second: float = 8 * 1024 * 1024,
+                                  on_backup_created=None):
         """
         جدولة النسخ الاحتياطي التلقائي
         
         Args:
-            backup_type: نوع النسخة الاحتياطية (json, excel, csv, db, full)
-            interval_hours: الفترة الزمنية بالساعات بين النسخ الاحتياطية
+            backup_type: نوع النسخة الاحتياطية (json, excel, csv, db, full, incremental)
+            interval_hours: الفترة الزمنية بالساعات بين النسخ الاحتياطية من آخر نسخة (إذا لم يُحدد cron)
+            cron: تعبير cron للمواعيد، مثل "30 23 * * *" كل يوم بعد الإغلاق
+            read_bytes_per_second: أقصى معدل قراءة من قاعدة البيانات أثناء النسخ
+            on_backup_created: دالة تُستدعى بمسار النسخة ونوعها بعد نجاحها
+            
+        Returns:
+            المجدول بعد تشغيله (get_metrics لإحصائياته و stop لإيقافه)
         """
-        # هذه الدالة تحتاج إلى تطبيق مع مكتبة جدولة مثل APScheduler
-        # سيتم تطبيقها في الإصدار المتقدم
-        pass
+        from src.backup_scheduler import BackupScheduler
+        
+        if cron is None and interval_hours <= 0:
+            raise ValueError(f"الفترة بين النسخ يجب أن تكون أكبر من صفر: {interval_hours}")
+        
+        scheduler = BackupScheduler(self, read_bytes_per_second=read_bytes_per_second,
+                                    on_backup_created=on_backup_created)
+        if cron is None:
+            scheduler.add_job(f"auto_{backup_type}", backup_type=backup_type, interval_hours=interval_hours)
+        else:
+            scheduler.add_job(f"auto_{backup_type}", cron, backup_type)
+        scheduler.start()
+        
+        logger.info(f"تمت جدولة النسخ الاحتياطي التلقائي ({backup_type}): {cron or f'كل {interval_hours} ساعة'}")
+        return scheduler
     
-    def cleanup_old_backups(self, keep_count: int = 10):
+    @staticmethod
+    def _path_size(path: str) -> int:
+        if os.path.isdir(path):
+            return sum(os.path.getsize(os.path.join(root, name))
+                       for root, _, names in os.walk(path) for name in names)
+        return os.path.getsize(path)
+    
+    def list_restore_points(self) -> List[Dict]:
+        """
+        النسخ المحلية كنقاط استعادة بملفاتها وأحجامها
+        
+        النسخة التزايدية تعتمد على بيان النسخة السابقة في سلستها حتى النسخة الأساسية.
+        
+        Returns:
+            [{'id', 'series', 'time', 'files': {مسار: حجم}, 'depends': [معرفات]}]
+        """
+        from src.backup_retention import BACKUP_SERIES, parse_backup_time
+        
+        points = []
+        
+        for filename in os.listdir(self.backup_dir):
+            for prefix, series in BACKUP_SERIES:
+                if not filename.startswith(prefix):
+                    continue
+                
+                path = os.path.join(self.backup_dir, filename)
+                files = {path: self._path_size(path)}
+                
+                sidecar_path = os.path.join(self.manifests_dir, os.path.splitext(filename)[0] + ".json")
+                if os.path.exists(sidecar_path):
+                    files[sidecar_path] = os.path.getsize(sidecar_path)
+                
+                points.append({
+                    'id': path,
+                    'series': series,
+                    'time': parse_backup_time(filename[len(prefix):]) or datetime.fromtimestamp(os.path.getmtime(path)),
+                    'files': files,
+                    'depends': []
+                })
+                break
+        
+        if os.path.exists(self.incremental_dir):
+            for name in sorted(os.listdir(self.incremental_dir)):
+                if not (name.startswith("manifest_") and name.endswith(".json")):
+                    continue
+                
+                manifest = self._load_incremental_manifest(name)
+                manifest_path = os.path.join(self.incremental_dir, name)
+                files = {manifest_path: os.path.getsize(manifest_path)}
+                
+                if manifest['file']:
+                    data_path = os.path.join(self.incremental_dir, manifest['file'])
+                    if os.path.exists(data_path):
+                        files[data_path] = os.path.getsize(data_path)
+                
+                points.append({
+                    'id': manifest_path,
+                    'series': "incremental",
+                    'time': datetime.fromisoformat(manifest['created_at']),
+                    'files': files,
+                    'depends': [os.path.join(self.incremental_dir, manifest['parent'])] if manifest['parent'] else []
+                })
+        
+        return points
+    
+    def cleanup_old_backups(self, keep_count: Optional[int] = None, policy=None, dry_run: bool = False) -> Dict:
+        """
+        حذف النسخ الاحتياطية القديمة
+        
+        افتراضياً تُطبق سياسة الاحتفاظ (ساعي/يومي/أسبوعي/شهري مع حد المساحة) على
+        كل أنواع النسخ بما فيها سلاسل النسخ التزايدية. تحديد keep_count يعيد السلوك
+        القديم: الاحتفاظ بأحدث عدد محدد من الملفات فقط.
+        
+        Args:
+            keep_count: عدد النسخ الاحتياطية المراد الاحتفاظ بها (السلوك القديم)
+            policy: سياسة الاحتفاظ (افتراضياً self.retention_policy)
+            dry_run: عرض الخطة دون حذف
+            
+        Returns:
+            خطة الاحتفاظ (انظر backup_retention.plan_retention)
+        """
+        if keep_count is not None:
+            return self._cleanup_keep_newest(keep_count)
+        
+        try:
+            from src.backup_retention import RetentionPolicy, plan_retention
+            
+            plan = plan_retention(self.list_restore_points(), policy or self.retention_policy or RetentionPolicy())
+            
+            if plan['over_budget']:
+                logger.warning(f"النسخ المحتفظ بها ({plan['kept_bytes']} بايت) تتجاوز الحد الأقصى للمساحة")
+            
+            if not dry_run:
+                for path in plan['delete_files']:
+                    if os.path.isdir(path):
+                        shutil.rmtree(path)
+                    elif os.path.exists(path):
+                        os.remove(path)
+                    logger.info(f"تم حذف النسخة الاحتياطية القديمة: {path}")
+            
+            return plan
+            
+        except Exception as e:
+            logger.error(f"خطأ في تنظيف النسخ الاحتياطية القديمة: {str(e)}")
+            return {}
+    
+    def _cleanup_keep_newest(self, keep_count: int) -> Dict:
         """
         حذف النسخ الاحتياطية القديمة والاحتفاظ بعدد محدد من النسخ الحديثة
         
         Args:
             keep_count: عدد النسخ الاحتياطية المراد الاحتفاظ بها
         """
+        files_to_delete = []
+        
         try:
             # الحصول على قائمة ملفات النسخ الاحتياطية
             backup_files = []
@@ -290,38 +1321,61 @@ class BackupSystem:
                 for file_path, _ in files_to_delete:
                     os.remove(file_path)
                     logger.info(f"تم حذف النسخة الاحتياطية القديمة: {file_path}")
+                    
+                    sidecar_path = os.path.join(
+                        self.manifests_dir, os.path.splitext(os.path.basename(file_path))[0] + ".json"
+                    )
+                    if os.path.exists(sidecar_path):
+                        os.remove(sidecar_path)
             
         except Exception as e:
             logger.error(f"خطأ في تنظيف النسخ الاحتياطية القديمة: {str(e)}")
+        
+        return {'delete_files': [file_path for file_path, _ in files_to_delete]}
+    
+    def _iter_json_backup_tables(self, json_file_path: str):
+        """
+        قراءة جداول نسخة JSON أو JSON Lines (مضغوطة أو لا)
+        
+        Yields:
+            (اسم الجدول، الأعمدة، الصفوف)
+        """
+        if '.jsonl' in os.path.basename(json_file_path):
+            yield from self.iter_json_lines_backup(json_file_path)
+            return
+        
+        with self._open_backup_file(json_file_path, 'r') as f:
+            backup_data = json.load(f)
+        
+        for table_name, table_data in backup_data.items():
+            columns = list(table_data[0].keys()) if table_data else []
+            yield table_name, columns, (
+                tuple(self._decode_json_value(row[column]) for column in columns) for row in table_data
+            )
     
     def restore_from_json(self, json_file_path: str):
         """
         استعادة البيانات من ملف JSON
         
         Args:
-            json_file_path: مسار ملف JSON
+            json_file_path: مسار ملف JSON أو JSON Lines (يدعم .gz و .zst)
         """
         try:
-            # قراءة بيانات JSON
-            with open(json_file_path, 'r', encoding='utf-8') as f:
-                backup_data = json.load(f)
-            
             # الاتصال بقاعدة البيانات
             conn = sqlite3.connect(self.db_path)
             cursor = conn.cursor()
             
             # استعادة البيانات لكل جدول
-            for table_name, table_data in backup_data.items():
-                if table_data:  # إذا كان الجدول يحتوي على بيانات
+            for table_name, columns, rows in self._iter_json_backup_tables(json_file_path):
+                first_row = next(rows, None)
+                if first_row is not None:  # إذا كان الجدول يحتوي على بيانات
                     # حذف البيانات الموجودة
                     cursor.execute(f"DELETE FROM {table_name}")
                     
                     # إدراج البيانات المستعادة
-                    columns = list(table_data[0].keys())
                     placeholders = ', '.join(['?' for _ in columns])
                     
-                    for row in table_data:
-                        values = [row[col] for col in columns]
+                    for values in itertools.chain([first_row], rows):
                         cursor.execute(f"INSERT INTO {table_name} ({', '.join(columns)}) VALUES ({placeholders})", values)
             
             conn.commit()
@@ -332,13 +1386,257 @@ class BackupSystem:
         except Exception as e:
             logger.error(f"خطأ في استعادة البيانات من JSON: {str(e)}")
             raise
-
+    
+    # ------------------------------------------------------------------
+    # الاستعادة السريعة
+    # ------------------------------------------------------------------
+    
+    def _read_backup_in_background(self, json_file_path: str, q: queue.Queue, failed: threading.Event,
+                                   batch_size: int):
+        """قراءة وفك ترميز ملف النسخة في خيط مستقل بالتوازي مع الكتابة"""
+        def put(item):
+            while True:
+                try:
+                    q.put(item, timeout=0.5)
+                    return
+                except queue.Full:
+                    if failed.is_set():
+                        raise RuntimeError("توقفت الاستعادة")
+        
+        try:
+            for table_name, columns, rows in self._iter_json_backup_tables(json_file_path):
+                put(('table', table_name, columns))
+                
+                batch = []
+                for row in rows:
+                    batch.append(row)
+                    if len(batch) >= batch_size:
+                        put(('rows', batch))
+                        batch = []
+                if batch:
+                    put(('rows', batch))
+        finally:
+            while True:
+                try:
+                    q.put(self._END_OF_STREAM, timeout=0.5)
+                    break
+                except queue.Full:
+                    if failed.is_set():
+                        while not q.empty():
+                            q.get_nowait()
+    
+    def fast_restore_from_json(self, json_file_path: str, batch_size: int = 5000,
+                               progress_callback=None, verify: bool = True) -> Dict[str, Dict]:
+        """
+        استعادة سريعة من ملف JSON عبر قاعدة بيانات مرحلية
+        
+        - تُنشأ الجداول في ملف مرحلي بدون سجل معاملات ولا مزامنة مع القرص
+        - تُدرج الصفوف بـ executemany على دفعات كبيرة في معاملة واحدة، بينما
+          تُقرأ الصفوف وتُفك في خيط مستقل
+        - تُنشأ الفهارس والمشغلات بعد الإدراج
+        - يُتحقق من عدد الصفوف وبصمتها ومن سلامة الملف ثم يُستبدل ملف قاعدة
+          البيانات دفعة واحدة؛ عند أي فشل تبقى قاعدة البيانات الحالية كما هي
+        
+        الجداول غير الموجودة في النسخة أو الفارغة فيها تحتفظ ببياناتها الحالية
+        كما في restore_from_json. يجب إغلاق الاتصالات الأخرى قبل الاستبدال.
+        
+        Args:
+            json_file_path: مسار ملف JSON أو JSON Lines (يدعم .gz و .zst)
+            batch_size: عدد الصفوف في كل دفعة إدراج
+            progress_callback: دالة تُستدعى بعد كل دفعة (اسم الجدول، عدد الصفوف المستعادة)
+            verify: التحقق من البصمات بعد الإدراج (عدد الصفوف وسلامة الملف يُفحصان دائماً)
+            
+        Returns:
+            تقرير لكل جدول: {'rows', 'verified', 'source'}
+        """
+        staging_path = f"{self.db_path}.staging"
+        conn = None
+        
+        try:
+            if os.path.exists(staging_path):
+                os.remove(staging_path)
+            
+            live = sqlite3.connect(self.db_path)
+            schemas = self._read_table_schemas(live)
+            live.close()
+            
+            conn = sqlite3.connect(staging_path, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=OFF")
+            conn.execute("PRAGMA synchronous=OFF")
+            conn.execute("PRAGMA cache_size=-65536")
+            
+            # الجداول فقط؛ الفهارس والمشغلات بعد الإدراج
+            for schema in schemas.values():
+                conn.execute(schema['table_sql'])
+            
+            conn.execute("BEGIN")
+            
+            report = {}
+            sequences = {}
+            q = queue.Queue(maxsize=8)
+            failed = threading.Event()
+            reader_thread = ThreadPoolExecutor(max_workers=1, thread_name_prefix="restore-reader")
+            reader = reader_thread.submit(self._read_backup_in_background, json_file_path, q, failed, batch_size)
+            
+            try:
+                for table_name, table_info, rows in self._iter_queued_tables(q):
+                    columns = list(table_info)
+                    if not columns:
+                        continue
+                    
+                    # جداول النظام (sqlite_sequence في النسخ القديمة) تنشئها SQLite
+                    # بنفسها، فتُحفظ قيم العدادات وتُكتب بعد إدراج البيانات
+                    if table_name.startswith('sqlite_'):
+                        if table_name == 'sqlite_sequence':
+                            for row in rows:
+                                record = dict(zip(columns, row))
+                                sequences[record['name']] = record['seq']
+                        else:
+                            for _ in rows:
+                                pass
+                        continue
+                    
+                    if table_name not in schemas:
+                        column_defs = ", ".join(f'"{column}"' for column in columns)
+                        conn.execute(f'CREATE TABLE "{table_name}" ({column_defs})')
+                    
+                    column_list = ", ".join(f'"{column}"' for column in columns)
+                    placeholders = ", ".join("?" for _ in columns)
+                    insert_sql = f'INSERT INTO "{table_name}" ({column_list}) VALUES ({placeholders})'
+                    
+                    # البصمة مجموع hash للصفوف فلا تتأثر بترتيبها، و hash يساوي بين 2 و 2.0
+                    # كما تفعل SQLite عند التخزين؛ تُقارن داخل نفس العملية فقط
+                    restored = 0
+                    checksum = 0
+                    
+                    while True:
+                        batch = list(itertools.islice(rows, batch_size))
+                        if not batch:
+                            break
+                        
+                        conn.executemany(insert_sql, batch)
+                        if verify:
+                            checksum += sum(map(hash, batch))
+                        restored += len(batch)
+                        
+                        if progress_callback:
+                            progress_callback(table_name, restored)
+                    
+                    if restored:
+                        report[table_name] = {
+                            'rows': restored,
+                            'checksum': checksum,
+                            'columns': columns,
+                            'source': 'backup'
+                        }
+                        logger.info(f"تمت استعادة {restored} صف في الجدول {table_name}")
+                
+                reader.result()
+            
+            except Exception:
+                failed.set()
+                raise
+            
+            finally:
+                reader_thread.shutdown(wait=True)
+            
+            # الجداول التي لم تشملها النسخة تحتفظ ببياناتها الحالية
+            conn.execute("COMMIT")
+            conn.execute("ATTACH DATABASE ? AS live", (self.db_path,))
+            conn.execute("BEGIN")
+            for table_name in schemas:
+                if table_name not in report:
+                    conn.execute(f'INSERT INTO main."{table_name}" SELECT * FROM live."{table_name}"')
+                    report[table_name] = {'source': 'current'}
+            
+            # عدادات AUTOINCREMENT: من النسخة للجداول المستعادة ومن القاعدة الحالية للباقي
+            has_sequence = "SELECT 1 FROM {}.sqlite_master WHERE name = 'sqlite_sequence'"
+            if conn.execute(has_sequence.format('main')).fetchone():
+                live_sequences = {}
+                if conn.execute(has_sequence.format('live')).fetchone():
+                    live_sequences = dict(conn.execute("SELECT name, seq FROM live.sqlite_sequence"))
+                
+                for table_name, entry in report.items():
+                    seq = sequences.get(table_name) if entry['source'] == 'backup' else live_sequences.get(table_name)
+                    if seq is None:
+                        continue
+                    
+                    # لا يقل العداد عن أكبر rowid مُدرج
+                    updated = conn.execute(
+                        "UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = ?", (seq, table_name)
+                    ).rowcount
+                    if not updated:
+                        conn.execute("INSERT INTO sqlite_sequence (name, seq) VALUES (?, ?)", (table_name, seq))
+            conn.execute("COMMIT")
+            conn.execute("DETACH DATABASE live")
+            
+            # إنشاء الفهارس والمشغلات بعد الإدراج
+            conn.execute("BEGIN")
+            for schema in schemas.values():
+                for sql in schema['extra_sql']:
+                    conn.execute(sql)
+            conn.execute("COMMIT")
+            
+            # التحقق من عدد الصفوف والبصمة وسلامة الملف
+            for table_name, entry in report.items():
+                if entry['source'] != 'backup':
+                    continue
+                
+                column_list = ", ".join(f'"{column}"' for column in entry['columns'])
+                rows_count = conn.execute(f'SELECT COUNT(*) FROM "{table_name}"').fetchone()[0]
+                checksum = 0
+                if verify:
+                    checksum = sum(map(hash, conn.execute(f'SELECT {column_list} FROM "{table_name}"')))
+                
+                if rows_count != entry['rows'] or checksum != entry['checksum']:
+                    raise ValueError(f"فشل التحقق من الجدول {table_name}: "
+                                     f"{rows_count}/{entry['rows']} صف، البصمة غير مطابقة")
+                
+                entry['verified'] = verify
+                del entry['columns']
+                del entry['checksum']
+            
+            integrity = conn.execute("PRAGMA integrity_check").fetchone()[0]
+            if integrity != 'ok':
+                raise ValueError(f"فشل فحص سلامة قاعدة البيانات المستعادة: {integrity}")
+            
+            conn.close()
+            
+            # تفريغ سجل WAL للقاعدة الحالية قبل الاستبدال حتى لا يُطبق على الملف الجديد
+            live = sqlite3.connect(self.db_path)
+            live.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            live.close()
+            
+            os.replace(staging_path, self.db_path)
+            for suffix in ("-wal", "-shm"):
+                if os.path.exists(self.db_path + suffix):
+                    os.remove(self.db_path + suffix)
+            
+            logger.info(f"تم استعادة البيانات من: {json_file_path}")
+            return report
+            
+        except Exception as e:
+            if conn is not None:
+                conn.close()
+            if os.path.exists(staging_path):
+                os.remove(staging_path)
+            
+            logger.error(f"خطأ في الاستعادة السريعة من JSON: {str(e)}")
+            raise
 
 # مثال على الاستخدام
 if __name__ == "__main__":
+    import sys
+    
     # إنشاء نظام النسخ الاحتياطي
     backup_system = BackupSystem("database.sqlite", "backups")
     
+    # التحقق من نسخة موجودة: python backup_system.py verify <ملف النسخة>
+    if len(sys.argv) == 3 and sys.argv[1] == "verify":
+        result = backup_system.verify_backup(sys.argv[2])
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+        sys.exit(0 if result['ok'] else 1)
+    
     # إنشاء نسخة احتياطية شاملة
     backup_file = backup_system.create_full_backup()
     print(f"تم إنشاء النسخة الاحتياطية: {backup_file}")
@@ -8,8 +8,15 @@ from datetime import datetime, timedelta
 from typing import Dict, List, Optional, Tuple
 import logging
 import json
+from contextlib import contextmanager
 from decimal import Decimal
 
+try:
+    from src.audit_log_writer import audit_log_writer
+except ImportError:
+    # التشغيل المستقل من داخل مجلد src
+    from audit_log_writer import audit_log_writer
+
 # إعداد نظام السجلات
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -17,6 +24,19 @@ logger = logging.getLogger(__name__)
 class DebtManagementSystem:
     """نظام إدارة ديون الشركات"""
     
+    # أعمدة قوائم الديون: أيام الاستحقاق والتأخير تُحسب داخل SQL
+    # ولا يُقرأ products_json إلا في عرض التفاصيل
+    DEBT_LIST_COLUMNS = '''
+        cd.id, cd.company_id, cd.invoice_number, cd.invoice_date, cd.due_date,
+        cd.total_amount, cd.paid_amount, cd.remaining_amount, cd.status,
+        cd.description, cd.created_by, cd.created_at, cd.updated_at,
+        CAST(julianday(cd.due_date) - julianday(date('now', 'localtime')) AS INTEGER) as days_until_due,
+        cd.due_date < date('now', 'localtime') as is_overdue
+    '''
+    
+    # شرائح تقادم الديون حسب عدد أيام التأخير عن تاريخ الاستحقاق
+    AGING_BUCKETS = ['current', '1_30', '31_60', '61_90', '90_plus']
+    
     def __init__(self, db_path: str = "debts.sqlite"):
         """
         تهيئة نظام إدارة الديون
@@ -117,6 +137,44 @@ class DebtManagementSystem:
                 )
             ''')
             
+            # فهارس الاستحقاق وتقادم الديون
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_company_debts_status_due
+                ON company_debts (status, due_date)
+            ''')
+            
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_company_debts_company
+                ON company_debts (company_id, invoice_date)
+            ''')
+            
+            # جدول أرصدة الشركات المحسوبة مسبقاً
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS company_balances (
+                    company_id INTEGER PRIMARY KEY,
+                    total_debts INTEGER DEFAULT 0,
+                    total_amount DECIMAL(15,2) DEFAULT 0,
+                    paid_amount DECIMAL(15,2) DEFAULT 0,
+                    remaining_amount DECIMAL(15,2) DEFAULT 0,
+                    pending_debts INTEGER DEFAULT 0,
+                    overdue_debts INTEGER DEFAULT 0,
+                    oldest_due_date DATE,
+                    overdue_as_of DATE,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    FOREIGN KEY (company_id) REFERENCES companies (id)
+                )
+            ''')
+            
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_company_balances_remaining
+                ON company_balances (remaining_amount DESC)
+            ''')
+            
+            # بناء الأرصدة لقواعد البيانات الموجودة مسبقاً
+            cursor.execute('SELECT EXISTS (SELECT 1 FROM company_balances)')
+            if not cursor.fetchone()[0]:
+                self._rebuild_company_balances(cursor)
+            
             conn.commit()
             conn.close()
             
@@ -169,6 +227,29 @@ class DebtManagementSystem:
             logger.error(f"خطأ في إضافة الشركة: {str(e)}")
             raise
     
+    @contextmanager
+    def transaction(self):
+        """
+        وحدة عمل على اتصال واحد بقاعدة البيانات
+        
+        تُثبَّت جميع العمليات داخل الكتلة معاً عند نجاحها، ويُتراجع عنها كلها
+        عند حدوث أي خطأ.
+        
+        Yields:
+            اتصال قاعدة البيانات
+        """
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            # حجز قفل الكتابة من البداية لتجنب تعارض الترقية بين الاتصالات
+            conn.execute('BEGIN IMMEDIATE')
+            yield conn
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+    
     def create_debt(self, debt_data: Dict) -> int:
         """
         إنشاء دين جديد
@@ -180,46 +261,49 @@ class DebtManagementSystem:
             معرف الدين المُنشأ
         """
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            # حساب تاريخ الاستحقاق
-            invoice_date = datetime.strptime(debt_data['invoice_date'], '%Y-%m-%d')
-            
-            # الحصول على شروط الدفع للشركة
-            cursor.execute('SELECT payment_terms_days FROM companies WHERE id = ?', (debt_data['company_id'],))
-            company_result = cursor.fetchone()
-            payment_terms = company_result[0] if company_result else 30
-            
-            due_date = invoice_date + timedelta(days=payment_terms)
-            
-            # تحويل قائمة المنتجات إلى JSON
-            products_json = json.dumps(debt_data.get('products', []), ensure_ascii=False)
-            
-            cursor.execute('''
-                INSERT INTO company_debts (
-                    company_id, invoice_number, invoice_date, due_date,
-                    total_amount, remaining_amount, description, products_json, created_by
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                debt_data['company_id'],
-                debt_data['invoice_number'],
-                debt_data['invoice_date'],
-                due_date.strftime('%Y-%m-%d'),
-                debt_data['total_amount'],
-                debt_data['total_amount'],  # المبلغ المتبقي = المبلغ الكلي في البداية
-                debt_data.get('description', ''),
-                products_json,
-                debt_data.get('created_by')
-            ))
-            
-            debt_id = cursor.lastrowid
-            
-            # تسجيل التفاعل
-            self.log_debt_interaction(debt_id, 'debt_created', 'تم إنشاء دين جديد', debt_data.get('created_by'))
-            
-            conn.commit()
-            conn.close()
+            with self.transaction() as conn:
+                cursor = conn.cursor()
+                
+                # حساب تاريخ الاستحقاق
+                invoice_date = datetime.strptime(debt_data['invoice_date'], '%Y-%m-%d')
+                
+                # الحصول على شروط الدفع للشركة
+                cursor.execute('SELECT payment_terms_days FROM companies WHERE id = ?', (debt_data['company_id'],))
+                company_result = cursor.fetchone()
+                payment_terms = company_result[0] if company_result else 30
+                
+                due_date = invoice_date + timedelta(days=payment_terms)
+                
+                # تحويل قائمة المنتجات إلى JSON
+                products_json = json.dumps(debt_data.get('products', []), ensure_ascii=False)
+                
+                cursor.execute('''
+                    INSERT INTO company_debts (
+                        company_id, invoice_number, invoice_date, due_date,
+                        total_amount, remaining_amount, description, products_json, created_by
+                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ''', (
+                    debt_data['company_id'],
+                    debt_data['invoice_number'],
+                    debt_data['invoice_date'],
+                    due_date.strftime('%Y-%m-%d'),
+                    debt_data['total_amount'],
+                    debt_data['total_amount'],  # المبلغ المتبقي = المبلغ الكلي في البداية
+                    debt_data.get('description', ''),
+                    products_json,
+                    debt_data.get('created_by')
+                ))
+                
+                debt_id = cursor.lastrowid
+                
+                # تحديث رصيد الشركة
+                self._add_debt_to_balance(cursor, debt_data['company_id'],
+                                          float(debt_data['total_amount']),
+                                          due_date.strftime('%Y-%m-%d'))
+                
+                # تسجيل التفاعل ضمن نفس المعاملة
+                self.log_debt_interaction(debt_id, 'debt_created', 'تم إنشاء دين جديد',
+                                          debt_data.get('created_by'), conn=conn)
             
             logger.info(f"تم إنشاء دين جديد: {debt_data['invoice_number']}")
             return debt_id
@@ -228,6 +312,84 @@ class DebtManagementSystem:
             logger.error(f"خطأ في إنشاء الدين: {str(e)}")
             raise
     
+    def _apply_payment(self, conn: sqlite3.Connection, payment_data: Dict) -> int:
+        """
+        تطبيق دفعة واحدة على اتصال معاملة قائمة دون تثبيت
+        
+        Args:
+            conn: اتصال المعاملة الحالية
+            payment_data: بيانات الدفعة
+            
+        Returns:
+            معرف الدفعة المُسجلة
+        """
+        cursor = conn.cursor()
+        
+        # التحقق من وجود الدين
+        cursor.execute('''
+            SELECT remaining_amount, company_id, status, due_date
+            FROM company_debts WHERE id = ?
+        ''', (payment_data['debt_id'],))
+        debt_result = cursor.fetchone()
+        
+        if not debt_result:
+            raise ValueError("الدين غير موجود")
+        
+        remaining_amount = float(debt_result[0])
+        company_id, old_status, due_date = debt_result[1:]
+        payment_amount = float(payment_data['amount'])
+        
+        if payment_amount > remaining_amount:
+            raise ValueError("مبلغ الدفعة أكبر من المبلغ المتبقي")
+        
+        # تسجيل الدفعة
+        cursor.execute('''
+            INSERT INTO debt_payments (
+                debt_id, payment_date, amount, payment_method,
+                reference_number, notes, received_by
+            ) VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', (
+            payment_data['debt_id'],
+            payment_data.get('payment_date', datetime.now().strftime('%Y-%m-%d')),
+            payment_amount,
+            payment_data.get('payment_method', 'cash'),
+            payment_data.get('reference_number', ''),
+            payment_data.get('notes', ''),
+            payment_data.get('received_by')
+        ))
+        
+        payment_id = cursor.lastrowid
+        
+        # تحديث المبلغ المدفوع والمتبقي في الدين
+        cursor.execute('''
+            UPDATE company_debts 
+            SET paid_amount = paid_amount + ?,
+                remaining_amount = remaining_amount - ?,
+                status = CASE 
+                    WHEN remaining_amount - ? <= 0 THEN 'paid'
+                    ELSE 'partial'
+                END,
+                updated_at = ?
+            WHERE id = ?
+        ''', (payment_amount, payment_amount, payment_amount, 
+              datetime.now().isoformat(), payment_data['debt_id']))
+        
+        # تحديث رصيد الشركة
+        new_status = 'paid' if remaining_amount - payment_amount <= 0 else 'partial'
+        self._add_payment_to_balance(cursor, company_id, payment_amount,
+                                     old_status, new_status, due_date)
+        
+        # تسجيل التفاعل
+        self.log_debt_interaction(
+            payment_data['debt_id'], 
+            'payment_received', 
+            f"تم استلام دفعة بمبلغ {payment_amount:,.0f} دينار",
+            payment_data.get('received_by'),
+            conn=conn
+        )
+        
+        return payment_id
+    
     def record_payment(self, payment_data: Dict) -> int:
         """
         تسجيل دفعة
@@ -239,70 +401,38 @@ class DebtManagementSystem:
             معرف الدفعة المُسجلة
         """
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
+            with self.transaction() as conn:
+                payment_id = self._apply_payment(conn, payment_data)
             
-            # التحقق من وجود الدين
-            cursor.execute('SELECT remaining_amount FROM company_debts WHERE id = ?', (payment_data['debt_id'],))
-            debt_result = cursor.fetchone()
-            
-            if not debt_result:
-                raise ValueError("الدين غير موجود")
-            
-            remaining_amount = float(debt_result[0])
-            payment_amount = float(payment_data['amount'])
-            
-            if payment_amount > remaining_amount:
-                raise ValueError("مبلغ الدفعة أكبر من المبلغ المتبقي")
-            
-            # تسجيل الدفعة
-            cursor.execute('''
-                INSERT INTO debt_payments (
-                    debt_id, payment_date, amount, payment_method,
-                    reference_number, notes, received_by
-                ) VALUES (?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                payment_data['debt_id'],
-                payment_data.get('payment_date', datetime.now().strftime('%Y-%m-%d')),
-                payment_amount,
-                payment_data.get('payment_method', 'cash'),
-                payment_data.get('reference_number', ''),
-                payment_data.get('notes', ''),
-                payment_data.get('received_by')
-            ))
-            
-            payment_id = cursor.lastrowid
+            logger.info(f"تم تسجيل دفعة بمبلغ {float(payment_data['amount']):,.0f} دينار")
+            return payment_id
             
-            # تحديث المبلغ المدفوع والمتبقي في الدين
-            cursor.execute('''
-                UPDATE company_debts 
-                SET paid_amount = paid_amount + ?,
-                    remaining_amount = remaining_amount - ?,
-                    status = CASE 
-                        WHEN remaining_amount - ? <= 0 THEN 'paid'
-                        ELSE 'partial'
-                    END,
-                    updated_at = ?
-                WHERE id = ?
-            ''', (payment_amount, payment_amount, payment_amount, 
-                  datetime.now().isoformat(), payment_data['debt_id']))
-            
-            # تسجيل التفاعل
-            self.log_debt_interaction(
-                payment_data['debt_id'], 
-                'payment_received', 
-                f"تم استلام دفعة بمبلغ {payment_amount:,.0f} دينار",
-                payment_data.get('received_by')
-            )
+        except Exception as e:
+            logger.error(f"خطأ في تسجيل الدفعة: {str(e)}")
+            raise
+    
+    def record_payments(self, payments: List[Dict]) -> List[int]:
+        """
+        تسجيل مجموعة دفعات في معاملة واحدة
+        
+        إذا فشلت أي دفعة يُتراجع عن المجموعة كاملة.
+        
+        Args:
+            payments: قائمة بيانات الدفعات
             
-            conn.commit()
-            conn.close()
+        Returns:
+            قائمة معرفات الدفعات المُسجلة بنفس الترتيب
+        """
+        try:
+            with self.transaction() as conn:
+                payment_ids = [self._apply_payment(conn, payment_data) for payment_data in payments]
             
-            logger.info(f"تم تسجيل دفعة بمبلغ {payment_amount:,.0f} دينار")
-            return payment_id
+            total_amount = sum(float(payment_data['amount']) for payment_data in payments)
+            logger.info(f"تم تسجيل {len(payment_ids)} دفعة بمبلغ إجمالي {total_amount:,.0f} دينار")
+            return payment_ids
             
         except Exception as e:
-            logger.error(f"خطأ في تسجيل الدفعة: {str(e)}")
+            logger.error(f"خطأ في تسجيل الدفعات: {str(e)}")
             raise
     
     def get_company_debts(self, company_id: int, status: str = None) -> List[Dict]:
@@ -320,8 +450,8 @@ class DebtManagementSystem:
             conn = sqlite3.connect(self.db_path)
             cursor = conn.cursor()
             
-            query = '''
-                SELECT cd.*, c.name as company_name
+            query = f'''
+                SELECT {self.DEBT_LIST_COLUMNS}, c.name as company_name
                 FROM company_debts cd
                 JOIN companies c ON cd.company_id = c.id
                 WHERE cd.company_id = ?
@@ -339,30 +469,7 @@ class DebtManagementSystem:
             
             conn.close()
             
-            columns = [desc[0] for desc in cursor.description]
-            debts = []
-            
-            for row in rows:
-                debt = dict(zip(columns, row))
-                
-                # تحويل JSON المنتجات إلى قائمة
-                if debt['products_json']:
-                    try:
-                        debt['products'] = json.loads(debt['products_json'])
-                    except:
-                        debt['products'] = []
-                else:
-                    debt['products'] = []
-                
-                # حساب الأيام المتبقية للاستحقاق
-                due_date = datetime.strptime(debt['due_date'], '%Y-%m-%d')
-                today = datetime.now()
-                debt['days_until_due'] = (due_date - today).days
-                debt['is_overdue'] = debt['days_until_due'] < 0
-                
-                debts.append(debt)
-            
-            return debts
+            return self._rows_to_debts(cursor, rows)
             
         except Exception as e:
             logger.error(f"خطأ في الحصول على ديون الشركة: {str(e)}")
@@ -383,8 +490,8 @@ class DebtManagementSystem:
             conn = sqlite3.connect(self.db_path)
             cursor = conn.cursor()
             
-            query = '''
-                SELECT cd.*, c.name as company_name, c.contact_person, c.phone
+            query = f'''
+                SELECT {self.DEBT_LIST_COLUMNS}, c.name as company_name, c.contact_person, c.phone
                 FROM company_debts cd
                 JOIN companies c ON cd.company_id = c.id
                 WHERE 1=1
@@ -396,7 +503,7 @@ class DebtManagementSystem:
                 params.append(status)
             
             if overdue_only:
-                query += ' AND cd.due_date < date("now")'
+                query += " AND cd.due_date < date('now', 'localtime')"
             
             query += ' ORDER BY cd.due_date ASC'
             
@@ -405,34 +512,80 @@ class DebtManagementSystem:
             
             conn.close()
             
-            columns = [desc[0] for desc in cursor.description]
-            debts = []
+            return self._rows_to_debts(cursor, rows)
             
-            for row in rows:
-                debt = dict(zip(columns, row))
-                
-                # تحويل JSON المنتجات إلى قائمة
-                if debt['products_json']:
-                    try:
-                        debt['products'] = json.loads(debt['products_json'])
-                    except:
-                        debt['products'] = []
-                else:
+        except Exception as e:
+            logger.error(f"خطأ في الحصول على الديون: {str(e)}")
+            return []
+    
+    def _rows_to_debts(self, cursor, rows) -> List[Dict]:
+        """
+        تحويل صفوف قوائم الديون إلى قواميس
+        
+        Args:
+            cursor: مؤشر الاستعلام المنفذ
+            rows: الصفوف المسترجعة
+            
+        Returns:
+            قائمة بالديون
+        """
+        columns = [desc[0] for desc in cursor.description]
+        debts = []
+        
+        for row in rows:
+            debt = dict(zip(columns, row))
+            debt['is_overdue'] = bool(debt['is_overdue'])
+            debts.append(debt)
+        
+        return debts
+    
+    def get_debt_details(self, debt_id: int) -> Optional[Dict]:
+        """
+        الحصول على تفاصيل دين معين مع المنتجات والدفعات
+        
+        Args:
+            debt_id: معرف الدين
+            
+        Returns:
+            بيانات الدين أو None
+        """
+        try:
+            conn = sqlite3.connect(self.db_path)
+            cursor = conn.cursor()
+            
+            cursor.execute(f'''
+                SELECT {self.DEBT_LIST_COLUMNS}, cd.products_json,
+                       c.name as company_name, c.contact_person, c.phone
+                FROM company_debts cd
+                JOIN companies c ON cd.company_id = c.id
+                WHERE cd.id = ?
+            ''', (debt_id,))
+            
+            rows = cursor.fetchall()
+            conn.close()
+            
+            if not rows:
+                return None
+            
+            debt = self._rows_to_debts(cursor, rows)[0]
+            
+            # تحويل JSON المنتجات إلى قائمة
+            products_json = debt.pop('products_json')
+            if products_json:
+                try:
+                    debt['products'] = json.loads(products_json)
+                except:
                     debt['products'] = []
-                
-                # حساب الأيام المتبقية للاستحقاق
-                due_date = datetime.strptime(debt['due_date'], '%Y-%m-%d')
-                today = datetime.now()
-                debt['days_until_due'] = (due_date - today).days
-                debt['is_overdue'] = debt['days_until_due'] < 0
-                
-                debts.append(debt)
+            else:
+                debt['products'] = []
+            
+            debt['payments'] = self.get_debt_payments(debt_id)
             
-            return debts
+            return debt
             
         except Exception as e:
-            logger.error(f"خطأ في الحصول على الديون: {str(e)}")
-            return []
+            logger.error(f"خطأ في الحصول على تفاصيل الدين: {str(e)}")
+            return None
     
     def get_debt_payments(self, debt_id: int) -> List[Dict]:
         """
@@ -480,8 +633,8 @@ class DebtManagementSystem:
             conn = sqlite3.connect(self.db_path)
             cursor = conn.cursor()
             
-            query = '''
-                SELECT cd.*, c.name as company_name, c.contact_person, c.phone
+            query = f'''
+                SELECT {self.DEBT_LIST_COLUMNS}, c.name as company_name, c.contact_person, c.phone
                 FROM company_debts cd
                 JOIN companies c ON cd.company_id = c.id
                 WHERE 1=1
@@ -523,35 +676,158 @@ class DebtManagementSystem:
             
             conn.close()
             
-            columns = [desc[0] for desc in cursor.description]
-            debts = []
-            
-            for row in rows:
-                debt = dict(zip(columns, row))
-                
-                # تحويل JSON المنتجات إلى قائمة
-                if debt['products_json']:
-                    try:
-                        debt['products'] = json.loads(debt['products_json'])
-                    except:
-                        debt['products'] = []
-                else:
-                    debt['products'] = []
-                
-                # حساب الأيام المتبقية للاستحقاق
-                due_date = datetime.strptime(debt['due_date'], '%Y-%m-%d')
-                today = datetime.now()
-                debt['days_until_due'] = (due_date - today).days
-                debt['is_overdue'] = debt['days_until_due'] < 0
-                
-                debts.append(debt)
-            
-            return debts
+            return self._rows_to_debts(cursor, rows)
             
         except Exception as e:
             logger.error(f"خطأ في البحث في الديون: {str(e)}")
             return []
     
+    def _rebuild_company_balances(self, cursor):
+        """
+        إعادة بناء جدول أرصدة الشركات بالكامل من جدول الديون
+        
+        Args:
+            cursor: مؤشر معاملة قائمة
+        """
+        today = datetime.now().strftime('%Y-%m-%d')
+        
+        cursor.execute('DELETE FROM company_balances')
+        cursor.execute('''
+            INSERT INTO company_balances (
+                company_id, total_debts, total_amount, paid_amount, remaining_amount,
+                pending_debts, overdue_debts, oldest_due_date, overdue_as_of, updated_at
+            )
+            SELECT 
+                company_id,
+                COUNT(*),
+                COALESCE(SUM(total_amount), 0),
+                COALESCE(SUM(paid_amount), 0),
+                COALESCE(SUM(remaining_amount), 0),
+                COUNT(CASE WHEN status = 'pending' THEN 1 END),
+                COUNT(CASE WHEN due_date < ? AND status IN ('pending', 'partial') THEN 1 END),
+                MIN(CASE WHEN status IN ('pending', 'partial') THEN due_date END),
+                ?,
+                ?
+            FROM company_debts
+            GROUP BY company_id
+        ''', (today, today, datetime.now().isoformat()))
+    
+    def _add_debt_to_balance(self, cursor, company_id: int, amount: float, due_date: str):
+        """
+        إضافة دين جديد إلى رصيد الشركة
+        
+        Args:
+            cursor: مؤشر معاملة قائمة
+            company_id: معرف الشركة
+            amount: مبلغ الدين
+            due_date: تاريخ الاستحقاق
+        """
+        today = datetime.now().strftime('%Y-%m-%d')
+        
+        cursor.execute('''
+            INSERT INTO company_balances (
+                company_id, total_debts, total_amount, paid_amount, remaining_amount,
+                pending_debts, overdue_debts, oldest_due_date, overdue_as_of, updated_at
+            ) VALUES (?, 1, ?, 0, ?, 1, ?, ?, ?, ?)
+            ON CONFLICT (company_id) DO UPDATE SET
+                total_debts = total_debts + 1,
+                total_amount = total_amount + excluded.total_amount,
+                remaining_amount = remaining_amount + excluded.remaining_amount,
+                pending_debts = pending_debts + 1,
+                overdue_debts = overdue_debts + (excluded.oldest_due_date < overdue_as_of),
+                oldest_due_date = CASE
+                    WHEN oldest_due_date IS NULL OR excluded.oldest_due_date < oldest_due_date
+                    THEN excluded.oldest_due_date
+                    ELSE oldest_due_date
+                END,
+                updated_at = excluded.updated_at
+        ''', (company_id, amount, amount, int(due_date < today), due_date, today,
+              datetime.now().isoformat()))
+    
+    def _add_payment_to_balance(self, cursor, company_id: int, amount: float,
+                                old_status: str, new_status: str, due_date: str):
+        """
+        تطبيق دفعة على رصيد الشركة
+        
+        Args:
+            cursor: مؤشر معاملة قائمة
+            company_id: معرف الشركة
+            amount: مبلغ الدفعة
+            old_status: حالة الدين قبل الدفعة
+            new_status: حالة الدين بعد الدفعة
+            due_date: تاريخ استحقاق الدين
+        """
+        settled = new_status == 'paid' and old_status != 'paid'
+        
+        cursor.execute('''
+            UPDATE company_balances
+            SET paid_amount = paid_amount + ?,
+                remaining_amount = remaining_amount - ?,
+                pending_debts = pending_debts - ?,
+                overdue_debts = overdue_debts - (? AND ? < overdue_as_of),
+                updated_at = ?
+            WHERE company_id = ?
+        ''', (amount, amount, int(old_status == 'pending'), int(settled), due_date,
+              datetime.now().isoformat(), company_id))
+        
+        # أقدم استحقاق مفتوح يتغير فقط عند إغلاق دين بالكامل
+        if settled:
+            cursor.execute('''
+                UPDATE company_balances
+                SET oldest_due_date = (
+                    SELECT MIN(due_date) FROM company_debts
+                    WHERE company_id = ? AND status IN ('pending', 'partial')
+                )
+                WHERE company_id = ?
+            ''', (company_id, company_id))
+    
+    def refresh_overdue_balances(self) -> int:
+        """
+        تحديث أعداد الديون المتأخرة في أرصدة الشركات (مسح يومي)
+        
+        يُعاد الحساب فقط للأرصدة التي لم تُحدَّث اليوم. يُفحص ذلك أولاً بقراءة
+        فقط، فلا يُحجز قفل الكتابة إلا في أول استدعاء من كل يوم (أو بعد إضافة
+        شركة لم يُحسب رصيدها)، وباقي الاستدعاءات استعلام قراءة واحد.
+        
+        Returns:
+            عدد الشركات التي تم تحديثها
+        """
+        try:
+            today = datetime.now().strftime('%Y-%m-%d')
+            
+            conn = sqlite3.connect(self.db_path)
+            stale = conn.execute('''
+                SELECT 1 FROM company_balances
+                WHERE overdue_as_of IS NULL OR overdue_as_of < ?
+                LIMIT 1
+            ''', (today,)).fetchone()
+            conn.close()
+            
+            if not stale:
+                return 0
+            
+            with self.transaction() as conn:
+                cursor = conn.execute('''
+                    UPDATE company_balances
+                    SET overdue_debts = (
+                            SELECT COUNT(*) FROM company_debts cd
+                            WHERE cd.company_id = company_balances.company_id
+                            AND cd.status IN ('pending', 'partial')
+                            AND cd.due_date < ?
+                        ),
+                        overdue_as_of = ?
+                    WHERE overdue_as_of IS NULL OR overdue_as_of < ?
+                ''', (today, today, today))
+                updated = cursor.rowcount
+            
+            if updated:
+                logger.info(f"تم تحديث الديون المتأخرة لـ {updated} شركة")
+            return updated
+            
+        except Exception as e:
+            logger.error(f"خطأ في تحديث الديون المتأخرة: {str(e)}")
+            return 0
+    
     def get_companies_summary(self) -> List[Dict]:
         """
         الحصول على ملخص ديون الشركات
@@ -560,6 +836,8 @@ class DebtManagementSystem:
             قائمة بملخص ديون كل شركة
         """
         try:
+            self.refresh_overdue_balances()
+            
             conn = sqlite3.connect(self.db_path)
             cursor = conn.cursor()
             
@@ -569,18 +847,18 @@ class DebtManagementSystem:
                     c.name,
                     c.contact_person,
                     c.phone,
-                    COUNT(cd.id) as total_debts,
-                    COALESCE(SUM(cd.total_amount), 0) as total_amount,
-                    COALESCE(SUM(cd.paid_amount), 0) as paid_amount,
-                    COALESCE(SUM(cd.remaining_amount), 0) as remaining_amount,
-                    COUNT(CASE WHEN cd.status = 'pending' THEN 1 END) as pending_debts,
-                    COUNT(CASE WHEN cd.due_date < date('now') AND cd.status != 'paid' THEN 1 END) as overdue_debts
-                FROM companies c
-                LEFT JOIN company_debts cd ON c.id = cd.company_id
+                    b.total_debts,
+                    b.total_amount,
+                    b.paid_amount,
+                    b.remaining_amount,
+                    b.pending_debts,
+                    b.overdue_debts,
+                    b.oldest_due_date
+                FROM company_balances b
+                JOIN companies c ON b.company_id = c.id
                 WHERE c.is_active = 1
-                GROUP BY c.id, c.name, c.contact_person, c.phone
-                HAVING total_debts > 0 OR remaining_amount > 0
-                ORDER BY remaining_amount DESC
+                AND (b.total_debts > 0 OR b.remaining_amount > 0)
+                ORDER BY b.remaining_amount DESC
             ''')
             
             rows = cursor.fetchall()
@@ -595,7 +873,91 @@ class DebtManagementSystem:
             logger.error(f"خطأ في الحصول على ملخص الشركات: {str(e)}")
             return []
     
-    def log_debt_interaction(self, debt_id: int, interaction_type: str, description: str, user_id: int = None):
+    def get_debt_aging_report(self, as_of: str = None) -> Dict:
+        """
+        تقرير تقادم الديون المفتوحة حسب الشرائح الزمنية لكل شركة وللإجمالي
+        
+        الشرائح: غير مستحق بعد، 1-30، 31-60، 61-90، أكثر من 90 يوماً.
+        يُحسب كاملاً داخل SQL عبر الفهرس (status, due_date).
+        
+        Args:
+            as_of: تاريخ التقرير بصيغة YYYY-MM-DD (افتراضياً اليوم)
+            
+        Returns:
+            تقرير التقادم
+        """
+        try:
+            as_of = as_of or datetime.now().strftime('%Y-%m-%d')
+            
+            days_overdue = "julianday(?) - julianday(cd.due_date)"
+            bucket_columns = f'''
+                COUNT(*) as open_debts,
+                COALESCE(SUM(cd.remaining_amount), 0) as remaining_amount,
+                COALESCE(SUM(CASE WHEN {days_overdue} <= 0 THEN cd.remaining_amount END), 0) as bucket_current,
+                COALESCE(SUM(CASE WHEN {days_overdue} BETWEEN 1 AND 30 THEN cd.remaining_amount END), 0) as bucket_1_30,
+                COALESCE(SUM(CASE WHEN {days_overdue} BETWEEN 31 AND 60 THEN cd.remaining_amount END), 0) as bucket_31_60,
+                COALESCE(SUM(CASE WHEN {days_overdue} BETWEEN 61 AND 90 THEN cd.remaining_amount END), 0) as bucket_61_90,
+                COALESCE(SUM(CASE WHEN {days_overdue} > 90 THEN cd.remaining_amount END), 0) as bucket_90_plus
+            '''
+            bucket_params = [as_of] * 5
+            
+            conn = sqlite3.connect(self.db_path)
+            cursor = conn.cursor()
+            
+            # التقادم لكل شركة
+            cursor.execute(f'''
+                SELECT cd.company_id, c.name as company_name, {bucket_columns}
+                FROM company_debts cd
+                JOIN companies c ON cd.company_id = c.id
+                WHERE cd.status IN ('pending', 'partial')
+                GROUP BY cd.company_id, c.name
+                ORDER BY remaining_amount DESC
+            ''', bucket_params)
+            
+            company_rows = cursor.fetchall()
+            company_columns = [desc[0] for desc in cursor.description]
+            
+            # الإجمالي العام
+            cursor.execute(f'''
+                SELECT {bucket_columns}
+                FROM company_debts cd
+                WHERE cd.status IN ('pending', 'partial')
+            ''', bucket_params)
+            
+            total_row = cursor.fetchone()
+            total_columns = [desc[0] for desc in cursor.description]
+            
+            conn.close()
+            
+            def to_aging(row: Dict) -> Dict:
+                return {
+                    'open_debts': row['open_debts'],
+                    'remaining_amount': float(row['remaining_amount']),
+                    'buckets': {
+                        bucket: float(row[f'bucket_{bucket}']) for bucket in self.AGING_BUCKETS
+                    }
+                }
+            
+            companies = []
+            for row in company_rows:
+                row = dict(zip(company_columns, row))
+                company = {'company_id': row['company_id'], 'company_name': row['company_name']}
+                company.update(to_aging(row))
+                companies.append(company)
+            
+            return {
+                'as_of': as_of,
+                'companies': companies,
+                'total': to_aging(dict(zip(total_columns, total_row))),
+                'generated_at': datetime.now().isoformat()
+            }
+            
+        except Exception as e:
+            logger.error(f"خطأ في إنشاء تقرير تقادم الديون: {str(e)}")
+            return {}
+    
+    def log_debt_interaction(self, debt_id: int, interaction_type: str, description: str, user_id: int = None,
+                             conn: sqlite3.Connection = None):
         """
         تسجيل تفاعل مع الدين
         
@@ -604,18 +966,24 @@ class DebtManagementSystem:
             interaction_type: نوع التفاعل
             description: وصف التفاعل
             user_id: معرف المستخدم
+            conn: اتصال معاملة قائمة (اختياري)؛ عند تمريره يُكتب السجل
+                  ضمنها ويُثبَّت معها، وإلا يُضاف إلى كاتب السجلات المشترك
         """
-        try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute('''
+        if conn is not None:
+            conn.execute('''
                 INSERT INTO debt_interactions (debt_id, interaction_type, description, user_id)
                 VALUES (?, ?, ?, ?)
             ''', (debt_id, interaction_type, description, user_id))
-            
-            conn.commit()
-            conn.close()
+            return
+        
+        try:
+            audit_log_writer.write(self.db_path, 'debt_interactions', {
+                'debt_id': debt_id,
+                'interaction_type': interaction_type,
+                'description': description,
+                'user_id': user_id,
+                'created_at': audit_log_writer.current_timestamp()
+            })
             
         except Exception as e:
             logger.error(f"خطأ في تسجيل التفاعل: {str(e)}")
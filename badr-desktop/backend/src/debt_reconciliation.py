@@ -0,0 +1,548 @@
+"""
+نظام مطابقة كشوفات الحساب مع ديون الشركات لبرنامج البدر للإنارة
+يستورد كشف البنك أو دفتر الصندوق (CSV) ويطابق كل سطر مع الديون المفتوحة
+"""
+
+import csv
+import json
+import re
+import sqlite3
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+import logging
+
+# إعداد نظام السجلات
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+class DebtReconciliation:
+    """محرك مطابقة دفعات الشركات مع الديون المفتوحة"""
+    
+    # أسماء الأعمدة الافتراضية في ملف CSV
+    DEFAULT_COLUMNS = {
+        'date': 'date',
+        'amount': 'amount',
+        'reference': 'reference',
+        'description': 'description'
+    }
+    
+    DATE_FORMATS = ['%Y-%m-%d', '%d/%m/%Y', '%Y/%m/%d', '%d-%m-%Y']
+    
+    # الرموز المرشحة لأن تكون رقم فاتورة داخل المرجع أو الوصف
+    TOKEN_PATTERN = re.compile(r'[A-Za-z0-9][A-Za-z0-9\-/_.]*')
+    
+    def __init__(self, debt_system, date_window_days: int = 30):
+        """
+        تهيئة محرك المطابقة
+        
+        Args:
+            debt_system: نظام إدارة الديون (DebtManagementSystem)
+            date_window_days: عدد الأيام المسموح بها بعد الاستحقاق عند المطابقة بالمبلغ
+        """
+        self.debt_system = debt_system
+        self.db_path = debt_system.db_path
+        self.date_window_days = date_window_days
+        self.init_database()
+    
+    def init_database(self):
+        """إنشاء جدول قائمة المراجعة"""
+        try:
+            conn = sqlite3.connect(self.db_path)
+            cursor = conn.cursor()
+            
+            # جدول الأسطر غير المطابقة بانتظار المراجعة اليدوية
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS reconciliation_queue (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    batch_id TEXT NOT NULL,
+                    line_number INTEGER,
+                    line_date DATE,
+                    amount DECIMAL(15,2),
+                    reference TEXT,
+                    description TEXT,
+                    reason TEXT NOT NULL,
+                    candidate_debt_ids TEXT,
+                    raw_json TEXT,
+                    status TEXT DEFAULT 'open',
+                    resolved_payment_id INTEGER,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    resolved_at TIMESTAMP
+                )
+            ''')
+            
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_reconciliation_queue_status
+                ON reconciliation_queue (status, created_at)
+            ''')
+            
+            conn.commit()
+            conn.close()
+        
+        except Exception as e:
+            logger.error(f"خطأ في إنشاء جدول المطابقة: {str(e)}")
+            raise
+    
+    @staticmethod
+    def normalize_reference(value: str) -> str:
+        """توحيد رقم الفاتورة أو المرجع للمقارنة (أحرف كبيرة وأرقام فقط)"""
+        return re.sub(r'[^A-Z0-9]', '', (value or '').upper())
+    
+    def parse_amount(self, value) -> Optional[float]:
+        """
+        تحويل نص المبلغ إلى رقم (يدعم الفواصل والإشارات)
+        
+        تُحفظ الإشارة لأنها تحدد اتجاه الحركة: المبلغ السالب أو بين قوسين خصم من
+        الحساب، والموجب إيداع فيه.
+        """
+        if value is None:
+            return None
+        
+        text = str(value).strip().replace(',', '').replace(' ', '')
+        if text.startswith('(') and text.endswith(')'):
+            text = '-' + text[1:-1]
+        
+        try:
+            return float(text)
+        except ValueError:
+            return None
+    
+    def parse_date(self, value) -> Optional[str]:
+        """تحويل نص التاريخ إلى الصيغة YYYY-MM-DD"""
+        text = (value or '').strip()
+        
+        for date_format in self.DATE_FORMATS:
+            try:
+                return datetime.strptime(text, date_format).strftime('%Y-%m-%d')
+            except ValueError:
+                continue
+        
+        return None
+    
+    def read_statement(self, csv_path: str, columns: Dict = None,
+                       encoding: str = 'utf-8-sig') -> List[Dict]:
+        """
+        قراءة ملف كشف الحساب
+        
+        Args:
+            csv_path: مسار ملف CSV
+            columns: ربط الحقول (date, amount, reference, description) بأسماء الأعمدة
+            encoding: ترميز الملف
+        
+        Returns:
+            قائمة أسطر الكشف
+        """
+        columns = {**self.DEFAULT_COLUMNS, **(columns or {})}
+        lines = []
+        
+        with open(csv_path, 'r', encoding=encoding, newline='') as f:
+            reader = csv.DictReader(f)
+            
+            for line_number, row in enumerate(reader, start=2):
+                lines.append({
+                    'line_number': line_number,
+                    'date': self.parse_date(row.get(columns['date'])),
+                    'amount': self.parse_amount(row.get(columns['amount'])),
+                    'reference': (row.get(columns['reference']) or '').strip(),
+                    'description': (row.get(columns['description']) or '').strip(),
+                    'raw': row
+                })
+        
+        return lines
+    
+    def load_open_debts(self) -> Tuple[Dict[str, List[Dict]], Dict[float, List[Dict]]]:
+        """
+        تحميل الديون المفتوحة وبناء فهارس المطابقة في الذاكرة
+        
+        Returns:
+            (فهرس أرقام الفواتير، فهرس المبالغ المتبقية)
+        """
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        
+        cursor.execute('''
+            SELECT id, company_id, invoice_number, invoice_date, due_date, remaining_amount
+            FROM company_debts
+            WHERE status IN ('pending', 'partial')
+        ''')
+        
+        rows = cursor.fetchall()
+        conn.close()
+        
+        by_invoice = {}
+        by_amount = {}
+        
+        for row in rows:
+            debt = {
+                'id': row[0],
+                'company_id': row[1],
+                'invoice_number': row[2],
+                'invoice_date': row[3],
+                'due_date': row[4],
+                'remaining_amount': float(row[5])
+            }
+            
+            by_invoice.setdefault(self.normalize_reference(debt['invoice_number']), []).append(debt)
+            by_amount.setdefault(round(debt['remaining_amount'], 2), []).append(debt)
+        
+        return by_invoice, by_amount
+    
+    def load_existing_references(self) -> set:
+        """مفاتيح الدفعات المسجلة سابقاً (المرجع، المبلغ، التاريخ) لتجنب الاستيراد المكرر"""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        
+        cursor.execute('''
+            SELECT reference_number, amount, payment_date
+            FROM debt_payments
+            WHERE reference_number IS NOT NULL AND reference_number != ''
+        ''')
+        
+        existing = {
+            (self.normalize_reference(row[0]), round(float(row[1]), 2), row[2])
+            for row in cursor.fetchall()
+        }
+        conn.close()
+        
+        return existing
+    
+    def match_line(self, line: Dict, by_invoice: Dict, by_amount: Dict,
+                   remaining: Dict[int, float]) -> Tuple[Optional[Dict], str, List[int]]:
+        """
+        مطابقة سطر واحد مع الديون المفتوحة
+        
+        الأولوية لرقم الفاتورة المذكور في المرجع أو الوصف، ثم المبلغ المتبقي
+        ضمن نافذة زمنية بين تاريخ الفاتورة وتاريخ الاستحقاق + date_window_days.
+        
+        Args:
+            line: سطر الكشف
+            by_invoice: فهرس أرقام الفواتير
+            by_amount: فهرس المبالغ المتبقية
+            remaining: المبالغ المتبقية الحالية لكل دين (تُحدَّث أثناء الدفعة)
+        
+        Returns:
+            (الدين المطابق أو None، سبب عدم المطابقة أو نوعها، معرفات الديون المرشحة)
+        """
+        amount = line['amount']
+        
+        # المطابقة برقم الفاتورة
+        candidates = {}
+        for text in (line['reference'], line['description']):
+            tokens = self.TOKEN_PATTERN.findall(text or '')
+            # الرموز المتجاورة أيضاً، مثل "INV 00123"
+            pairs = [first + second for first, second in zip(tokens, tokens[1:])]
+            
+            for token in [text] + tokens + pairs:
+                key = self.normalize_reference(token)
+                if key and any(ch.isdigit() for ch in key):
+                    for debt in by_invoice.get(key, []):
+                        candidates[debt['id']] = debt
+        
+        if candidates:
+            fitting = [debt for debt in candidates.values() if amount <= remaining[debt['id']] + 0.005]
+            if len(fitting) == 1:
+                return fitting[0], 'invoice', [fitting[0]['id']]
+            if not fitting:
+                return None, 'amount_exceeds_remaining', list(candidates)
+            return None, 'ambiguous_invoice', [debt['id'] for debt in fitting]
+        
+        # المطابقة بالمبلغ والنافذة الزمنية
+        if line['date']:
+            line_date = datetime.strptime(line['date'], '%Y-%m-%d')
+            window = timedelta(days=self.date_window_days)
+            
+            fitting = [
+                debt for debt in by_amount.get(round(amount, 2), [])
+                if abs(remaining[debt['id']] - amount) < 0.005
+                and debt['invoice_date'] <= line['date']
+                and line_date <= datetime.strptime(debt['due_date'], '%Y-%m-%d') + window
+            ]
+            
+            if len(fitting) == 1:
+                return fitting[0], 'amount_date', [fitting[0]['id']]
+            if len(fitting) > 1:
+                return None, 'ambiguous_amount', [debt['id'] for debt in fitting]
+        
+        return None, 'no_match', []
+    
+    def reconcile_statement(self, csv_path: str, columns: Dict = None,
+                            payment_method: str = 'bank_transfer', received_by: int = None,
+                            dry_run: bool = False, outgoing_sign: int = -1) -> Dict:
+        """
+        مطابقة كشف حساب كامل وتسجيل الدفعات المطابقة في معاملة واحدة
+        
+        الدفعات الخارجة فقط تُطابق مع ديون الشركات؛ المبالغ الداخلة (إيداعات
+        ومرتجعات) تُتجاهل حتى لا تُسجل دفعةً على دين مورد. الأسطر غير المطابقة
+        تُضاف إلى قائمة المراجعة.
+        
+        Args:
+            csv_path: مسار ملف CSV
+            columns: ربط أسماء الأعمدة
+            payment_method: طريقة الدفع المسجلة للدفعات
+            received_by: معرف المستخدم المستلم
+            dry_run: المطابقة فقط دون تسجيل أي شيء
+            outgoing_sign: إشارة المبالغ الخارجة في الكشف (-1 لكشف البنك حيث الدفعات
+                بالسالب، 1 لدفتر صندوق يسجل المصروفات بالموجب)
+        
+        Returns:
+            ملخص عملية المطابقة
+        """
+        try:
+            start_time = time.time()
+            batch_id = uuid.uuid4().hex[:12]
+            
+            lines = self.read_statement(csv_path, columns)
+            by_invoice, by_amount = self.load_open_debts()
+            existing = self.load_existing_references()
+            
+            remaining = {
+                debt['id']: debt['remaining_amount']
+                for debts in by_invoice.values() for debt in debts
+            }
+            
+            payments = []
+            matches = []
+            review = []
+            duplicates = 0
+            incoming = 0
+            
+            for line in lines:
+                if line['amount'] and line['amount'] * outgoing_sign < 0:
+                    incoming += 1
+                    continue
+                
+                if not line['amount'] or not line['date']:
+                    review.append((line, 'invalid_line', []))
+                    continue
+                
+                # بعد تحديد الاتجاه يُطابق المبلغ ويُسجل كقيمة موجبة
+                line['amount'] = abs(line['amount'])
+                
+                key = (self.normalize_reference(line['reference']), round(line['amount'], 2), line['date'])
+                if key[0] and key in existing:
+                    duplicates += 1
+                    continue
+                
+                debt, reason, candidate_ids = self.match_line(line, by_invoice, by_amount, remaining)
+                
+                if not debt:
+                    review.append((line, reason, candidate_ids))
+                    continue
+                
+                remaining[debt['id']] -= line['amount']
+                existing.add(key)
+                
+                payments.append({
+                    'debt_id': debt['id'],
+                    'amount': line['amount'],
+                    'payment_date': line['date'],
+                    'payment_method': payment_method,
+                    'reference_number': line['reference'],
+                    'notes': f"مطابقة كشف حساب ({batch_id}) سطر {line['line_number']}",
+                    'received_by': received_by
+                })
+                matches.append({
+                    'line_number': line['line_number'],
+                    'debt_id': debt['id'],
+                    'invoice_number': debt['invoice_number'],
+                    'amount': line['amount'],
+                    'match_type': reason
+                })
+            
+            payment_ids = []
+            if not dry_run:
+                if payments:
+                    payment_ids = self.debt_system.record_payments(payments)
+                if review:
+                    self.queue_for_review(batch_id, review)
+            
+            summary = {
+                'batch_id': batch_id,
+                'total_lines': len(lines),
+                'matched': len(matches),
+                'matched_amount': sum(payment['amount'] for payment in payments),
+                'duplicates': duplicates,
+                'ignored_incoming': incoming,
+                'queued_for_review': len(review),
+                'payment_ids': payment_ids,
+                'matches': matches,
+                'dry_run': dry_run,
+                'elapsed_seconds': round(time.time() - start_time, 3)
+            }
+            
+            logger.info(f"تمت مطابقة {len(matches)} من {len(lines)} سطر، "
+                        f"و{len(review)} سطر بانتظار المراجعة")
+            return summary
+        
+        except Exception as e:
+            logger.error(f"خطأ في مطابقة كشف الحساب: {str(e)}")
+            raise
+    
+    def queue_for_review(self, batch_id: str, review: List[Tuple[Dict, str, List[int]]]):
+        """
+        إضافة الأسطر غير المطابقة إلى قائمة المراجعة
+        
+        Args:
+            batch_id: معرف دفعة الاستيراد
+            review: قائمة (السطر، السبب، الديون المرشحة)
+        """
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        
+        cursor.executemany('''
+            INSERT INTO reconciliation_queue (
+                batch_id, line_number, line_date, amount, reference, description,
+                reason, candidate_debt_ids, raw_json
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', [
+            (
+                batch_id,
+                line['line_number'],
+                line['date'],
+                line['amount'],
+                line['reference'],
+                line['description'],
+                reason,
+                json.dumps(candidate_ids),
+                json.dumps(line['raw'], ensure_ascii=False)
+            ) for line, reason, candidate_ids in review
+        ])
+        
+        conn.commit()
+        conn.close()
+    
+    def get_review_queue(self, status: str = 'open', limit: int = 100) -> List[Dict]:
+        """
+        الحصول على أسطر قائمة المراجعة
+        
+        Args:
+            status: حالة السطر (open, resolved, dismissed)
+            limit: الحد الأقصى للنتائج
+        
+        Returns:
+            قائمة الأسطر
+        """
+        try:
+            conn = sqlite3.connect(self.db_path)
+            cursor = conn.cursor()
+            
+            cursor.execute('''
+                SELECT * FROM reconciliation_queue
+                WHERE status = ?
+                ORDER BY created_at DESC, id DESC
+                LIMIT ?
+            ''', (status, limit))
+            
+            rows = cursor.fetchall()
+            conn.close()
+            
+            columns = [desc[0] for desc in cursor.description]
+            items = []
+            
+            for row in rows:
+                item = dict(zip(columns, row))
+                item['candidate_debt_ids'] = json.loads(item['candidate_debt_ids'] or '[]')
+                items.append(item)
+            
+            return items
+        
+        except Exception as e:
+            logger.error(f"خطأ في الحصول على قائمة المراجعة: {str(e)}")
+            return []
+    
+    def resolve_review_item(self, item_id: int, debt_id: int, received_by: int = None,
+                            payment_method: str = 'bank_transfer') -> int:
+        """
+        ربط سطر من قائمة المراجعة بدين يدوياً وتسجيل الدفعة
+        
+        Args:
+            item_id: معرف السطر في قائمة المراجعة
+            debt_id: معرف الدين المختار
+            received_by: معرف المستخدم
+            payment_method: طريقة الدفع
+        
+        Returns:
+            معرف الدفعة المُسجلة
+        """
+        try:
+            with self.debt_system.transaction() as conn:
+                cursor = conn.cursor()
+                
+                cursor.execute('''
+                    SELECT line_date, amount, reference, batch_id, line_number
+                    FROM reconciliation_queue WHERE id = ? AND status = 'open'
+                ''', (item_id,))
+                item = cursor.fetchone()
+                
+                if not item:
+                    raise ValueError("السطر غير موجود في قائمة المراجعة")
+                
+                payment_id = self.debt_system._apply_payment(conn, {
+                    'debt_id': debt_id,
+                    'amount': item[1],
+                    'payment_date': item[0] or datetime.now().strftime('%Y-%m-%d'),
+                    'payment_method': payment_method,
+                    'reference_number': item[2],
+                    'notes': f"مطابقة يدوية ({item[3]}) سطر {item[4]}",
+                    'received_by': received_by
+                })
+                
+                cursor.execute('''
+                    UPDATE reconciliation_queue
+                    SET status = 'resolved', resolved_payment_id = ?, resolved_at = ?
+                    WHERE id = ?
+                ''', (payment_id, datetime.now().isoformat(), item_id))
+            
+            logger.info(f"تمت مطابقة السطر {item_id} يدوياً مع الدين {debt_id}")
+            return payment_id
+        
+        except Exception as e:
+            logger.error(f"خطأ في المطابقة اليدوية: {str(e)}")
+            raise
+    
+    def dismiss_review_item(self, item_id: int) -> bool:
+        """
+        استبعاد سطر من قائمة المراجعة دون تسجيل دفعة
+        
+        Args:
+            item_id: معرف السطر
+        
+        Returns:
+            True إذا تم الاستبعاد
+        """
+        try:
+            conn = sqlite3.connect(self.db_path)
+            cursor = conn.cursor()
+            
+            cursor.execute('''
+                UPDATE reconciliation_queue
+                SET status = 'dismissed', resolved_at = ?
+                WHERE id = ? AND status = 'open'
+            ''', (datetime.now().isoformat(), item_id))
+            
+            dismissed = cursor.rowcount > 0
+            
+            conn.commit()
+            conn.close()
+            
+            return dismissed
+        
+        except Exception as e:
+            logger.error(f"خطأ في استبعاد السطر: {str(e)}")
+            return False
+
+
+# مثال على الاستخدام
+if __name__ == "__main__":
+    from src.debt_management import DebtManagementSystem
+    
+    reconciliation = DebtReconciliation(DebtManagementSystem())
+    
+    try:
+        result = reconciliation.reconcile_statement('bank_statement.csv', dry_run=True)
+        print(f"أسطر مطابقة: {result['matched']} من {result['total_lines']}")
+        print(f"بانتظار المراجعة: {result['queued_for_review']}")
+    
+    except Exception as e:
+        print(f"خطأ: {str(e)}")
@@ -4,17 +4,23 @@
 """
 
 import os
+import io
 import json
+import time
+import hashlib
+import sqlite3
+import random
+import threading
 from datetime import datetime
-from typing import Optional, List
+from typing import Dict, Optional, List
 import logging
 
 try:
     from googleapiclient.discovery import build
-    from googleapiclient.http import MediaFileUpload
     from google.oauth2.credentials import Credentials
     from google_auth_oauthlib.flow import InstalledAppFlow
-    from google.auth.transport.requests import Request
+    from google.auth.transport.requests import Request, AuthorizedSession
+    import requests
     import pickle
     GOOGLE_DRIVE_AVAILABLE = True
 except ImportError:
@@ -24,19 +30,88 @@ except ImportError:
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+
+class UploadSessionExpired(Exception):
+    """انتهت صلاحية جلسة الرفع على الخادم ويجب بدء جلسة جديدة"""
+
+
+class BandwidthLimiter:
+    """
+    دلو رموز بالبايت لتحديد سرعة الرفع
+    
+    يُشارك بين جميع خيوط الرفع فيبقى مجموع سرعتها تحت الحد، ويسمح بدفعة
+    أولية بحجم burst_bytes ثم ينتظر بقدر ما أُرسل.
+    """
+    
+    def __init__(self, bytes_per_second: float, burst_bytes: int = 256 * 1024):
+        self.bytes_per_second = bytes_per_second
+        self.burst_bytes = burst_bytes
+        self._tokens = float(burst_bytes)
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+    
+    def consume(self, nbytes: int):
+        """حجز nbytes والانتظار حتى يسمح المعدل بإرسالها"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst_bytes, self._tokens + (now - self._updated_at) * self.bytes_per_second)
+            self._updated_at = now
+            self._tokens -= nbytes
+            delay = -self._tokens / self.bytes_per_second if self._tokens < 0 else 0
+        
+        if delay:
+            time.sleep(delay)
+
+
+class _ThrottledBody(io.BytesIO):
+    """جسم طلب يُقرأ على دفعات صغيرة عبر محدد السرعة بدلاً من إرسال الجزء دفعة واحدة"""
+    
+    def __init__(self, data: bytes, limiter: BandwidthLimiter):
+        super().__init__(data)
+        self._size = len(data)
+        self._limiter = limiter
+    
+    def __len__(self):
+        return self._size
+    
+    def read(self, size: int = -1) -> bytes:
+        data = super().read(size)
+        if data:
+            self._limiter.consume(len(data))
+        return data
+
+
 class GoogleDriveBackup:
     """نظام النسخ الاحتياطي إلى Google Drive"""
     
     # نطاقات الصلاحيات المطلوبة
     SCOPES = ['https://www.googleapis.com/auth/drive.file']
     
-    def __init__(self, credentials_file: str = "credentials.json", token_file: str = "token.pickle"):
+    # رابط الرفع القابل للاستكمال
+    UPLOAD_URL = "https://www.googleapis.com/upload/drive/v3/files"
+    
+    # حجم الجزء الافتراضي (يجب أن يكون من مضاعفات 256 كيلوبايت)
+    CHUNK_SIZE = 8 * 1024 * 1024
+    
+    # جلسات الرفع في Drive تنتهي بعد أسبوع تقريباً
+    SESSION_MAX_AGE = 6 * 24 * 3600
+    
+    def __init__(self, credentials_file: str = "credentials.json", token_file: str = "token.pickle",
+                 chunk_size: int = CHUNK_SIZE, upload_state_file: Optional[str] = None,
+                 upload_url: str = UPLOAD_URL, max_retries: int = 6, retry_backoff: float = 1.0,
+                 request_timeout: float = 120):
         """
         تهيئة نظام النسخ الاحتياطي إلى Google Drive
         
         Args:
             credentials_file: ملف بيانات اعتماد Google API
             token_file: ملف رمز الوصول المحفوظ
+            chunk_size: حجم كل جزء في الرفع
+            upload_state_file: ملف حفظ جلسات الرفع غير المكتملة (بجانب ملف الرمز افتراضياً)
+            upload_url: رابط الرفع (يُغيَّر لخادم تجريبي محلي)
+            max_retries: عدد المحاولات المتتالية الفاشلة قبل التوقف
+            retry_backoff: الانتظار الأولي بالثواني قبل إعادة المحاولة (يتضاعف مع كل فشل)
+            request_timeout: مهلة كل طلب بالثواني
         """
         if not GOOGLE_DRIVE_AVAILABLE:
             raise ImportError("مكتبات Google Drive غير متوفرة. يرجى تثبيتها باستخدام: pip install google-api-python-client google-auth-httplib2 google-auth-oauthlib")
@@ -44,8 +119,28 @@ class GoogleDriveBackup:
         self.credentials_file = credentials_file
         self.token_file = token_file
         self.service = None
+        self.http_session = None
         self.backup_folder_id = None
         
+        if chunk_size % (256 * 1024):
+            raise ValueError("حجم الجزء يجب أن يكون من مضاعفات 256 كيلوبايت")
+        
+        self.chunk_size = chunk_size
+        self.upload_state_file = upload_state_file or os.path.join(
+            os.path.dirname(os.path.abspath(token_file)), "drive_uploads.json"
+        )
+        self.upload_url = upload_url
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.request_timeout = request_timeout
+        self._upload_state_lock = threading.Lock()
+        
+        # محدد سرعة الرفع (يضبطه طابور الرفع في الخلفية)
+        self.bandwidth_limiter: Optional[BandwidthLimiter] = None
+        
+        # سياسة الاحتفاظ (None للسياسة الافتراضية في backup_retention)
+        self.retention_policy = None
+        
     def authenticate(self) -> bool:
         """
         المصادقة مع Google Drive API
@@ -80,6 +175,7 @@ class GoogleDriveBackup:
             
             # إنشاء خدمة Google Drive
             self.service = build('drive', 'v3', credentials=creds)
+            self.http_session = AuthorizedSession(creds)
             logger.info("تم تسجيل الدخول إلى Google Drive بنجاح")
             return True
             
@@ -138,17 +234,20 @@ class GoogleDriveBackup:
     
     def upload_file(self, file_path: str, file_name: Optional[str] = None) -> Optional[str]:
         """
-        رفع ملف إلى Google Drive
+        رفع ملف إلى Google Drive على أجزاء مع إمكانية الاستكمال
+        
+        تُحفظ جلسة الرفع وموضعها بعد كل جزء، فإذا انقطع الاتصال أو أُغلق البرنامج
+        يُستكمل الرفع من آخر جزء وصل بدلاً من البداية.
         
         Args:
             file_path: مسار الملف المحلي
-            file_name: اسم الملف في Google Drive (اختياري)
+            file_name: اسم الملف في Google Drive (اختياري، يُتجاهل عند استكمال رفع سابق)
             
         Returns:
             معرف الملف إذا تم الرفع بنجاح، None خلاف ذلك
         """
         try:
-            if not self.service:
+            if not self.http_session:
                 logger.error("يجب المصادقة أولاً")
                 return None
             
@@ -168,14 +267,8 @@ class GoogleDriveBackup:
                 file_metadata['parents'] = [self.backup_folder_id]
             
             # رفع الملف
-            media = MediaFileUpload(file_path, resumable=True)
-            file = self.service.files().create(
-                body=file_metadata,
-                media_body=media,
-                fields='id'
-            ).execute()
+            file_id = self._resumable_upload(file_path, file_metadata)
             
-            file_id = file.get('id')
             logger.info(f"تم رفع الملف بنجاح: {file_name} (ID: {file_id})")
             return file_id
             
@@ -183,6 +276,183 @@ class GoogleDriveBackup:
             logger.error(f"خطأ في رفع الملف: {str(e)}")
             return None
     
+    # ------------------------------------------------------------------
+    # الرفع القابل للاستكمال (بروتوكول resumable في Drive API)
+    # ------------------------------------------------------------------
+    
+    def _load_upload_sessions(self) -> Dict[str, dict]:
+        if not os.path.exists(self.upload_state_file):
+            return {}
+        
+        try:
+            with open(self.upload_state_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            logger.error(f"خطأ في قراءة جلسات الرفع المحفوظة: {str(e)}")
+            return {}
+    
+    def _save_upload_session(self, key: str, session: Optional[dict]):
+        """حفظ جلسة رفع (أو حذفها إذا كانت None) بكتابة ذرية لملف الحالة"""
+        with self._upload_state_lock:
+            sessions = self._load_upload_sessions()
+            
+            if session is None:
+                sessions.pop(key, None)
+            else:
+                sessions[key] = session
+            
+            temp_path = self.upload_state_file + ".tmp"
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(sessions, f, ensure_ascii=False, indent=2)
+            os.replace(temp_path, self.upload_state_file)
+    
+    @staticmethod
+    def _upload_key(file_path: str) -> str:
+        """مفتاح الجلسة: الملف نفسه بحجمه ووقت تعديله، فأي تغيير يبدأ رفعاً جديداً"""
+        stat = os.stat(file_path)
+        return f"{os.path.abspath(file_path)}|{stat.st_size}|{int(stat.st_mtime)}"
+    
+    def _start_upload_session(self, file_metadata: dict, size: int) -> str:
+        """بدء جلسة رفع جديدة وإرجاع رابطها"""
+        response = self.http_session.post(
+            self.upload_url,
+            params={'uploadType': 'resumable', 'fields': 'id'},
+            json=file_metadata,
+            headers={
+                'X-Upload-Content-Type': 'application/octet-stream',
+                'X-Upload-Content-Length': str(size)
+            },
+            timeout=self.request_timeout
+        )
+        response.raise_for_status()
+        return response.headers['Location']
+    
+    @staticmethod
+    def _parse_upload_response(response, size: int):
+        """
+        تفسير رد الخادم على جزء أو استعلام حالة
+        
+        Returns:
+            (الموضع التالي, معرف الملف عند الاكتمال)
+        """
+        if response.status_code in (200, 201):
+            return size, response.json().get('id')
+        
+        if response.status_code == 308:
+            # Range: bytes=0-N تعني أن الخادم استلم حتى البايت N
+            received = response.headers.get('Range')
+            return (int(received.rsplit('-', 1)[1]) + 1 if received else 0), None
+        
+        if response.status_code in (404, 410):
+            raise UploadSessionExpired(f"انتهت صلاحية جلسة الرفع ({response.status_code})")
+        
+        response.raise_for_status()
+        raise IOError(f"رد غير متوقع من Google Drive: {response.status_code}")
+    
+    def _query_upload_offset(self, session_uri: str, size: int):
+        """سؤال الخادم عن عدد البايتات التي استلمها فعلاً"""
+        response = self.http_session.put(
+            session_uri,
+            headers={'Content-Range': f"bytes */{size}", 'Content-Length': '0'},
+            timeout=self.request_timeout
+        )
+        return self._parse_upload_response(response, size)
+    
+    def _resumable_upload(self, file_path: str, file_metadata: dict) -> str:
+        """
+        رفع الملف جزءاً جزءاً مع إعادة المحاولة والاستكمال
+        
+        Raises:
+            IOError: إذا فشلت جميع المحاولات (تبقى الجلسة محفوظة للاستكمال لاحقاً)
+        """
+        key = self._upload_key(file_path)
+        size = os.path.getsize(file_path)
+        session = self._load_upload_sessions().get(key)
+        
+        if session and time.time() - session['created_at'] > self.SESSION_MAX_AGE:
+            session = None
+        
+        offset = None
+        failures = 0
+        
+        with open(file_path, 'rb') as f:
+            while True:
+                try:
+                    if session is None:
+                        session = {
+                            'uri': self._start_upload_session(file_metadata, size),
+                            'metadata': file_metadata,
+                            'offset': 0,
+                            'created_at': time.time()
+                        }
+                        offset = 0
+                        self._save_upload_session(key, session)
+                    elif offset is None:
+                        # بعد إعادة التشغيل أو خطأ: الخادم هو مرجع الموضع الصحيح
+                        offset, file_id = self._query_upload_offset(session['uri'], size)
+                        if file_id:
+                            break
+                        if offset:
+                            logger.info(f"استكمال رفع {session['metadata']['name']} من البايت {offset} من {size}")
+                    
+                    f.seek(offset)
+                    chunk = f.read(self.chunk_size)
+                    end = offset + len(chunk) - 1
+                    content_range = f"bytes {offset}-{end}/{size}" if chunk else f"bytes */{size}"
+                    
+                    body = _ThrottledBody(chunk, self.bandwidth_limiter) if self.bandwidth_limiter else chunk
+                    response = self.http_session.put(
+                        session['uri'],
+                        data=body,
+                        headers={'Content-Range': content_range},
+                        timeout=self.request_timeout
+                    )
+                    
+                    if response.status_code == 429 or response.status_code >= 500:
+                        raise IOError(f"خطأ مؤقت من Google Drive: {response.status_code}")
+                    
+                    offset, file_id = self._parse_upload_response(response, size)
+                    failures = 0
+                    
+                    if file_id:
+                        break
+                    
+                    session['offset'] = offset
+                    self._save_upload_session(key, session)
+                
+                except UploadSessionExpired as e:
+                    logger.warning(f"{str(e)}، سيبدأ الرفع من جديد")
+                    session = None
+                    failures += 1
+                    if failures > self.max_retries:
+                        self._save_upload_session(key, None)
+                        raise IOError(str(e))
+                
+                except (requests.RequestException, IOError) as e:
+                    # أخطاء الطلب نفسه (صلاحيات، بيانات خاطئة) لا تفيد معها الإعادة
+                    response = getattr(e, 'response', None)
+                    if response is not None and 400 <= response.status_code < 500 and response.status_code != 429:
+                        raise
+                    
+                    failures += 1
+                    if failures > self.max_retries:
+                        raise IOError(f"فشل رفع {file_path} بعد {self.max_retries} محاولات: {str(e)}")
+                    
+                    delay = min(self.retry_backoff * 2 ** (failures - 1), 60) * random.uniform(0.8, 1.2)
+                    logger.warning(f"خطأ أثناء الرفع ({str(e)})، إعادة المحاولة بعد {delay:.1f} ثانية")
+                    time.sleep(delay)
+                    offset = None
+        
+        self._save_upload_session(key, None)
+        return file_id
+    
+    @staticmethod
+    def drive_file_name(backup_file_path: str) -> str:
+        """اسم الملف في Drive مع الطابع الزمني"""
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        name_without_ext, extension = os.path.splitext(os.path.basename(backup_file_path))
+        return f"{name_without_ext}_{timestamp}{extension}"
+    
     def upload_backup(self, backup_file_path: str) -> bool:
         """
         رفع ملف نسخة احتياطية إلى Google Drive
@@ -202,15 +472,8 @@ class GoogleDriveBackup:
             if not self.create_backup_folder():
                 return False
             
-            # إنشاء اسم ملف مع الطابع الزمني
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            original_name = os.path.basename(backup_file_path)
-            name_without_ext = os.path.splitext(original_name)[0]
-            extension = os.path.splitext(original_name)[1]
-            drive_file_name = f"{name_without_ext}_{timestamp}{extension}"
-            
             # رفع الملف
-            file_id = self.upload_file(backup_file_path, drive_file_name)
+            file_id = self.upload_file(backup_file_path, self.drive_file_name(backup_file_path))
             
             if file_id:
                 logger.info(f"تم رفع النسخة الاحتياطية إلى Google Drive بنجاح")
@@ -238,55 +501,510 @@ class GoogleDriveBackup:
                 logger.error("مجلد النسخ الاحتياطية غير موجود")
                 return []
             
-            # البحث عن الملفات في مجلد النسخ الاحتياطية
-            results = self.service.files().list(
-                q=f"'{self.backup_folder_id}' in parents",
-                fields="files(id, name, size, createdTime, modifiedTime)",
-                orderBy="createdTime desc"
-            ).execute()
+            # البحث عن الملفات في مجلد النسخ الاحتياطية (جميع الصفحات)
+            files = []
+            page_token = None
             
-            files = results.get('files', [])
-            return files
+            while True:
+                results = self.service.files().list(
+                    q=f"'{self.backup_folder_id}' in parents and trashed = false",
+                    fields="nextPageToken, files(id, name, size, md5Checksum, createdTime, modifiedTime)",
+                    orderBy="createdTime desc",
+                    pageSize=1000,
+                    pageToken=page_token
+                ).execute()
+                
+                files.extend(results.get('files', []))
+                page_token = results.get('nextPageToken')
+                if not page_token:
+                    return files
             
         except Exception as e:
             logger.error(f"خطأ في عرض ملفات النسخ الاحتياطية: {str(e)}")
             return []
     
-    def delete_old_backups(self, keep_count: int = 10):
+    def list_restore_points(self) -> List[dict]:
+        """
+        النسخ في Google Drive كنقاط استعادة لسياسة الاحتفاظ
+        
+        ملفات النسخة التزايدية الواحدة (البيان والبيانات) نقطة واحدة تعتمد على النسخة
+        السابقة في سلستها حتى أقرب نسخة أساسية.
+        
+        Returns:
+            [{'id', 'series', 'time', 'files': {معرف الملف: الحجم}, 'depends': [معرفات]}]
+        """
+        from src.backup_retention import BACKUP_SERIES, INCREMENTAL_PREFIXES, parse_backup_time
+        
+        points = []
+        incremental = {}
+        
+        for file in self.list_backup_files():
+            name = file['name']
+            size = int(file.get('size', 0))
+            created = datetime.fromisoformat(file['createdTime'].replace('Z', '+00:00')).astimezone().replace(tzinfo=None)
+            
+            prefix = next((prefix for prefix in INCREMENTAL_PREFIXES if name.startswith(prefix)), None)
+            if prefix:
+                timestamp = name[len(prefix):len(prefix) + 22]
+                group = incremental.setdefault(timestamp, {
+                    'files': {}, 'base': False, 'time': parse_backup_time(timestamp) or created
+                })
+                group['files'][file['id']] = size
+                group['base'] = group['base'] or prefix == "base_"
+                continue
+            
+            series = next((series for prefix, series in BACKUP_SERIES if name.startswith(prefix)), "other")
+            points.append({
+                'id': file['id'],
+                'series': series,
+                'time': created,
+                'files': {file['id']: size},
+                'depends': []
+            })
+        
+        previous = None
+        for timestamp in sorted(incremental):
+            group = incremental[timestamp]
+            point_id = f"incremental:{timestamp}"
+            points.append({
+                'id': point_id,
+                'series': "incremental",
+                'time': group['time'],
+                'files': group['files'],
+                'depends': [] if group['base'] or previous is None else [previous]
+            })
+            previous = point_id
+        
+        return points
+    
+    def delete_old_backups(self, keep_count: Optional[int] = None, policy=None, dry_run: bool = False) -> dict:
         """
         حذف النسخ الاحتياطية القديمة من Google Drive
         
+        افتراضياً تُطبق سياسة الاحتفاظ (self.retention_policy) مع مراعاة سلاسل النسخ
+        التزايدية. تحديد keep_count يعيد السلوك القديم: أحدث عدد محدد من الملفات.
+        
         Args:
-            keep_count: عدد النسخ المراد الاحتفاظ بها
+            keep_count: عدد النسخ المراد الاحتفاظ بها (السلوك القديم)
+            policy: سياسة الاحتفاظ
+            dry_run: عرض الخطة دون حذف
+            
+        Returns:
+            خطة الاحتفاظ (معرفات الملفات في delete_files)
         """
         try:
-            files = self.list_backup_files()
-            
-            if len(files) > keep_count:
-                files_to_delete = files[keep_count:]
+            if keep_count is not None:
+                files = self.list_backup_files()
+                plan = {'delete_files': [file['id'] for file in files[keep_count:]]}
+            else:
+                from src.backup_retention import RetentionPolicy, plan_retention
                 
-                for file in files_to_delete:
-                    self.service.files().delete(fileId=file['id']).execute()
-                    logger.info(f"تم حذف النسخة الاحتياطية القديمة: {file['name']}")
-                    
+                plan = plan_retention(self.list_restore_points(),
+                                      policy or self.retention_policy or RetentionPolicy())
+                
+                if plan['over_budget']:
+                    logger.warning(f"النسخ المحتفظ بها في Google Drive ({plan['kept_bytes']} بايت) تتجاوز الحد الأقصى")
+            
+            if not dry_run:
+                for file_id in plan['delete_files']:
+                    self.service.files().delete(fileId=file_id).execute()
+                    logger.info(f"تم حذف النسخة الاحتياطية القديمة من Google Drive: {file_id}")
+            
+            return plan
+            
         except Exception as e:
             logger.error(f"خطأ في حذف النسخ الاحتياطية القديمة: {str(e)}")
+            return {}
+
+
+class DriveUploadQueue:
+    """
+    طابور رفع النسخ الاحتياطية في الخلفية
+    
+    - الطابور محفوظ في SQLite فيُستكمل بعد إعادة التشغيل (مع استكمال الرفع الجزئي)
+    - عدة ملفات تُرفع بالتوازي ضمن حد سرعة مشترك حتى لا يُشغل خط الإنترنت بالكامل
+    - الملف الموجود في Drive بنفس بصمة MD5 لا يُرفع مرة أخرى
+    """
+    
+    def __init__(self, google_drive_backup: GoogleDriveBackup, db_path: Optional[str] = None,
+                 max_workers: int = 2, bandwidth_bytes_per_second: Optional[float] = 256 * 1024,
+                 skip_unchanged: bool = True, max_attempts: int = 5, retry_delay: float = 60,
+                 on_uploaded=None):
+        """
+        تهيئة طابور الرفع
+        
+        Args:
+            google_drive_backup: نظام النسخ الاحتياطي إلى Google Drive
+            db_path: ملف قاعدة بيانات الطابور (بجانب ملف الرمز افتراضياً)
+            max_workers: عدد الملفات المرفوعة في وقت واحد
+            bandwidth_bytes_per_second: الحد الأقصى لسرعة الرفع الكلية (None بلا حد)
+            skip_unchanged: تخطي الملفات الموجودة في Drive بنفس بصمة MD5
+            max_attempts: عدد محاولات الملف قبل اعتباره فاشلاً
+            retry_delay: الانتظار الأولي بالثواني قبل إعادة محاولة ملف فشل (يتضاعف)
+            on_uploaded: دالة تُستدعى بـ (مسار الملف، بصمة المحتوى) عندما ينتهي عنصر له بصمة
+                بالرفع أو بالتخطي لوجوده في Drive
+        """
+        self.drive = google_drive_backup
+        self.db_path = db_path or os.path.join(
+            os.path.dirname(os.path.abspath(google_drive_backup.token_file)), "drive_upload_queue.sqlite"
+        )
+        self.max_workers = max_workers
+        self.skip_unchanged = skip_unchanged
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.on_uploaded = on_uploaded
+        
+        if bandwidth_bytes_per_second:
+            self.drive.bandwidth_limiter = BandwidthLimiter(bandwidth_bytes_per_second)
+        
+        # عميل Drive API ليس آمناً للاستخدام من عدة خيوط
+        self._drive_lock = threading.Lock()
+        self._condition = threading.Condition()
+        self._workers: List[threading.Thread] = []
+        self._running = False
+        
+        self._init_database()
+    
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=30)
+    
+    def _init_database(self):
+        conn = self._connect()
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS drive_upload_queue (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                file_path TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER DEFAULT 0,
+                next_attempt_at REAL DEFAULT 0,
+                size INTEGER,
+                md5 TEXT,
+                file_id TEXT,
+                content_hash TEXT,
+                last_error TEXT,
+                enqueued_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL
+            )
+        ''')
+        conn.execute('''
+            CREATE INDEX IF NOT EXISTS idx_drive_upload_queue_status
+            ON drive_upload_queue (status, next_attempt_at)
+        ''')
+        
+        # عمود بصمة المحتوى للطوابير المنشأة قبل إضافته
+        columns = [column[1] for column in conn.execute("PRAGMA table_info(drive_upload_queue)")]
+        if 'content_hash' not in columns:
+            conn.execute("ALTER TABLE drive_upload_queue ADD COLUMN content_hash TEXT")
+        
+        # الرفع الذي انقطع بإغلاق البرنامج يعود للطابور ويُستكمل من جلسته المحفوظة
+        conn.execute("UPDATE drive_upload_queue SET status = 'pending' WHERE status = 'uploading'")
+        conn.commit()
+        conn.close()
+    
+    def enqueue(self, file_path: str, content_hash: Optional[str] = None) -> int:
+        """
+        إضافة ملف إلى طابور الرفع
+        
+        Args:
+            file_path: مسار الملف
+            content_hash: بصمة محتوى النسخة (تُمرر إلى on_uploaded بعد نجاح الرفع)
+        
+        Returns:
+            رقم العنصر في الطابور
+        """
+        conn = self._connect()
+        cursor = conn.execute(
+            'INSERT INTO drive_upload_queue (file_path, content_hash, enqueued_at) VALUES (?, ?, ?)',
+            (os.path.abspath(file_path), content_hash, time.time())
+        )
+        item_id = cursor.lastrowid
+        conn.commit()
+        conn.close()
+        
+        self.start()
+        with self._condition:
+            self._condition.notify()
+        
+        return item_id
+    
+    def start(self):
+        """تشغيل خيوط الرفع (يُستدعى تلقائياً عند أول إضافة)"""
+        with self._condition:
+            if self._running:
+                return
+            
+            self._running = True
+            self._workers = [
+                threading.Thread(target=self._run, name=f"drive-upload-{i}", daemon=True)
+                for i in range(self.max_workers)
+            ]
+            for worker in self._workers:
+                worker.start()
+    
+    def close(self, timeout: float = 10):
+        """إيقاف خيوط الرفع (الملفات غير المكتملة تبقى في الطابور)"""
+        with self._condition:
+            self._running = False
+            self._condition.notify_all()
+        
+        for worker in self._workers:
+            worker.join(timeout)
+        self._workers = []
+    
+    def _claim_next(self) -> Optional[tuple]:
+        """حجز أول ملف مستحق للرفع، أو إرجاع None مع مدة الانتظار حتى التالي"""
+        with self._condition:
+            conn = self._connect()
+            row = conn.execute('''
+                SELECT id, file_path, attempts, next_attempt_at, content_hash FROM drive_upload_queue
+                WHERE status = 'pending'
+                ORDER BY next_attempt_at, id
+                LIMIT 1
+            ''').fetchone()
+            
+            if row and row[3] <= time.time():
+                conn.execute(
+                    "UPDATE drive_upload_queue SET status = 'uploading', started_at = ? WHERE id = ?",
+                    (time.time(), row[0])
+                )
+                conn.commit()
+            conn.close()
+            
+            return row
+    
+    def _run(self):
+        while True:
+            row = self._claim_next()
+            
+            with self._condition:
+                if not self._running:
+                    return
+                
+                if row is None or row[3] > time.time():
+                    wait = 60.0 if row is None else min(row[3] - time.time(), 60.0)
+                    self._condition.wait(wait)
+                    continue
+            
+            self._upload(row[0], row[1], row[2], row[4])
+    
+    @staticmethod
+    def _file_md5(path: str) -> str:
+        file_hash = hashlib.md5()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                file_hash.update(chunk)
+        return file_hash.hexdigest()
+    
+    def _prepare_drive(self) -> bool:
+        with self._drive_lock:
+            if self.drive.http_session and self.drive.backup_folder_id:
+                return True
+            return self.drive.authenticate() and bool(self.drive.create_backup_folder())
+    
+    def _finish(self, item_id: int, status: str, **fields):
+        fields.update(status=status, finished_at=time.time())
+        conn = self._connect()
+        conn.execute(
+            f"UPDATE drive_upload_queue SET {', '.join(f'{name} = ?' for name in fields)} WHERE id = ?",
+            (*fields.values(), item_id)
+        )
+        conn.commit()
+        conn.close()
+    
+    def is_pending(self, content_hash: str) -> bool:
+        """هل توجد نسخة بنفس بصمة المحتوى ما زالت تنتظر الرفع"""
+        conn = self._connect()
+        row = conn.execute(
+            "SELECT 1 FROM drive_upload_queue WHERE content_hash = ? AND status IN ('pending', 'uploading') LIMIT 1",
+            (content_hash,)
+        ).fetchone()
+        conn.close()
+        return row is not None
+    
+    def _uploaded(self, file_path: str, content_hash: Optional[str]):
+        if content_hash and self.on_uploaded:
+            try:
+                self.on_uploaded(file_path, content_hash)
+            except Exception as e:
+                logger.error(f"خطأ في تسجيل اكتمال الرفع: {str(e)}")
+    
+    def _upload(self, item_id: int, file_path: str, attempts: int, content_hash: Optional[str] = None):
+        try:
+            if not os.path.exists(file_path):
+                self._finish(item_id, 'failed', last_error="الملف غير موجود")
+                return
+            
+            if not self._prepare_drive():
+                raise IOError("تعذر الاتصال بـ Google Drive")
+            
+            size = os.path.getsize(file_path)
+            md5 = self._file_md5(file_path)
+            
+            if self.skip_unchanged:
+                with self._drive_lock:
+                    remote = self.drive.list_backup_files()
+                
+                existing = next((f for f in remote if f.get('md5Checksum') == md5), None)
+                if existing:
+                    logger.info(f"الملف موجود في Google Drive بنفس المحتوى، تم تخطي رفعه: {file_path}")
+                    self._finish(item_id, 'skipped', size=size, md5=md5, file_id=existing['id'])
+                    self._uploaded(file_path, content_hash)
+                    return
+            
+            file_id = self.drive.upload_file(file_path, self.drive.drive_file_name(file_path))
+            if not file_id:
+                raise IOError("فشل رفع الملف")
+            
+            self._finish(item_id, 'done', size=size, md5=md5, file_id=file_id)
+            self._uploaded(file_path, content_hash)
+            logger.info(f"تم رفع النسخة الاحتياطية إلى Google Drive: {file_path}")
+            
+            with self._drive_lock:
+                self.drive.delete_old_backups()
+        
+        except Exception as e:
+            attempts += 1
+            logger.error(f"خطأ في رفع {file_path} (المحاولة {attempts}): {str(e)}")
+            
+            if attempts >= self.max_attempts:
+                self._finish(item_id, 'failed', attempts=attempts, last_error=str(e))
+                return
+            
+            conn = self._connect()
+            conn.execute('''
+                UPDATE drive_upload_queue
+                SET status = 'pending', attempts = ?, next_attempt_at = ?, last_error = ?
+                WHERE id = ?
+            ''', (attempts, time.time() + self.retry_delay * 2 ** (attempts - 1), str(e), item_id))
+            conn.commit()
+            conn.close()
+    
+    def get_status(self, limit: int = 20) -> Dict:
+        """حالة الطابور: عدد الملفات حسب الحالة وآخر العناصر"""
+        conn = self._connect()
+        counts = dict(conn.execute('SELECT status, COUNT(*) FROM drive_upload_queue GROUP BY status').fetchall())
+        uploaded_bytes = conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM drive_upload_queue WHERE status = 'done'"
+        ).fetchone()[0]
+        rows = conn.execute('''
+            SELECT id, file_path, status, attempts, size, file_id, last_error, enqueued_at, finished_at
+            FROM drive_upload_queue ORDER BY id DESC LIMIT ?
+        ''', (limit,)).fetchall()
+        conn.close()
+        
+        limiter = self.drive.bandwidth_limiter
+        
+        return {
+            'running': self._running,
+            'workers': self.max_workers,
+            'bandwidth_bytes_per_second': limiter.bytes_per_second if limiter else None,
+            'counts': counts,
+            'uploaded_bytes': uploaded_bytes,
+            'items': [
+                {
+                    'id': row[0],
+                    'file': os.path.basename(row[1]),
+                    'status': row[2],
+                    'attempts': row[3],
+                    'size': row[4],
+                    'file_id': row[5],
+                    'last_error': row[6],
+                    'enqueued_at': datetime.fromtimestamp(row[7]).isoformat(),
+                    'finished_at': datetime.fromtimestamp(row[8]).isoformat() if row[8] else None
+                } for row in rows
+            ]
+        }
 
 
 class AutoBackupManager:
     """مدير النسخ الاحتياطي التلقائي"""
     
-    def __init__(self, backup_system, google_drive_backup=None):
+    def __init__(self, backup_system, google_drive_backup=None, upload_queue: Optional[DriveUploadQueue] = None):
         """
         تهيئة مدير النسخ الاحتياطي التلقائي
         
         Args:
             backup_system: نظام النسخ الاحتياطي المحلي
             google_drive_backup: نظام النسخ الاحتياطي إلى Google Drive (اختياري)
+            upload_queue: طابور رفع في الخلفية بدلاً من الرفع المباشر (اختياري)
         """
         self.backup_system = backup_system
         self.google_drive_backup = google_drive_backup
+        self.upload_queue = upload_queue
         
+        # البصمة تُسجل عند اكتمال الرفع في الطابور، لا عند الإضافة إليه
+        if upload_queue and upload_queue.on_uploaded is None:
+            upload_queue.on_uploaded = self._on_queue_uploaded
+    
+    @property
+    def _last_upload_path(self) -> str:
+        return os.path.join(self.backup_system.manifests_dir, "last_upload.json")
+    
+    def _get_last_uploaded_hash(self) -> Optional[str]:
+        """بصمة محتوى آخر نسخة شاملة رُفعت إلى Google Drive"""
+        if not os.path.exists(self._last_upload_path):
+            return None
+        
+        with open(self._last_upload_path, 'r', encoding='utf-8') as f:
+            return json.load(f).get('content_hash')
+    
+    def _set_last_uploaded_hash(self, manifest: dict):
+        os.makedirs(os.path.dirname(self._last_upload_path), exist_ok=True)
+        with open(self._last_upload_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'content_hash': manifest['content_hash'],
+                'backup': manifest.get('backup'),
+                'uploaded_at': datetime.now().isoformat()
+            }, f, ensure_ascii=False, indent=2)
+    
+    def _on_queue_uploaded(self, file_path: str, content_hash: str):
+        self._set_last_uploaded_hash({'content_hash': content_hash, 'backup': os.path.basename(file_path)})
+        
+    def upload_backup_file(self, backup_file: str, backup_type: str = "full", upload_to_drive: bool = True):
+        """
+        رفع نسخة احتياطية منشأة مسبقاً إلى Google Drive (مباشرة أو عبر طابور الرفع)
+        
+        تُستدعى أيضاً من الجدولة (on_backup_created) لرفع النسخ المجدولة.
+        
+        Args:
+            backup_file: مسار ملف النسخة الاحتياطية
+            backup_type: نوع النسخة الاحتياطية
+            upload_to_drive: رفع إلى Google Drive
+        """
+        # النسخة التزايدية تُرفع ملف بياناتها (إن وُجد) مع البيان
+        upload_files = [backup_file]
+        if backup_type == "incremental":
+            with open(backup_file, 'r', encoding='utf-8') as f:
+                data_file = json.load(f)['file']
+            if data_file:
+                upload_files.insert(0, os.path.join(os.path.dirname(backup_file), data_file))
+        
+        # النسخة الشاملة لا تُرفع إذا طابقت بصمة محتواها آخر نسخة مرفوعة
+        manifest = None
+        if backup_type not in ("json", "excel", "db", "incremental"):
+            manifest = self.backup_system.get_backup_manifest(backup_file)
+        
+        # رفع إلى Google Drive إذا كان مطلوباً
+        if upload_to_drive and self.google_drive_backup:
+            if manifest and manifest['content_hash'] == self._get_last_uploaded_hash():
+                logger.info("لم تتغير البيانات منذ آخر نسخة مرفوعة، تم تخطي الرفع إلى Google Drive")
+            elif manifest and self.upload_queue and self.upload_queue.is_pending(manifest['content_hash']):
+                logger.info("توجد نسخة بنفس البيانات في طابور الرفع، تم تخطي الإضافة")
+            elif self.upload_queue:
+                # تُسجل البصمة عند اكتمال الرفع (on_uploaded) حتى لا يُتخطى رفع نسخة فشل رفعها
+                for path in upload_files:
+                    self.upload_queue.enqueue(path, manifest['content_hash'] if manifest else None)
+                logger.info("تمت إضافة النسخة الاحتياطية إلى طابور الرفع")
+            else:
+                success = all(self.google_drive_backup.upload_backup(path) for path in upload_files)
+                if success:
+                    if manifest:
+                        self._set_last_uploaded_hash(manifest)
+                    logger.info("تم رفع النسخة الاحتياطية إلى Google Drive")
+                else:
+                    logger.warning("فشل في رفع النسخة الاحتياطية إلى Google Drive")
+    
     def create_and_upload_backup(self, backup_type: str = "full", upload_to_drive: bool = True) -> bool:
         """
         إنشاء نسخة احتياطية ورفعها إلى Google Drive
@@ -306,20 +1024,16 @@ class AutoBackupManager:
                 backup_file = self.backup_system.backup_database_to_excel()
             elif backup_type == "db":
                 backup_file = self.backup_system.backup_database_file()
+            elif backup_type == "incremental":
+                backup_file = self.backup_system.create_incremental_backup()
             else:  # full
                 backup_file = self.backup_system.create_full_backup()
             
-            # رفع إلى Google Drive إذا كان مطلوباً
-            if upload_to_drive and self.google_drive_backup:
-                success = self.google_drive_backup.upload_backup(backup_file)
-                if success:
-                    logger.info("تم رفع النسخة الاحتياطية إلى Google Drive")
-                else:
-                    logger.warning("فشل في رفع النسخة الاحتياطية إلى Google Drive")
+            self.upload_backup_file(backup_file, backup_type, upload_to_drive)
             
             # تنظيف النسخ القديمة
             self.backup_system.cleanup_old_backups()
-            if upload_to_drive and self.google_drive_backup:
+            if upload_to_drive and self.google_drive_backup and not self.upload_queue:
                 self.google_drive_backup.delete_old_backups()
             
             return True
@@ -7,23 +7,161 @@ from reportlab.lib.pagesizes import A4, letter
 from reportlab.lib import colors
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.units import inch, cm
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, Image
+from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, Image, PageBreak
 from reportlab.pdfgen import canvas
 from reportlab.lib.enums import TA_CENTER, TA_RIGHT, TA_LEFT
 from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfbase.ttfonts import TTFont
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import lru_cache
 import os
 import logging
+import threading
+import time
 import qrcode
 from PIL import Image as PILImage
 import io
 
+try:
+    from pypdf import PdfReader, PdfWriter
+    PYPDF_AVAILABLE = True
+except ImportError:
+    PYPDF_AVAILABLE = False
+
 # إعداد نظام السجلات
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# مسار خط عربي (مثل Amiri أو Cairo)؛ بدونه يُستخدم الخط الافتراضي
+ARABIC_FONT_PATH = os.environ.get('INVOICE_FONT_PATH')
+
+# الخطوط والأنماط تُجهز مرة واحدة في كل عملية وتُشارك بين كل نسخ InvoicePrinter
+_fonts_lock = threading.Lock()
+_registered_fonts: Dict[Optional[str], str] = {}
+_styles_cache: Dict[str, object] = {}
+
+
+def register_fonts(font_path: Optional[str] = None) -> str:
+    """
+    تسجيل الخط العربي في reportlab (مرة واحدة لكل مسار)
+    
+    Args:
+        font_path: مسار ملف الخط TTF (الافتراضي INVOICE_FONT_PATH)
+        
+    Returns:
+        اسم الخط المستخدم في الأنماط والجداول
+    """
+    font_path = font_path or ARABIC_FONT_PATH
+    
+    with _fonts_lock:
+        if font_path in _registered_fonts:
+            return _registered_fonts[font_path]
+        
+        font_name = 'Helvetica'  # استخدام خط افتراضي
+        if font_path:
+            try:
+                pdfmetrics.registerFont(TTFont('Arabic', font_path))
+                font_name = 'Arabic'
+            except Exception as e:
+                logger.warning(f"فشل في تحميل الخط العربي: {str(e)}")
+        
+        _registered_fonts[font_path] = font_name
+        return font_name
+
+
+def get_styles(font_name: str):
+    """أنماط النصوص للخط المحدد (تُبنى مرة واحدة ثم تُعاد من الذاكرة)"""
+    with _fonts_lock:
+        styles = _styles_cache.get(font_name)
+        if styles is not None:
+            return styles
+        
+        styles = getSampleStyleSheet()
+        
+        # نمط العنوان الرئيسي
+        styles.add(ParagraphStyle(
+            name='ArabicTitle',
+            parent=styles['Title'],
+            fontName=font_name,
+            fontSize=18,
+            alignment=TA_CENTER,
+            spaceAfter=20
+        ))
+        
+        # نمط النص العادي
+        styles.add(ParagraphStyle(
+            name='ArabicNormal',
+            parent=styles['Normal'],
+            fontName=font_name,
+            fontSize=12,
+            alignment=TA_RIGHT
+        ))
+        
+        # نمط النص المتوسط
+        styles.add(ParagraphStyle(
+            name='ArabicHeading',
+            parent=styles['Heading2'],
+            fontName=font_name,
+            fontSize=14,
+            alignment=TA_RIGHT,
+            spaceAfter=10
+        ))
+        
+        _styles_cache[font_name] = styles
+        return styles
+
+
+@lru_cache(maxsize=256)
+def _qr_png(qr_text: str) -> bytes:
+    """صورة QR Code بصيغة PNG (تُعاد من الذاكرة عند إعادة طباعة نفس الفاتورة)"""
+    qr = qrcode.QRCode(version=1, box_size=3, border=1)
+    qr.add_data(qr_text)
+    qr.make(fit=True)
+    
+    # تحويل إلى صورة
+    qr_img = qr.make_image(fill_color="black", back_color="white")
+    
+    qr_buffer = io.BytesIO()
+    qr_img.save(qr_buffer, format='PNG')
+    return qr_buffer.getvalue()
+
+
+# نسخة الطباعة الخاصة بكل عملية في مجمع الطباعة الدفعية
+_batch_printer = None
+
+
+def _init_batch_worker(company_info: Dict):
+    """تهيئة عملية الطباعة الدفعية: نسخة واحدة من InvoicePrinter تُستخدم لكل فواتيرها"""
+    global _batch_printer
+    _batch_printer = InvoicePrinter(company_info)
+
+
+def _render_batch_chunk(items: List, printer: "InvoicePrinter" = None) -> List:
+    """
+    إنشاء مجموعة فواتير داخل عملية الطباعة
+    
+    Args:
+        items: [(الترتيب، بيانات الفاتورة، مسار الإخراج أو None لإعادة محتوى PDF)]
+        printer: نسخة الطباعة (الافتراضي نسخة العملية)
+        
+    Returns:
+        [(الترتيب، المسار أو محتوى PDF، رسالة الخطأ أو None)]
+    """
+    printer = printer or _batch_printer
+    results = []
+    for index, invoice_data, output_path in items:
+        try:
+            if output_path:
+                results.append((index, printer.create_invoice(invoice_data, output_path), None))
+            else:
+                results.append((index, printer.render_invoice_bytes(invoice_data), None))
+        except Exception as e:
+            results.append((index, None, str(e)))
+    return results
+
+
 class InvoicePrinter:
     """نظام طباعة الفواتير"""
     
@@ -49,48 +187,68 @@ class InvoicePrinter:
         self.setup_styles()
     
     def setup_fonts(self):
-        """إعداد الخطوط العربية"""
-        try:
-            # محاولة تحميل خط عربي
-            # يمكن تحميل خطوط عربية مثل Amiri أو Cairo
-            # pdfmetrics.registerFont(TTFont('Arabic', 'path/to/arabic/font.ttf'))
-            self.arabic_font = 'Helvetica'  # استخدام خط افتراضي
-        except Exception as e:
-            logger.warning(f"فشل في تحميل الخط العربي: {str(e)}")
-            self.arabic_font = 'Helvetica'
+        """إعداد الخطوط العربية (التسجيل الفعلي يتم مرة واحدة في العملية)"""
+        self.arabic_font = register_fonts()
     
     def setup_styles(self):
-        """إعداد أنماط النصوص"""
-        self.styles = getSampleStyleSheet()
+        """إعداد أنماط النصوص (مشتركة بين النسخ ويجب عدم تعديلها)"""
+        self.styles = get_styles(self.arabic_font)
+    
+    def build_story(self, invoice_data: Dict) -> List:
+        """
+        بناء محتوى الفاتورة
         
-        # نمط العنوان الرئيسي
-        self.styles.add(ParagraphStyle(
-            name='ArabicTitle',
-            parent=self.styles['Title'],
-            fontName=self.arabic_font,
-            fontSize=18,
-            alignment=TA_CENTER,
-            spaceAfter=20
-        ))
+        Args:
+            invoice_data: بيانات الفاتورة
+            
+        Returns:
+            عناصر المستند بالترتيب
+        """
+        story = []
         
-        # نمط النص العادي
-        self.styles.add(ParagraphStyle(
-            name='ArabicNormal',
-            parent=self.styles['Normal'],
-            fontName=self.arabic_font,
-            fontSize=12,
-            alignment=TA_RIGHT
-        ))
+        # إضافة رأس الشركة
+        story.extend(self.create_company_header())
         
-        # نمط النص المتوسط
-        self.styles.add(ParagraphStyle(
-            name='ArabicHeading',
-            parent=self.styles['Heading2'],
-            fontName=self.arabic_font,
-            fontSize=14,
-            alignment=TA_RIGHT,
-            spaceAfter=10
-        ))
+        # إضافة معلومات الفاتورة
+        story.extend(self.create_invoice_header(invoice_data))
+        
+        # إضافة معلومات الزبون
+        story.extend(self.create_customer_info(invoice_data))
+        
+        # إضافة جدول المنتجات
+        story.extend(self.create_products_table(invoice_data))
+        
+        # إضافة الإجمالي
+        story.extend(self.create_totals_section(invoice_data))
+        
+        # إضافة معلومات الضمان
+        story.extend(self.create_warranty_section(invoice_data))
+        
+        # إضافة QR Code
+        story.extend(self.create_qr_section(invoice_data))
+        
+        # إضافة تذييل
+        story.extend(self.create_footer())
+        
+        return story
+    
+    def build_document(self, story: List, output):
+        """كتابة المحتوى كمستند PDF إلى مسار أو كائن ملف"""
+        doc = SimpleDocTemplate(
+            output,
+            pagesize=A4,
+            rightMargin=2*cm,
+            leftMargin=2*cm,
+            topMargin=2*cm,
+            bottomMargin=2*cm
+        )
+        doc.build(story)
+    
+    def render_invoice_bytes(self, invoice_data: Dict) -> bytes:
+        """إنشاء الفاتورة في الذاكرة وإعادة محتوى PDF"""
+        buffer = io.BytesIO()
+        self.build_document(self.build_story(invoice_data), buffer)
+        return buffer.getvalue()
     
     def create_invoice(self, invoice_data: Dict, output_path: str = None) -> str:
         """
@@ -111,44 +269,7 @@ class InvoicePrinter:
                 output_path = f"invoice_{invoice_number}_{timestamp}.pdf"
             
             # إنشاء المستند
-            doc = SimpleDocTemplate(
-                output_path,
-                pagesize=A4,
-                rightMargin=2*cm,
-                leftMargin=2*cm,
-                topMargin=2*cm,
-                bottomMargin=2*cm
-            )
-            
-            # إنشاء محتوى الفاتورة
-            story = []
-            
-            # إضافة رأس الشركة
-            story.extend(self.create_company_header())
-            
-            # إضافة معلومات الفاتورة
-            story.extend(self.create_invoice_header(invoice_data))
-            
-            # إضافة معلومات الزبون
-            story.extend(self.create_customer_info(invoice_data))
-            
-            # إضافة جدول المنتجات
-            story.extend(self.create_products_table(invoice_data))
-            
-            # إضافة الإجمالي
-            story.extend(self.create_totals_section(invoice_data))
-            
-            # إضافة معلومات الضمان
-            story.extend(self.create_warranty_section(invoice_data))
-            
-            # إضافة QR Code
-            story.extend(self.create_qr_section(invoice_data))
-            
-            # إضافة تذييل
-            story.extend(self.create_footer())
-            
-            # بناء المستند
-            doc.build(story)
+            self.build_document(self.build_story(invoice_data), output_path)
             
             logger.info(f"تم إنشاء الفاتورة: {output_path}")
             return output_path
@@ -393,17 +514,7 @@ class InvoicePrinter:
             }
             
             # إنشاء QR Code
-            qr = qrcode.QRCode(version=1, box_size=3, border=1)
-            qr.add_data(str(qr_data))
-            qr.make(fit=True)
-            
-            # تحويل إلى صورة
-            qr_img = qr.make_image(fill_color="black", back_color="white")
-            
-            # حفظ مؤقت
-            qr_buffer = io.BytesIO()
-            qr_img.save(qr_buffer, format='PNG')
-            qr_buffer.seek(0)
+            qr_buffer = io.BytesIO(_qr_png(str(qr_data)))
             
             # إضافة QR Code إلى الفاتورة
             qr_image = Image(qr_buffer, width=1.5*inch, height=1.5*inch)
@@ -456,6 +567,24 @@ class InvoicePrinter:
             # إنشاء ملف PDF
             pdf_path = self.create_invoice(invoice_data)
             
+            return self.print_pdf(pdf_path, printer_name)
+            
+        except Exception as e:
+            logger.error(f"خطأ في طباعة الفاتورة: {str(e)}")
+            return False
+    
+    def print_pdf(self, pdf_path: str, printer_name: str = None) -> bool:
+        """
+        إرسال ملف فاتورة جاهز إلى الطابعة
+        
+        Args:
+            pdf_path: مسار ملف PDF
+            printer_name: اسم الطابعة (اختياري)
+            
+        Returns:
+            True إذا تمت الطباعة بنجاح، False خلاف ذلك
+        """
+        try:
             # طباعة الملف
             if os.name == 'nt':  # Windows
                 if printer_name:
@@ -474,6 +603,131 @@ class InvoicePrinter:
         except Exception as e:
             logger.error(f"خطأ في طباعة الفاتورة: {str(e)}")
             return False
+    
+    def create_invoices_batch(self, invoices: List[Dict], output_dir: str = None,
+                              merged_path: str = None, max_workers: int = None,
+                              chunk_size: int = 8) -> Dict:
+        """
+        إنشاء عدد كبير من الفواتير (مثل إعادة طباعة فواتير شهر كامل) موزعة على عدة عمليات
+        
+        تُهيأ كل عملية مرة واحدة وتأخذ الفواتير على دفعات لتقليل كلفة التواصل بين العمليات.
+        مع معالج واحد أو دفعة صغيرة تُنشأ الفواتير في العملية الحالية. الملف المدمج يُجمع
+        بمكتبة pypdf، وبدونها يُبنى كمستند واحد في العملية الحالية.
+        
+        Args:
+            invoices: قائمة بيانات الفواتير
+            output_dir: مجلد ملفات PDF المنفصلة (ملف لكل فاتورة)
+            merged_path: مسار ملف PDF واحد يضم كل الفواتير بالترتيب
+            max_workers: عدد العمليات (الافتراضي عدد المعالجات)
+            chunk_size: عدد الفواتير في كل مهمة
+            
+        Returns:
+            {'count', 'rendered', 'failed', 'files', 'merged_path', 'workers', 'seconds', 'invoices_per_second'}
+        """
+        if not output_dir and not merged_path:
+            raise ValueError("يجب تحديد مجلد الإخراج أو مسار الملف المدمج")
+        
+        started = time.monotonic()
+        merge_in_workers = bool(merged_path) and PYPDF_AVAILABLE
+        if merged_path and not PYPDF_AVAILABLE:
+            logger.warning("مكتبة pypdf غير متوفرة، سيُبنى الملف المدمج في العملية الحالية")
+        
+        # أسماء الملفات المنفصلة
+        file_paths = {}
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+            used = set()
+            for index, invoice_data in enumerate(invoices):
+                number = str(invoice_data.get('invoice_number') or index + 1).replace('/', '-').replace('\\', '-')
+                name = f"invoice_{number}.pdf"
+                if name in used:
+                    name = f"invoice_{number}_{index + 1}.pdf"
+                used.add(name)
+                file_paths[index] = os.path.join(output_dir, name)
+        
+        # العمليات تكتب الملفات مباشرة، أو تعيد محتوى PDF عند الدمج
+        if merge_in_workers:
+            items = [(index, invoice_data, None) for index, invoice_data in enumerate(invoices)]
+        else:
+            items = [(index, invoices[index], path) for index, path in file_paths.items()]
+        
+        chunks = [items[i:i + chunk_size] for i in range(0, len(items), chunk_size)]
+        workers = max(1, min(max_workers or os.cpu_count() or 1, len(chunks)))
+        
+        results = {}
+        errors = {}
+        
+        def collect(chunk_results):
+            for index, result, error in chunk_results:
+                if error:
+                    errors[index] = error
+                else:
+                    results[index] = result
+        
+        if workers > 1:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_batch_worker,
+                                     initargs=(self.company_info,)) as pool:
+                futures = [pool.submit(_render_batch_chunk, chunk) for chunk in chunks]
+                for future in as_completed(futures):
+                    collect(future.result())
+        else:
+            for chunk in chunks:
+                collect(_render_batch_chunk(chunk, self))
+        
+        if merge_in_workers:
+            writer = PdfWriter()
+            for index in sorted(results):
+                if index in file_paths:
+                    with open(file_paths[index], 'wb') as f:
+                        f.write(results[index])
+                writer.append(PdfReader(io.BytesIO(results[index])))
+            
+            with open(merged_path, 'wb') as f:
+                writer.write(f)
+        elif merged_path:
+            story = []
+            for index, invoice_data in enumerate(invoices):
+                if index in errors:
+                    continue
+                try:
+                    invoice_story = self.build_story(invoice_data)
+                except Exception as e:
+                    errors[index] = str(e)
+                    continue
+                if story:
+                    story.append(PageBreak())
+                story.extend(invoice_story)
+                results.setdefault(index, None)
+            
+            self.build_document(story, merged_path)
+        
+        seconds = time.monotonic() - started
+        failed = [
+            {
+                'index': index,
+                'invoice_number': invoices[index].get('invoice_number'),
+                'error': errors[index]
+            } for index in sorted(errors)
+        ]
+        for item in failed:
+            logger.error(f"خطأ في إنشاء الفاتورة {item['invoice_number']}: {item['error']}")
+        
+        metrics = {
+            'count': len(invoices),
+            'rendered': len(results),
+            'failed': failed,
+            'files': [file_paths[index] for index in sorted(results) if index in file_paths],
+            'merged_path': merged_path,
+            'workers': workers,
+            'seconds': round(seconds, 3),
+            'invoices_per_second': round(len(results) / seconds, 2) if seconds > 0 else None
+        }
+        
+        logger.info(
+            f"تم إنشاء {metrics['rendered']} فاتورة من {metrics['count']} خلال {metrics['seconds']} ثانية "
+            f"({metrics['invoices_per_second']} فاتورة/ثانية، {workers} عملية)"
+        )
+        return metrics
 
 
 # مثال على الاستخدام
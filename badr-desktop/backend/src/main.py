@@ -71,6 +71,11 @@ def telegram_settings():
             'message': 'تم حفظ إعدادات التليجرام بنجاح'
         })
 
+@app.route('/api/telegram/metrics', methods=['GET'])
+def telegram_metrics():
+    """إحصائيات طابور التليجرام وإعادة استخدام الاتصالات"""
+    return jsonify(telegram_service.get_metrics())
+
 @app.route('/api/telegram/test', methods=['POST'])
 def test_telegram():
     """اختبار إرسال رسالة تجريبية للتليجرام"""
@@ -89,7 +94,7 @@ def test_telegram():
 🏪 <i>البدر للإنارة</i>
     """.strip()
     
-    success = telegram_service.send_message(test_message)
+    success = telegram_service.send_message(test_message, wait=True)
     
     if success:
         return jsonify({
@@ -109,6 +114,134 @@ db.init_app(app)
 with app.app_context():
     db.create_all()
 
+# النسخ الاحتياطي المجدول (يُفعَّل بتعبير cron في متغير البيئة، مثل "30 23 * * *")
+backup_scheduler = None
+
+# طابور رفع النسخ المجدولة إلى Google Drive (يُفعَّل بتحديد ملف اعتماد Google Drive)
+drive_upload_queue = None
+
+def start_drive_upload_queue(backup_system):
+    """
+    تشغيل طابور الرفع إلى Google Drive
+    
+    Returns:
+        دالة رفع النسخة بعد إنشائها (on_backup_created) أو None إذا لم يُفعَّل الرفع
+    """
+    global drive_upload_queue
+    if not os.environ.get('GOOGLE_DRIVE_CREDENTIALS'):
+        return None
+    
+    import atexit
+    from src.google_drive_backup import GOOGLE_DRIVE_AVAILABLE, GoogleDriveBackup, DriveUploadQueue, AutoBackupManager
+    
+    if not GOOGLE_DRIVE_AVAILABLE:
+        print("Google Drive upload disabled: Google API libraries are not installed")
+        return None
+    
+    drive = GoogleDriveBackup(
+        os.environ['GOOGLE_DRIVE_CREDENTIALS'],
+        os.environ.get('GOOGLE_DRIVE_TOKEN', os.path.join(backup_system.backup_dir, 'token.pickle'))
+    )
+    queue = DriveUploadQueue(
+        drive,
+        bandwidth_bytes_per_second=float(os.environ.get('DRIVE_UPLOAD_KB_PER_SECOND', '256')) * 1024
+    )
+    manager = AutoBackupManager(backup_system, drive, upload_queue=queue)
+    
+    # يستأنف أيضاً ما بقي في الطابور من تشغيل سابق
+    queue.start()
+    atexit.register(queue.close)
+    drive_upload_queue = queue
+    
+    return manager.upload_backup_file
+
+def start_backup_scheduler():
+    """تشغيل جدول النسخ الاحتياطي في عملية الخادم فقط"""
+    global backup_scheduler
+    if not os.environ.get('BACKUP_SCHEDULE'):
+        return
+    
+    from src.backup_system import BackupSystem
+    
+    backup_system = BackupSystem(
+        os.path.join(os.path.dirname(__file__), 'database', 'app.db'),
+        os.environ.get('BACKUP_DIR', os.path.join(os.path.dirname(__file__), 'backups'))
+    )
+    try:
+        on_backup_created = start_drive_upload_queue(backup_system)
+    except Exception as e:
+        print(f"Error starting Google Drive upload queue: {e}")
+        on_backup_created = None
+    
+    backup_scheduler = backup_system.schedule_automatic_backup(
+        os.environ.get('BACKUP_TYPE', 'full'),
+        cron=os.environ['BACKUP_SCHEDULE'],
+        read_bytes_per_second=float(os.environ.get('BACKUP_READ_MB_PER_SECOND', '8')) * 1024 * 1024,
+        on_backup_created=on_backup_created
+    )
+
+# النسخ المستمر لسجل WAL (يُفعَّل بتحديد مجلد النسخة، ويُفضل أن يكون على قرص آخر)
+wal_replicator = None
+
+def start_wal_replicator():
+    """تشغيل ناسخ WAL في عملية الخادم فقط (يرفض الناسخ العمل إذا كانت عملية أخرى تنسخ)"""
+    global wal_replicator
+    if not os.environ.get('WAL_REPLICA_DIR'):
+        return
+    
+    import atexit
+    from src.wal_replicator import WalReplicator
+    
+    replicator = WalReplicator(
+        os.path.join(os.path.dirname(__file__), 'database', 'app.db'),
+        os.environ['WAL_REPLICA_DIR']
+    )
+    try:
+        replicator.start()
+    except Exception as e:
+        print(f"Error starting WAL replication: {e}")
+        return
+    
+    atexit.register(replicator.close)
+    wal_replicator = replicator
+
+def start_background_services():
+    """
+    تشغيل الخدمات الخلفية
+    
+    لا تُشغَّل عند الاستيراد: عملية المراقبة في وضع debug وعمليات المجمعات (spawn على Windows)
+    تستورد هذا الملف أيضاً، فيجب أن تعمل الخدمات في عملية الخادم وحدها.
+    """
+    start_backup_scheduler()
+    start_wal_replicator()
+
+@app.route('/api/backup/replication', methods=['GET'])
+def backup_replication():
+    """حالة النسخ المستمر والفترات المتاحة للاستعادة"""
+    if wal_replicator is None:
+        return jsonify({'enabled': False})
+    
+    from src.wal_replicator import list_restore_points
+    return jsonify({
+        'enabled': True,
+        **wal_replicator.get_status(),
+        'restore_points': list_restore_points(wal_replicator.replica_dir)
+    })
+
+@app.route('/api/backup/metrics', methods=['GET'])
+def backup_metrics():
+    """مواعيد النسخ الاحتياطي المجدول وإحصائيات آخر تشغيل"""
+    if backup_scheduler is None:
+        return jsonify({'enabled': False})
+    return jsonify({'enabled': True, **backup_scheduler.get_metrics()})
+
+@app.route('/api/backup/uploads', methods=['GET'])
+def backup_uploads():
+    """حالة طابور رفع النسخ إلى Google Drive وآخر العناصر فيه"""
+    if drive_upload_queue is None:
+        return jsonify({'enabled': False})
+    return jsonify({'enabled': True, **drive_upload_queue.get_status()})
+
 @app.route('/', defaults={'path': ''})
 @app.route('/<path:path>')
 def serve(path):
@@ -127,4 +260,10 @@ def serve(path):
 
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5001, debug=True)
+    debug = True
+    
+    # مع debug تعيد عملية المراقبة تشغيل الملف في عملية فرعية هي التي تخدم الطلبات
+    if not debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_background_services()
+    
+    app.run(host='0.0.0.0', port=5001, debug=debug)
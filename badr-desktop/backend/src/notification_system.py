@@ -3,7 +3,6 @@
 يدعم إرسال إشعارات عبر Telegram و WhatsApp
 """
 
-import requests
 import json
 from datetime import datetime
 from typing import Dict, List, Optional
@@ -11,26 +10,191 @@ import logging
 import sqlite3
 import asyncio
 import aiohttp
+import re
+import threading
+import time
+import zlib
+from concurrent.futures import wait as wait_futures
 from urllib.parse import quote
 
+try:
+    from src.services.telegram_scheduler import (
+        telegram_scheduler, PRIORITY_ALERT, PRIORITY_NORMAL, PRIORITY_DIGEST
+    )
+except ImportError:
+    # التشغيل المستقل من داخل مجلد src
+    from services.telegram_scheduler import (
+        telegram_scheduler, PRIORITY_ALERT, PRIORITY_NORMAL, PRIORITY_DIGEST
+    )
+
 # إعداد نظام السجلات
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+class AsyncFanoutClient:
+    """
+    محرك إرسال متوازي لطلبات HTTP متعددة المستقبلين
+    
+    يعمل على حلقة asyncio في خيط خلفي مع جلسة aiohttp مشتركة
+    تحافظ على الاتصالات مفتوحة (keep-alive) بين عمليات الإرسال.
+    """
+    
+    def __init__(self, max_concurrency: int = 10, request_timeout: float = 10):
+        """
+        تهيئة محرك الإرسال
+        
+        Args:
+            max_concurrency: الحد الأقصى للطلبات المتزامنة
+            request_timeout: مهلة كل مستقبل بالثواني
+        """
+        self.max_concurrency = max_concurrency
+        self.request_timeout = request_timeout
+        
+        self._loop = None
+        self._thread = None
+        self._session = None
+        self._lock = threading.Lock()
+    
+    def _ensure_loop(self):
+        """تشغيل حلقة asyncio في الخلفية عند أول استخدام"""
+        with self._lock:
+            if self._loop and self._thread.is_alive():
+                return
+            
+            self._loop = asyncio.new_event_loop()
+            self._thread = threading.Thread(target=self._loop.run_forever,
+                                            name="notification-fanout", daemon=True)
+            self._thread.start()
+    
+    async def _get_session(self) -> aiohttp.ClientSession:
+        """الجلسة المشتركة (تُنشأ داخل حلقة الخلفية)"""
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.max_concurrency, keepalive_timeout=60)
+            self._session = aiohttp.ClientSession(connector=connector)
+        return self._session
+    
+    async def _post(self, session, semaphore, request: Dict) -> Dict:
+        """إرسال طلب واحد مع مهلة خاصة به"""
+        result = {'recipient': request['recipient'], 'success': False,
+                  'status': None, 'response': None, 'error': None}
+        
+        async with semaphore:
+            try:
+                timeout = aiohttp.ClientTimeout(total=self.request_timeout)
+                async with session.post(request['url'], json=request.get('json'),
+                                        headers=request.get('headers'), timeout=timeout) as response:
+                    result['status'] = response.status
+                    result['response'] = await response.text()
+                    result['success'] = response.status == 200
+            
+            except asyncio.TimeoutError:
+                result['error'] = f"انتهت المهلة بعد {self.request_timeout} ثانية"
+            except Exception as e:
+                result['error'] = str(e)
+        
+        return result
+    
+    async def _post_all(self, requests_list: List[Dict]) -> List[Dict]:
+        """إرسال جميع الطلبات بالتوازي ضمن حد التزامن"""
+        session = await self._get_session()
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        
+        return await asyncio.gather(*(self._post(session, semaphore, request)
+                                      for request in requests_list))
+    
+    def post_all(self, requests_list: List[Dict]) -> List[Dict]:
+        """
+        إرسال مجموعة طلبات POST بشكل متوازٍ وانتظار النتائج
+        
+        Args:
+            requests_list: قائمة طلبات كل منها {'recipient', 'url', 'json', 'headers'}
+            
+        Returns:
+            نتيجة كل طلب بنفس الترتيب
+        """
+        if not requests_list:
+            return []
+        
+        self._ensure_loop()
+        future = asyncio.run_coroutine_threadsafe(self._post_all(requests_list), self._loop)
+        
+        # مهلة إضافية تغطي الانتظار خلف حد التزامن
+        waves = -(-len(requests_list) // self.max_concurrency)
+        return future.result(timeout=self.request_timeout * waves + 5)
+    
+    def close(self):
+        """إغلاق الجلسة المشتركة وإيقاف حلقة الخلفية"""
+        with self._lock:
+            if not self._loop:
+                return
+            
+            if self._session is not None:
+                asyncio.run_coroutine_threadsafe(self._session.close(), self._loop).result(timeout=5)
+                self._session = None
+            
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join(timeout=5)
+            self._loop.close()
+            self._loop = None
+            self._thread = None
+
+
 class NotificationSystem:
     """نظام الإشعارات"""
     
-    def __init__(self, db_path: str = "notifications.sqlite"):
+    # نمط المتغيرات داخل القوالب مثل {invoice_number}
+    PLACEHOLDER_PATTERN = re.compile(r'\{(\w+)\}')
+    
+    # أولوية إرسال كل قالب عبر مجدول التليجرام
+    TEMPLATE_PRIORITIES = {
+        'new_sale': PRIORITY_ALERT,
+        'payment_received': PRIORITY_ALERT,
+        'low_stock': PRIORITY_NORMAL,
+        'new_product': PRIORITY_NORMAL,
+        'warranty_expiring': PRIORITY_DIGEST
+    }
+    
+    # الرسائل الأقصر من هذا الحد لا تُضغط لأن الضغط لا يوفر فيها شيئاً
+    COMPRESSION_MIN_LENGTH = 256
+    
+    def __init__(self, db_path: str = "notifications.sqlite", max_concurrency: int = 10,
+                 request_timeout: float = 10, retention_days: int = 90,
+                 max_log_rows: int = 100000, compress_messages: bool = False,
+                 prune_log: bool = True):
         """
         تهيئة نظام الإشعارات
         
         Args:
             db_path: مسار قاعدة البيانات
+            max_concurrency: الحد الأقصى للإرسال المتزامن لعدة مستقبلين
+            request_timeout: مهلة الإرسال لكل مستقبل بالثواني
+            retention_days: مدة الاحتفاظ بسجل الإشعارات (None بلا حد)
+            max_log_rows: الحد الأقصى لعدد سجلات الإشعارات (None بلا حد)
+            compress_messages: ضغط نصوص الرسائل الطويلة في السجل
+            prune_log: تشغيل تنظيف السجل حسب سياسة الاحتفاظ في الخلفية (False لمن يديره بنفسه)
         """
         self.db_path = db_path
+        self.fanout = AsyncFanoutClient(max_concurrency, request_timeout)
+        
+        # سياسة الاحتفاظ بسجل الإشعارات
+        self.retention_days = retention_days
+        self.max_log_rows = max_log_rows
+        self.compress_messages = compress_messages
+        self._pruner_thread = None
+        self._pruner_stop = threading.Event()
+        
+        # ذاكرة مؤقتة للإعدادات والقوالب المُجزأة
+        self._settings_loaded = False
+        self._template_cache: Dict[str, Optional[tuple]] = {}
+        
         self.init_database()
         
+        # تطبيق سياسة الاحتفاظ افتراضياً حتى لا يكبر السجل بلا حد
+        if prune_log and (retention_days is not None or max_log_rows is not None):
+            self.start_log_pruner()
+        
         # إعدادات Telegram
+        self.telegram_api_url = "https://api.telegram.org"
         self.telegram_bot_token = None
         self.telegram_chat_ids = []
         
@@ -88,6 +252,25 @@ class NotificationSystem:
                 )
             ''')
             
+            # عمود الضغط لقواعد البيانات المنشأة قبل إضافته
+            cursor.execute("PRAGMA table_info(notification_log)")
+            if 'compressed' not in [column[1] for column in cursor.fetchall()]:
+                cursor.execute("ALTER TABLE notification_log ADD COLUMN compressed INTEGER DEFAULT 0")
+            
+            # فهارس سجل الإشعارات: التنظيف حسب العمر والتصفح حسب المنصة والحالة
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_notification_log_created
+                ON notification_log (created_at)
+            ''')
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_notification_log_platform
+                ON notification_log (platform, id)
+            ''')
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_notification_log_status
+                ON notification_log (status, id)
+            ''')
+            
             # جدول قوالب الإشعارات
             cursor.execute('''
                 CREATE TABLE IF NOT EXISTS notification_templates (
@@ -230,6 +413,8 @@ class NotificationSystem:
             conn.commit()
             conn.close()
             
+            self.invalidate_settings_cache()
+            
             logger.info("تم تكوين إعدادات Telegram")
             
         except Exception as e:
@@ -280,14 +465,43 @@ class NotificationSystem:
             conn.commit()
             conn.close()
             
+            self.invalidate_settings_cache()
+            
             logger.info("تم تكوين إعدادات WhatsApp")
             
         except Exception as e:
             logger.error(f"خطأ في تكوين WhatsApp: {str(e)}")
             raise
     
-    def load_settings(self):
-        """تحميل الإعدادات من قاعدة البيانات"""
+    def invalidate_settings_cache(self):
+        """إبطال الإعدادات المحملة لتُقرأ من قاعدة البيانات عند الإرسال التالي"""
+        self._settings_loaded = False
+    
+    def invalidate_template_cache(self, template_name: str = None):
+        """
+        إبطال القوالب المحملة
+        
+        Args:
+            template_name: اسم القالب (None لإبطال جميع القوالب)
+        """
+        if template_name is None:
+            self._template_cache.clear()
+        else:
+            self._template_cache.pop(template_name, None)
+    
+    def load_settings(self, force: bool = False):
+        """
+        تحميل الإعدادات من قاعدة البيانات
+        
+        تُقرأ الإعدادات مرة واحدة ثم تُستخدم من الذاكرة حتى تُبطل
+        عبر configure_telegram أو configure_whatsapp.
+        
+        Args:
+            force: إعادة التحميل حتى لو كانت الإعدادات محملة
+        """
+        if self._settings_loaded and not force:
+            return
+        
         try:
             conn = sqlite3.connect(self.db_path)
             cursor = conn.cursor()
@@ -327,9 +541,44 @@ class NotificationSystem:
             
             conn.close()
             
+            self._settings_loaded = True
+            
         except Exception as e:
             logger.error(f"خطأ في تحميل الإعدادات: {str(e)}")
     
+    def compile_template(self, template: str) -> tuple:
+        """
+        تجزئة القالب مرة واحدة إلى نصوص ثابتة وأسماء متغيرات
+        
+        Args:
+            template: محتوى القالب
+            
+        Returns:
+            (محتوى القالب، أجزاء القالب) حيث الأجزاء الفردية أسماء متغيرات
+        """
+        return template, tuple(self.PLACEHOLDER_PATTERN.split(template))
+    
+    def _get_compiled_template(self, template_name: str) -> Optional[tuple]:
+        """الحصول على القالب المُجزأ من الذاكرة أو من قاعدة البيانات"""
+        if template_name in self._template_cache:
+            return self._template_cache[template_name]
+        
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        
+        cursor.execute('''
+            SELECT template_content FROM notification_templates 
+            WHERE template_name = ?
+        ''', (template_name,))
+        
+        result = cursor.fetchone()
+        conn.close()
+        
+        compiled = self.compile_template(result[0]) if result else None
+        self._template_cache[template_name] = compiled
+        
+        return compiled
+    
     def get_template(self, template_name: str) -> Optional[str]:
         """
         الحصول على قالب إشعار
@@ -341,22 +590,56 @@ class NotificationSystem:
             محتوى القالب أو None
         """
         try:
+            compiled = self._get_compiled_template(template_name)
+            return compiled[0] if compiled else None
+            
+        except Exception as e:
+            logger.error(f"خطأ في الحصول على القالب: {str(e)}")
+            return None
+    
+    def update_template(self, template_name: str, template_content: str,
+                        variables: str = None, description: str = None) -> bool:
+        """
+        إضافة أو تعديل قالب إشعار
+        
+        Args:
+            template_name: اسم القالب
+            template_content: محتوى القالب
+            variables: أسماء المتغيرات مفصولة بفواصل (اختياري)
+            description: وصف القالب (اختياري)
+            
+        Returns:
+            True إذا تم الحفظ بنجاح، False خلاف ذلك
+        """
+        try:
+            if variables is None:
+                variables = ','.join(dict.fromkeys(self.PLACEHOLDER_PATTERN.findall(template_content)))
+            
             conn = sqlite3.connect(self.db_path)
             cursor = conn.cursor()
             
             cursor.execute('''
-                SELECT template_content FROM notification_templates 
-                WHERE template_name = ?
-            ''', (template_name,))
+                INSERT INTO notification_templates 
+                (template_name, template_content, variables, description)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT (template_name) DO UPDATE SET
+                    template_content = excluded.template_content,
+                    variables = excluded.variables,
+                    description = COALESCE(excluded.description, description),
+                    updated_at = ?
+            ''', (template_name, template_content, variables, description, datetime.now().isoformat()))
             
-            result = cursor.fetchone()
+            conn.commit()
             conn.close()
             
-            return result[0] if result else None
+            self.invalidate_template_cache(template_name)
+            
+            logger.info(f"تم حفظ القالب: {template_name}")
+            return True
             
         except Exception as e:
-            logger.error(f"خطأ في الحصول على القالب: {str(e)}")
-            return None
+            logger.error(f"خطأ في حفظ القالب: {str(e)}")
+            return False
     
     def format_message(self, template_name: str, variables: Dict) -> str:
         """
@@ -370,32 +653,66 @@ class NotificationSystem:
             الرسالة المنسقة
         """
         try:
-            template = self.get_template(template_name)
-            if not template:
+            compiled = self._get_compiled_template(template_name)
+            if not compiled:
                 return f"قالب غير موجود: {template_name}"
             
-            # استبدال المتغيرات
-            formatted_message = template
-            for key, value in variables.items():
-                placeholder = f"{{{key}}}"
-                formatted_message = formatted_message.replace(placeholder, str(value))
+            # استبدال المتغيرات، والمتغيرات غير الممررة تبقى كما هي
+            parts = compiled[1]
+            formatted_parts = list(parts)
+            for index in range(1, len(parts), 2):
+                key = parts[index]
+                formatted_parts[index] = str(variables[key]) if key in variables else f"{{{key}}}"
             
-            return formatted_message
+            return ''.join(formatted_parts)
             
         except Exception as e:
             logger.error(f"خطأ في تنسيق الرسالة: {str(e)}")
             return f"خطأ في تنسيق الرسالة: {str(e)}"
     
-    def send_telegram_message(self, message: str, chat_id: str = None) -> bool:
+    def _log_fanout_results(self, platform: str, message: str, results: List[Dict]) -> int:
+        """
+        تسجيل نتائج الإرسال المتوازي دفعة واحدة
+        
+        Returns:
+            عدد المستقبلين الذين تم الإرسال لهم بنجاح
+        """
+        entries = []
+        
+        for result in results:
+            recipient = result['recipient']
+            
+            if result['success']:
+                entries.append((platform, recipient, 'message', message, 'sent', None))
+                logger.info(f"تم إرسال رسالة {platform} إلى {recipient}")
+            elif result.get('queued'):
+                entries.append((platform, recipient, 'message', message, 'queued', None))
+                logger.info(f"رسالة {platform} إلى {recipient} بانتظار الإرسال")
+            else:
+                error_msg = result['error'] or f"خطأ HTTP {result['status']}: {result['response']}"
+                entries.append((platform, recipient, 'message', message, 'failed', error_msg))
+                logger.error(f"فشل إرسال رسالة {platform} إلى {recipient}: {error_msg}")
+        
+        self.log_notifications(entries)
+        
+        return sum(1 for result in results if result['success'] or result.get('queued'))
+    
+    def send_telegram_message(self, message: str, chat_id: str = None,
+                              priority: int = PRIORITY_NORMAL) -> bool:
         """
         إرسال رسالة عبر Telegram
         
+        تمر الرسائل عبر مجدول التليجرام المشترك الذي يحترم حدود المعدل
+        ويرسل لعدة محادثات بالتوازي. الرسائل التي لم تُرسل خلال مهلة
+        الانتظار تبقى في الطابور وتُسجل بحالة queued.
+        
         Args:
             message: الرسالة
             chat_id: معرف المحادثة (اختياري)
+            priority: أولوية الرسالة في المجدول
             
         Returns:
-            True إذا تم الإرسال بنجاح، False خلاف ذلك
+            True إذا تم الإرسال أو الحفظ في الطابور بنجاح، False خلاف ذلك
         """
         try:
             if not self.telegram_bot_token:
@@ -408,35 +725,21 @@ class NotificationSystem:
                 logger.error("لا توجد معرفات محادثة Telegram")
                 return False
             
-            success_count = 0
+            futures = {
+                cid: telegram_scheduler.enqueue(self.telegram_bot_token, cid, message, priority,
+                                                api_url=self.telegram_api_url)
+                for cid in chat_ids
+            }
+            wait_futures(futures.values(), timeout=self.fanout.request_timeout)
             
-            for cid in chat_ids:
-                try:
-                    url = f"https://api.telegram.org/bot{self.telegram_bot_token}/sendMessage"
-                    
-                    payload = {
-                        'chat_id': cid,
-                        'text': message,
-                        'parse_mode': 'HTML'
-                    }
-                    
-                    response = requests.post(url, json=payload, timeout=10)
-                    
-                    if response.status_code == 200:
-                        success_count += 1
-                        self.log_notification('telegram', cid, 'message', message, 'sent')
-                        logger.info(f"تم إرسال رسالة Telegram إلى {cid}")
-                    else:
-                        error_msg = f"خطأ HTTP {response.status_code}: {response.text}"
-                        self.log_notification('telegram', cid, 'message', message, 'failed', error_msg)
-                        logger.error(f"فشل إرسال رسالة Telegram إلى {cid}: {error_msg}")
-                
-                except Exception as e:
-                    error_msg = str(e)
-                    self.log_notification('telegram', cid, 'message', message, 'failed', error_msg)
-                    logger.error(f"خطأ في إرسال رسالة Telegram إلى {cid}: {error_msg}")
+            results = []
+            for cid, future in futures.items():
+                if future.done():
+                    results.append({'recipient': cid, **future.result()})
+                else:
+                    results.append({'recipient': cid, 'success': False, 'queued': True})
             
-            return success_count > 0
+            return self._log_fanout_results('telegram', message, results) > 0
             
         except Exception as e:
             logger.error(f"خطأ في إرسال رسالة Telegram: {str(e)}")
@@ -446,6 +749,8 @@ class NotificationSystem:
         """
         إرسال رسالة عبر WhatsApp
         
+        يُرسل إلى جميع الأرقام بالتوازي عبر جلسة مشتركة.
+        
         Args:
             message: الرسالة
             phone_number: رقم الهاتف (اختياري)
@@ -464,44 +769,26 @@ class NotificationSystem:
                 logger.error("لا توجد أرقام هواتف WhatsApp")
                 return False
             
-            success_count = 0
+            # إعداد الطلب (يعتمد على نوع API المستخدم)
+            headers = {
+                'Authorization': f'Bearer {self.whatsapp_api_key}',
+                'Content-Type': 'application/json'
+            }
             
-            for phone in phone_numbers:
-                try:
-                    # تنسيق رقم الهاتف (إزالة الرموز الخاصة)
-                    clean_phone = ''.join(filter(str.isdigit, phone))
-                    
-                    # إعداد الطلب (يعتمد على نوع API المستخدم)
-                    headers = {
-                        'Authorization': f'Bearer {self.whatsapp_api_key}',
-                        'Content-Type': 'application/json'
-                    }
-                    
-                    payload = {
-                        'phone': clean_phone,
+            results = self.fanout.post_all([
+                {
+                    'recipient': phone,
+                    'url': self.whatsapp_api_url,
+                    'headers': headers,
+                    'json': {
+                        # تنسيق رقم الهاتف (إزالة الرموز الخاصة)
+                        'phone': ''.join(filter(str.isdigit, phone)),
                         'message': message
                     }
-                    
-                    response = requests.post(self.whatsapp_api_url, 
-                                           headers=headers, 
-                                           json=payload, 
-                                           timeout=10)
-                    
-                    if response.status_code == 200:
-                        success_count += 1
-                        self.log_notification('whatsapp', phone, 'message', message, 'sent')
-                        logger.info(f"تم إرسال رسالة WhatsApp إلى {phone}")
-                    else:
-                        error_msg = f"خطأ HTTP {response.status_code}: {response.text}"
-                        self.log_notification('whatsapp', phone, 'message', message, 'failed', error_msg)
-                        logger.error(f"فشل إرسال رسالة WhatsApp إلى {phone}: {error_msg}")
-                
-                except Exception as e:
-                    error_msg = str(e)
-                    self.log_notification('whatsapp', phone, 'message', message, 'failed', error_msg)
-                    logger.error(f"خطأ في إرسال رسالة WhatsApp إلى {phone}: {error_msg}")
+                } for phone in phone_numbers
+            ])
             
-            return success_count > 0
+            return self._log_fanout_results('whatsapp', message, results) > 0
             
         except Exception as e:
             logger.error(f"خطأ في إرسال رسالة WhatsApp: {str(e)}")
@@ -535,7 +822,8 @@ class NotificationSystem:
             
             # إرسال عبر Telegram
             if 'telegram' in platforms:
-                results['telegram'] = self.send_telegram_message(message)
+                priority = self.TEMPLATE_PRIORITIES.get(template_name, PRIORITY_NORMAL)
+                results['telegram'] = self.send_telegram_message(message, priority=priority)
             
             # إرسال عبر WhatsApp
             if 'whatsapp' in platforms:
@@ -566,12 +854,15 @@ class NotificationSystem:
             cursor = conn.cursor()
             
             sent_at = datetime.now().isoformat() if status == 'sent' else None
+            stored_message, compressed = self._encode_message(message)
             
             cursor.execute('''
                 INSERT INTO notification_log 
-                (platform, recipient_id, notification_type, message, status, error_message, sent_at)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-            ''', (platform, recipient_id, notification_type, message, status, error_message, sent_at))
+                (platform, recipient_id, notification_type, message, status, error_message, sent_at,
+                 compressed)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (platform, recipient_id, notification_type, stored_message, status, error_message,
+                  sent_at, compressed))
             
             conn.commit()
             conn.close()
@@ -579,12 +870,78 @@ class NotificationSystem:
         except Exception as e:
             logger.error(f"خطأ في تسجيل الإشعار: {str(e)}")
     
-    def get_notification_history(self, limit: int = 100) -> List[Dict]:
+    def log_notifications(self, entries: List[tuple]):
+        """
+        تسجيل مجموعة إشعارات في معاملة واحدة
+        
+        Args:
+            entries: قائمة (المنصة، المستقبل، النوع، الرسالة، الحالة، رسالة الخطأ)
+        """
+        if not entries:
+            return
+        
+        try:
+            conn = sqlite3.connect(self.db_path)
+            cursor = conn.cursor()
+            
+            sent_at = datetime.now().isoformat()
+            
+            # الرسالة نفسها تتكرر لكل مستقبل فتُضغط مرة واحدة
+            encoded = {}
+            rows = []
+            for platform, recipient_id, notification_type, message, status, error_message in entries:
+                if message not in encoded:
+                    encoded[message] = self._encode_message(message)
+                stored_message, compressed = encoded[message]
+                rows.append((platform, recipient_id, notification_type, stored_message, status,
+                             error_message, sent_at if status == 'sent' else None, compressed))
+            
+            cursor.executemany('''
+                INSERT INTO notification_log 
+                (platform, recipient_id, notification_type, message, status, error_message, sent_at,
+                 compressed)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ''', rows)
+            
+            conn.commit()
+            conn.close()
+            
+        except Exception as e:
+            logger.error(f"خطأ في تسجيل الإشعارات: {str(e)}")
+    
+    def _encode_message(self, message: str) -> tuple:
         """
-        الحصول على تاريخ الإشعارات
+        تجهيز نص الرسالة للتخزين في السجل
+        
+        Returns:
+            (القيمة المخزنة، 1 إذا كانت مضغوطة وإلا 0)
+        """
+        if self.compress_messages and len(message) >= self.COMPRESSION_MIN_LENGTH:
+            packed = zlib.compress(message.encode('utf-8'))
+            if len(packed) < len(message.encode('utf-8')):
+                return sqlite3.Binary(packed), 1
+        return message, 0
+    
+    @staticmethod
+    def _decode_message(message, compressed) -> str:
+        """استرجاع نص الرسالة من قيمتها المخزنة"""
+        if compressed:
+            return zlib.decompress(message).decode('utf-8')
+        return message
+    
+    def get_notification_history(self, limit: int = 100, before_id: int = None,
+                                 platform: str = None, status: str = None) -> List[Dict]:
+        """
+        الحصول على تاريخ الإشعارات (الأحدث أولاً)
+        
+        التصفح بالمفتاح: لجلب الصفحة التالية مرر معرف آخر سجل في before_id،
+        فيبقى الاستعلام سريعاً مهما كبر السجل بدلاً من OFFSET.
         
         Args:
             limit: عدد السجلات
+            before_id: جلب السجلات الأقدم من هذا المعرف (اختياري)
+            platform: تصفية حسب المنصة (اختياري)
+            status: تصفية حسب الحالة (اختياري)
             
         Returns:
             قائمة بسجلات الإشعارات
@@ -593,23 +950,161 @@ class NotificationSystem:
             conn = sqlite3.connect(self.db_path)
             cursor = conn.cursor()
             
-            cursor.execute('''
+            conditions = []
+            params = []
+            
+            if before_id is not None:
+                conditions.append("id < ?")
+                params.append(before_id)
+            
+            if platform:
+                conditions.append("platform = ?")
+                params.append(platform)
+            
+            if status:
+                conditions.append("status = ?")
+                params.append(status)
+            
+            where_clause = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+            
+            cursor.execute(f'''
                 SELECT * FROM notification_log 
-                ORDER BY created_at DESC 
+                {where_clause}
+                ORDER BY id DESC 
                 LIMIT ?
-            ''', (limit,))
+            ''', params + [limit])
             
             rows = cursor.fetchall()
             conn.close()
             
             columns = [desc[0] for desc in cursor.description]
-            notifications = [dict(zip(columns, row)) for row in rows]
+            notifications = []
+            for row in rows:
+                notification = dict(zip(columns, row))
+                notification['message'] = self._decode_message(
+                    notification['message'], notification.pop('compressed')
+                )
+                notifications.append(notification)
             
             return notifications
             
         except Exception as e:
             logger.error(f"خطأ في الحصول على تاريخ الإشعارات: {str(e)}")
             return []
+    
+    def prune_notification_log(self, batch_size: int = 500, pause_seconds: float = 0.05) -> int:
+        """
+        حذف سجلات الإشعارات القديمة حسب سياسة الاحتفاظ
+        
+        يُحذف على دفعات صغيرة، كل دفعة في معاملة مستقلة، حتى لا يُحجز قفل
+        الكتابة طويلاً أثناء تسجيل إشعارات جديدة.
+        
+        Args:
+            batch_size: عدد السجلات المحذوفة في كل دفعة
+            pause_seconds: فترة الانتظار بين الدفعات
+            
+        Returns:
+            عدد السجلات المحذوفة
+        """
+        try:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            cursor = conn.cursor()
+            
+            # تحديد أكبر معرف يجب حذفه حسب العمر ثم حسب العدد
+            cutoff_id = None
+            
+            if self.retention_days is not None:
+                cursor.execute('''
+                    SELECT MAX(id) FROM notification_log
+                    WHERE created_at < datetime('now', ?)
+                ''', (f"-{int(self.retention_days)} days",))
+                cutoff_id = cursor.fetchone()[0]
+            
+            if self.max_log_rows is not None:
+                cursor.execute('''
+                    SELECT id FROM notification_log
+                    ORDER BY id DESC
+                    LIMIT 1 OFFSET ?
+                ''', (self.max_log_rows,))
+                row = cursor.fetchone()
+                if row and (cutoff_id is None or row[0] > cutoff_id):
+                    cutoff_id = row[0]
+            
+            deleted = 0
+            
+            while cutoff_id is not None and not self._pruner_stop.is_set():
+                cursor.execute('''
+                    DELETE FROM notification_log
+                    WHERE id IN (
+                        SELECT id FROM notification_log
+                        WHERE id <= ?
+                        ORDER BY id
+                        LIMIT ?
+                    )
+                ''', (cutoff_id, batch_size))
+                conn.commit()
+                
+                deleted += cursor.rowcount
+                if cursor.rowcount < batch_size:
+                    break
+                
+                time.sleep(pause_seconds)
+            
+            conn.close()
+            
+            if deleted:
+                logger.info(f"تم حذف {deleted} سجل إشعار قديم")
+            
+            return deleted
+            
+        except Exception as e:
+            logger.error(f"خطأ في تنظيف سجل الإشعارات: {str(e)}")
+            return 0
+    
+    def start_log_pruner(self, interval_seconds: int = 3600, batch_size: int = 500):
+        """
+        تشغيل تنظيف سجل الإشعارات دورياً في خيط خلفي
+        
+        Args:
+            interval_seconds: الفترة بين كل عملية تنظيف
+            batch_size: عدد السجلات المحذوفة في كل دفعة
+        """
+        if self._pruner_thread and self._pruner_thread.is_alive():
+            return
+        
+        self._pruner_stop.clear()
+        
+        def run():
+            while not self._pruner_stop.is_set():
+                self.prune_notification_log(batch_size)
+                self._pruner_stop.wait(interval_seconds)
+        
+        self._pruner_thread = threading.Thread(target=run, name="notification-log-pruner", daemon=True)
+        self._pruner_thread.start()
+    
+    def stop_log_pruner(self, timeout: float = 5):
+        """
+        إيقاف تنظيف سجل الإشعارات
+        
+        Args:
+            timeout: مهلة انتظار توقف الخيط بالثواني
+            
+        Returns:
+            True إذا توقف الخيط، False إذا لم يتوقف خلال المهلة (يبقى طلب الإيقاف قائماً)
+        """
+        self._pruner_stop.set()
+        
+        if self._pruner_thread:
+            self._pruner_thread.join(timeout)
+            if self._pruner_thread.is_alive():
+                # لا يُعاد ضبط الحالة حتى لا يُشغَّل خيط ثانٍ بجانب الخيط الحالي
+                logger.warning("لم يتوقف خيط تنظيف سجل الإشعارات خلال المهلة")
+                return False
+            self._pruner_thread = None
+        
+        # السماح بالتنظيف اليدوي بعد الإيقاف
+        self._pruner_stop.clear()
+        return True
 
 
 # مثال على الاستخدام
@@ -145,14 +145,20 @@ def update_product(product_id):
         # Send notification for low stock
         if old_quantity > product.min_stock_level and product.quantity <= product.min_stock_level:
             try:
-                message = f"⚠️ تنبيه مخزون قليل\n\n"
-                message += f"المنتج: {product.name}\n"
-                message += f"الكمية المتبقية: {product.quantity}\n"
-                message += f"الحد الأدنى: {product.min_stock_level}"
-                
-                telegram_service.send_notification(message, 'inventory')
+                telegram_service.send_low_stock_alert({
+                    'id': product.id,
+                    'name': product.name,
+                    'quantity': product.quantity,
+                    'min_quantity': product.min_stock_level
+                })
             except Exception as e:
                 print(f"Failed to send low stock notification: {e}")
+        elif old_quantity <= product.min_stock_level < product.quantity:
+            # إعادة التخزين تسمح بتنبيه جديد عند النقص القادم
+            try:
+                telegram_service.low_stock_alerts.clear(product.id)
+            except Exception as e:
+                print(f"Failed to clear low stock alert state: {e}")
         
         return jsonify(product.to_dict())
         
@@ -1,13 +1,56 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, send_file
 from src.models.sale import Sale, SaleItem, db
 from src.models.product import Product
 from src.models.customer import Customer
 from src.models.warranty import Warranty
 from src.services.telegram_service import telegram_service
+from src.services.invoice_cache import invoice_cache
+from src.backup_scheduler import checkout_activity
 from datetime import datetime, timedelta
 
 sale_bp = Blueprint('sale', __name__)
 
+def _sale_invoice_data(sale):
+    """بيانات فاتورة المبيعة كما تُطبع (ومنها تُحسب بصمة الفاتورة المخزنة)"""
+    date, _, time = sale.sale_date.partition(' ')
+    
+    customer = {}
+    if sale.customer_id:
+        customer_obj = Customer.query.get(sale.customer_id)
+        if customer_obj:
+            customer = {
+                'name': customer_obj.name,
+                'phone': customer_obj.phone or 'غير محدد'
+            }
+    
+    products = []
+    for item in sale.items:
+        product = Product.query.get(item.product_id)
+        products.append({
+            'code': (product.qr_code or str(product.id)) if product else '',
+            'name': product.name if product else 'غير محدد',
+            'quantity': item.quantity,
+            'price': item.price
+        })
+    
+    invoice_data = {
+        'invoice_number': f"INV-{sale.id:06d}",
+        'date': date,
+        'time': time,
+        'currency': sale.currency,
+        'customer': customer,
+        'products': products
+    }
+    
+    warranty = Warranty.query.filter_by(sale_id=sale.id).first()
+    if warranty:
+        invoice_data['warranty'] = {
+            'months': warranty.warranty_period_months,
+            'terms': warranty.terms or 'ضمان ضد عيوب الصناعة'
+        }
+    
+    return invoice_data
+
 @sale_bp.route('/sales', methods=['GET'])
 def get_sales():
     sales = Sale.query.all()
@@ -21,6 +64,7 @@ def get_sale(sale_id):
     return jsonify(sale_data)
 
 @sale_bp.route('/sales', methods=['POST'])
+@checkout_activity.track
 def create_sale():
     data = request.get_json()
     
@@ -60,6 +104,7 @@ def create_sale():
             # تحقق من المخزون القليل وإرسال تنبيه
             if product.quantity <= 5:  # يمكن تعديل هذا الرقم
                 telegram_service.send_low_stock_alert({
+                    'id': product.id,
                     'name': product.name,
                     'quantity': product.quantity,
                     'min_quantity': 5
@@ -79,6 +124,12 @@ def create_sale():
     
     db.session.commit()
     
+    # إنشاء الفاتورة في الخلفية لتكون طباعتها فورية
+    try:
+        invoice_cache.prerender(sale.id, _sale_invoice_data(sale))
+    except Exception as e:
+        print(f"Error pre-rendering invoice: {e}")
+    
     # إرسال إشعار التليجرام للمبيعة الجديدة
     try:
         customer_name = 'زبون عادي'
@@ -113,8 +164,42 @@ def delete_sale(sale_id):
     db.session.delete(sale)
     db.session.commit()
     
+    invoice_cache.invalidate(sale_id)
+    
     return '', 204
 
+@sale_bp.route('/sales/<int:sale_id>/invoice', methods=['GET'])
+def get_sale_invoice(sale_id):
+    """ملف PDF فاتورة المبيعة (من التخزين المؤقت إن كان مطابقاً لبياناتها الحالية)"""
+    sale = Sale.query.get_or_404(sale_id)
+    
+    try:
+        pdf_path = invoice_cache.get_invoice(sale.id, _sale_invoice_data(sale))
+        return send_file(pdf_path, mimetype='application/pdf', download_name=f"invoice_{sale.id}.pdf")
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'خطأ: {str(e)}'}), 500
+
+@sale_bp.route('/sales/<int:sale_id>/print', methods=['POST'])
+def print_sale_invoice(sale_id):
+    """طباعة فاتورة المبيعة أو إعادة طباعتها"""
+    sale = Sale.query.get_or_404(sale_id)
+    data = request.get_json(silent=True) or {}
+    
+    try:
+        success = invoice_cache.print_invoice(sale.id, _sale_invoice_data(sale), data.get('printer_name'))
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'خطأ: {str(e)}'}), 500
+    
+    if success:
+        return jsonify({'success': True, 'message': 'تم إرسال الفاتورة للطباعة'})
+    else:
+        return jsonify({'success': False, 'message': 'فشل في طباعة الفاتورة'}), 500
+
+@sale_bp.route('/sales/invoice-cache', methods=['GET'])
+def get_invoice_cache_status():
+    """حالة التخزين المؤقت للفواتير"""
+    return jsonify(invoice_cache.get_status())
+
 @sale_bp.route('/sales/report', methods=['GET'])
 def sales_report():
     start_date = request.args.get('start_date')
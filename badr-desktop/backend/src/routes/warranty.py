@@ -3,7 +3,7 @@ from src.models.warranty import Warranty, WarrantyTemplate, db
 from src.models.sale import SaleItem, Sale
 from src.models.product import Product
 from src.models.customer import Customer
-from src.services.telegram_service import TelegramService
+from src.services.telegram_service import telegram_service
 from datetime import datetime, timedelta
 import json
 
@@ -65,7 +65,6 @@ def create_warranty():
         
         # Send notification
         try:
-            telegram = TelegramService()
             customer = Customer.query.get(warranty.customer_id)
             product = Product.query.get(warranty.product_id)
             
@@ -76,7 +75,7 @@ def create_warranty():
             message += f"مدة الضمان: {warranty.warranty_period_months} شهر\n"
             message += f"تاريخ الانتهاء: {warranty.end_date}"
             
-            telegram.send_notification(message, 'warranty')
+            telegram_service.send_notification(message, 'warranty')
         except Exception as e:
             print(f"Failed to send warranty notification: {e}")
         
@@ -123,7 +122,6 @@ def claim_warranty(warranty_id):
         
         # Send notification
         try:
-            telegram = TelegramService()
             customer = Customer.query.get(warranty.customer_id)
             product = Product.query.get(warranty.product_id)
             
@@ -134,7 +132,7 @@ def claim_warranty(warranty_id):
             message += f"تفاصيل المطالبة: {claim_details}\n"
             message += f"رقم المطالبة: #{warranty.claim_count}"
             
-            telegram.send_notification(message, 'warranty')
+            telegram_service.send_notification(message, 'warranty')
         except Exception as e:
             print(f"Failed to send warranty claim notification: {e}")
         
@@ -210,7 +208,6 @@ def check_warranty_notifications():
     notifications_sent = 0
     
     try:
-        telegram = TelegramService()
         active_warranties = Warranty.query.filter(Warranty.status == 'active').all()
         
         for warranty in active_warranties:
@@ -226,7 +223,7 @@ def check_warranty_notifications():
                 message += f"تاريخ انتهاء الضمان: {warranty.end_date}\n"
                 message += f"الأيام المتبقية: {warranty.get_days_remaining()}"
                 
-                if telegram.send_notification(message, 'warranty'):
+                if telegram_service.send_notification(message, 'warranty'):
                     warranty.mark_notification_sent('30_days')
                     notifications_sent += 1
             
@@ -239,7 +236,7 @@ def check_warranty_notifications():
                 message += f"تاريخ انتهاء الضمان: {warranty.end_date}\n"
                 message += f"الأيام المتبقية: {warranty.get_days_remaining()}"
                 
-                if telegram.send_notification(message, 'warranty'):
+                if telegram_service.send_notification(message, 'warranty'):
                     warranty.mark_notification_sent('7_days')
                     notifications_sent += 1
             
@@ -251,7 +248,7 @@ def check_warranty_notifications():
                 message += f"المنتج: {product.name if product else 'غير محدد'}\n"
                 message += f"تاريخ انتهاء الضمان: {warranty.end_date}"
                 
-                if telegram.send_notification(message, 'warranty'):
+                if telegram_service.send_notification(message, 'warranty'):
                     warranty.mark_notification_sent('expired')
                     warranty.status = 'expired'
                     notifications_sent += 1
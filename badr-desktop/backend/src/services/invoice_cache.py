@@ -0,0 +1,222 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'database', 'invoice_cache')
+
+
+class InvoiceCache:
+    """
+    تخزين مؤقت لملفات PDF الفواتير
+    
+    - الفاتورة تُنشأ في الخلفية بعد حفظ المبيعة فتكون الطباعة وإعادة الطباعة فورية
+    - المفتاح بصمة SHA-256 لبيانات الفاتورة ومعلومات الشركة، فأي تغيير في المبيعة
+      ينتج مفتاحاً جديداً ولا تُطبع نسخة قديمة أبداً
+    - الحجم الكلي محدود وتُحذف الملفات الأقدم استخداماً أولاً
+    """
+    
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=200 * 1024 * 1024, company_info=None):
+        """
+        Args:
+            cache_dir: مجلد ملفات الفواتير
+            max_bytes: الحد الأقصى لمجموع أحجام الملفات
+            company_info: معلومات الشركة (الافتراضي معلومات InvoicePrinter)
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.company_info = company_info
+        
+        self._printer = None
+        self._executor = None
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._generations = {}
+        self._stats = {'hits': 0, 'misses': 0, 'prerendered': 0, 'evicted': 0, 'errors': 0}
+    
+    def _get_printer(self):
+        # استيراد متأخر حتى لا تُحمّل reportlab إلا عند أول فاتورة
+        if self._printer is None:
+            from src.invoice_printer import InvoicePrinter
+            self._printer = InvoicePrinter(self.company_info)
+        return self._printer
+    
+    def invoice_key(self, invoice_data):
+        """بصمة بيانات الفاتورة (مفتاح التخزين)"""
+        payload = {
+            'invoice': invoice_data,
+            'company': self._get_printer().company_info
+        }
+        encoded = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(encoded.encode('utf-8')).hexdigest()
+    
+    def _path(self, sale_id, key):
+        return os.path.join(self.cache_dir, f"{sale_id}_{key[:32]}.pdf")
+    
+    def _sale_files(self, sale_id):
+        if not os.path.isdir(self.cache_dir):
+            return []
+        prefix = f"{sale_id}_"
+        return [
+            os.path.join(self.cache_dir, name) for name in os.listdir(self.cache_dir)
+            if name.startswith(prefix) and name.endswith('.pdf')
+        ]
+    
+    def _render(self, sale_id, invoice_data, path, generation):
+        """إنشاء الفاتورة وكتابتها ذرياً ثم حذف نسخ المبيعة القديمة وتطبيق حد الحجم"""
+        pdf = self._get_printer().render_invoice_bytes(invoice_data)
+        
+        os.makedirs(self.cache_dir, exist_ok=True)
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(temp_path, 'wb') as f:
+            f.write(pdf)
+        
+        with self._lock:
+            # ألغيت المبيعة أثناء الإنشاء
+            if self._generations.get(sale_id, 0) != generation:
+                os.remove(temp_path)
+                return None
+            
+            os.replace(temp_path, path)
+            for stale_path in self._sale_files(sale_id):
+                if stale_path != path:
+                    os.remove(stale_path)
+            
+            self._evict(keep=path)
+        
+        return path
+    
+    def _evict(self, keep=None):
+        """حذف الملفات الأقدم استخداماً حتى يعود الحجم الكلي ضمن الحد"""
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith('.pdf'):
+                continue
+            stat = os.stat(os.path.join(self.cache_dir, name))
+            entries.append((stat.st_mtime, stat.st_size, os.path.join(self.cache_dir, name)))
+        
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            
+            os.remove(path)
+            total -= size
+            self._stats['evicted'] += 1
+    
+    def prerender(self, sale_id, invoice_data):
+        """
+        جدولة إنشاء فاتورة المبيعة في الخلفية (يُستدعى بعد حفظ المبيعة)
+        
+        Returns:
+            مفتاح الفاتورة
+        """
+        key = self.invoice_key(invoice_data)
+        path = self._path(sale_id, key)
+        
+        with self._lock:
+            if path in self._pending or os.path.exists(path):
+                return key
+            
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="invoice-prerender")
+            
+            generation = self._generations.get(sale_id, 0)
+            future = self._executor.submit(self._render, sale_id, invoice_data, path, generation)
+            self._pending[path] = future
+        
+        def done(future):
+            with self._lock:
+                self._pending.pop(path, None)
+                if future.exception() is None:
+                    self._stats['prerendered'] += 1
+                else:
+                    self._stats['errors'] += 1
+                    logger.error(f"خطأ في إنشاء الفاتورة مسبقاً للمبيعة {sale_id}: {str(future.exception())}")
+        
+        future.add_done_callback(done)
+        return key
+    
+    def get_invoice(self, sale_id, invoice_data):
+        """
+        مسار ملف فاتورة المبيعة المطابق لبياناتها الحالية
+        
+        يُعاد الملف المخزن إن وجد، أو يُنتظر إنشاؤه إن كان جارياً، وإلا يُنشأ الآن.
+        
+        Returns:
+            مسار ملف PDF
+        """
+        key = self.invoice_key(invoice_data)
+        path = self._path(sale_id, key)
+        
+        with self._lock:
+            future = self._pending.get(path)
+        if future is not None:
+            try:
+                future.result()
+            except Exception:
+                pass
+        
+        with self._lock:
+            if os.path.exists(path):
+                os.utime(path)
+                self._stats['hits'] += 1
+                return path
+            
+            self._stats['misses'] += 1
+            generation = self._generations.get(sale_id, 0)
+        
+        result = self._render(sale_id, invoice_data, path, generation)
+        if result is None:
+            # ألغيت المبيعة أثناء الإنشاء
+            raise FileNotFoundError(f"تم إلغاء فاتورة المبيعة {sale_id}")
+        return result
+    
+    def print_invoice(self, sale_id, invoice_data, printer_name=None):
+        """طباعة فاتورة المبيعة من الملف المخزن"""
+        try:
+            return self._get_printer().print_pdf(self.get_invoice(sale_id, invoice_data), printer_name)
+        except Exception as e:
+            logger.error(f"خطأ في طباعة الفاتورة: {str(e)}")
+            return False
+    
+    def invalidate(self, sale_id):
+        """حذف فواتير المبيعة المخزنة (عند حذفها أو تعديلها) وإلغاء ما يُنشأ منها حالياً"""
+        with self._lock:
+            self._generations[sale_id] = self._generations.get(sale_id, 0) + 1
+            
+            removed = 0
+            for path in self._sale_files(sale_id):
+                os.remove(path)
+                removed += 1
+        
+        return removed
+    
+    def get_status(self):
+        """حالة التخزين المؤقت وإحصائياته"""
+        with self._lock:
+            files = [
+                os.path.join(self.cache_dir, name) for name in os.listdir(self.cache_dir)
+                if name.endswith('.pdf')
+            ] if os.path.isdir(self.cache_dir) else []
+            
+            return {
+                'cache_dir': self.cache_dir,
+                'entries': len(files),
+                'bytes': sum(os.path.getsize(path) for path in files),
+                'max_bytes': self.max_bytes,
+                'pending': len(self._pending),
+                **self._stats
+            }
+
+
+invoice_cache = InvoiceCache(
+    cache_dir=os.getenv('INVOICE_CACHE_DIR', DEFAULT_CACHE_DIR),
+    max_bytes=int(os.getenv('INVOICE_CACHE_MAX_MB', '200')) * 1024 * 1024
+)
@@ -0,0 +1,197 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_STATE_DB = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'database', 'alerts_state.sqlite')
+
+
+class LowStockAlertCoalescer:
+    """
+    دمج تنبيهات المخزون القليل في ملخصات دورية
+    
+    - كل منتج يُنبَّه عنه مرة واحدة خلال نافذة التكرار مهما تكررت المبيعات
+    - التنبيهات المعلقة تُرسل كرسالة ملخص واحدة كل فترة (أقل الكميات أولاً)
+    - نفاد المخزون بالكامل يُعيد التنبيه حتى داخل النافذة
+    - الحالة محفوظة في SQLite فلا تتكرر التنبيهات بعد إعادة التشغيل
+    """
+    
+    def __init__(self, send_digest, db_path=DEFAULT_STATE_DB, dedupe_window_seconds=6 * 3600,
+                 digest_interval_seconds=900, top_n=10):
+        """
+        Args:
+            send_digest: دالة تستقبل قائمة المنتجات وعدد المنتجات الإضافية وتعيد True عند الإرسال
+            db_path: مسار قاعدة بيانات الحالة
+            dedupe_window_seconds: أقل مدة بين تنبيهين لنفس المنتج
+            digest_interval_seconds: الفترة بين رسائل الملخص
+            top_n: عدد المنتجات المعروضة في الملخص
+        """
+        self.send_digest = send_digest
+        self.db_path = db_path
+        self.dedupe_window_seconds = dedupe_window_seconds
+        self.digest_interval_seconds = digest_interval_seconds
+        self.top_n = top_n
+        
+        self._initialized = False
+        self._flush_lock = threading.Lock()
+        self._flusher_lock = threading.Lock()
+        self._flusher_thread = None
+        self._flusher_stop = threading.Event()
+    
+    def _connect(self):
+        if not self._initialized:
+            self._init_database()
+        return sqlite3.connect(self.db_path, timeout=30)
+    
+    def _init_database(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+        
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS low_stock_alert_state (
+                product_key TEXT PRIMARY KEY,
+                product_id INTEGER,
+                name TEXT NOT NULL,
+                quantity INTEGER NOT NULL,
+                min_quantity INTEGER,
+                pending INTEGER DEFAULT 1,
+                hits INTEGER DEFAULT 1,
+                first_seen REAL NOT NULL,
+                last_seen REAL NOT NULL,
+                last_alerted_at REAL,
+                alerted_quantity INTEGER
+            )
+        ''')
+        conn.execute('''
+            CREATE INDEX IF NOT EXISTS idx_low_stock_alert_pending
+            ON low_stock_alert_state (pending, quantity)
+        ''')
+        conn.commit()
+        conn.close()
+        
+        self._initialized = True
+    
+    def report(self, product_data):
+        """
+        تسجيل منتج وصل إلى حد المخزون القليل
+        
+        لا يُرسل شيئاً مباشرة؛ يُعلَّم المنتج للملخص القادم إذا لم يُنبَّه عنه
+        خلال نافذة التكرار أو إذا نفد مخزونه بعد آخر تنبيه.
+        """
+        product_id = product_data.get('id')
+        name = product_data.get('name', 'منتج غير محدد')
+        product_key = str(product_id) if product_id is not None else f"name:{name}"
+        quantity = product_data.get('quantity', 0)
+        now = time.time()
+        
+        conn = self._connect()
+        conn.execute('''
+            INSERT INTO low_stock_alert_state
+                (product_key, product_id, name, quantity, min_quantity, first_seen, last_seen)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(product_key) DO UPDATE SET
+                name = excluded.name,
+                quantity = excluded.quantity,
+                min_quantity = excluded.min_quantity,
+                last_seen = excluded.last_seen,
+                hits = hits + 1,
+                pending = CASE
+                    WHEN pending = 1
+                      OR last_alerted_at IS NULL
+                      OR excluded.last_seen - last_alerted_at >= ?
+                      OR (excluded.quantity <= 0 AND alerted_quantity > 0)
+                    THEN 1 ELSE 0 END
+        ''', (product_key, product_id, name, quantity, product_data.get('min_quantity', 5),
+              now, now, self.dedupe_window_seconds))
+        conn.commit()
+        conn.close()
+        
+        self.start_flusher()
+    
+    def clear(self, product_id):
+        """حذف حالة المنتج بعد إعادة تخزينه ليُنبَّه عنه من جديد عند نقصه مرة أخرى"""
+        conn = self._connect()
+        conn.execute('DELETE FROM low_stock_alert_state WHERE product_key = ?', (str(product_id),))
+        conn.commit()
+        conn.close()
+    
+    def get_pending(self):
+        """المنتجات المنتظرة في الملخص القادم مرتبة حسب الكمية"""
+        conn = self._connect()
+        rows = conn.execute('''
+            SELECT product_key, product_id, name, quantity, min_quantity, hits
+            FROM low_stock_alert_state
+            WHERE pending = 1
+            ORDER BY quantity, name
+        ''').fetchall()
+        conn.close()
+        
+        return [
+            {
+                'product_key': row[0],
+                'id': row[1],
+                'name': row[2],
+                'quantity': row[3],
+                'min_quantity': row[4],
+                'hits': row[5]
+            } for row in rows
+        ]
+    
+    def flush_digest(self):
+        """
+        إرسال ملخص بالمنتجات المعلقة
+        
+        Returns:
+            عدد المنتجات التي شملها الملخص (0 إذا لم يوجد شيء أو فشل الإرسال)
+        """
+        with self._flush_lock:
+            pending = self.get_pending()
+            if not pending:
+                return 0
+            
+            if not self.send_digest(pending[:self.top_n], len(pending) - self.top_n):
+                # تبقى المنتجات معلقة لمحاولة الملخص التالي
+                return 0
+            
+            now = time.time()
+            conn = self._connect()
+            conn.executemany('''
+                UPDATE low_stock_alert_state
+                SET pending = 0, hits = 0, last_alerted_at = ?, alerted_quantity = quantity
+                WHERE product_key = ?
+            ''', [(now, item['product_key']) for item in pending])
+            conn.commit()
+            conn.close()
+            
+            return len(pending)
+    
+    def start_flusher(self):
+        """تشغيل خيط إرسال الملخصات الدورية (يُستدعى تلقائياً عند أول تنبيه)"""
+        with self._flusher_lock:
+            if self._flusher_thread and self._flusher_thread.is_alive():
+                return
+            
+            self._flusher_stop.clear()
+            
+            def run():
+                while not self._flusher_stop.wait(self.digest_interval_seconds):
+                    try:
+                        self.flush_digest()
+                    except Exception as e:
+                        logger.error(f"خطأ في إرسال ملخص المخزون القليل: {str(e)}")
+            
+            self._flusher_thread = threading.Thread(target=run, name="low-stock-digest", daemon=True)
+            self._flusher_thread.start()
+    
+    def stop_flusher(self, timeout=5):
+        """إيقاف خيط الملخصات"""
+        self._flusher_stop.set()
+        
+        if self._flusher_thread:
+            self._flusher_thread.join(timeout)
+            self._flusher_thread = None
+        
+        self._flusher_stop.clear()
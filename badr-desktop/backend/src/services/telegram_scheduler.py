@@ -0,0 +1,471 @@
+import atexit
+import heapq
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+logger = logging.getLogger(__name__)
+
+# أولويات الرسائل (الرقم الأصغر يُرسل أولاً)
+PRIORITY_ALERT = 0      # تنبيهات المبيعات والعمليات الفورية
+PRIORITY_NORMAL = 5     # الإشعارات العادية
+PRIORITY_DIGEST = 9     # الملخصات الدورية
+
+DEFAULT_QUEUE_DB = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'database', 'telegram_queue.sqlite')
+
+
+class TokenBucket:
+    """دلو رموز لتحديد معدل الإرسال"""
+    
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+    
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+    
+    def wait_time(self, now):
+        """الوقت المتبقي بالثواني حتى يتوفر رمز"""
+        self._refill(now)
+        return 0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+    
+    def consume(self, now):
+        self._refill(now)
+        self.tokens -= 1
+
+
+class TelegramSendScheduler:
+    """
+    جدولة إرسال رسائل التليجرام ضمن حدود المعدل
+    
+    - حد عام للبوت (30 رسالة/ثانية تقريباً) وحد لكل محادثة (رسالة/ثانية)
+    - احترام retry_after في استجابات 429
+    - ترتيب حسب الأولوية: التنبيهات قبل الملخصات
+    - حفظ الرسائل المعلقة في SQLite لإرسالها بعد إعادة التشغيل
+    """
+    
+    def __init__(self, db_path=DEFAULT_QUEUE_DB, global_rate=30, per_chat_interval=1.0,
+                 max_workers=8, max_attempts=5, request_timeout=10,
+                 api_url="https://api.telegram.org"):
+        self.db_path = db_path
+        self.per_chat_interval = per_chat_interval
+        self.max_attempts = max_attempts
+        self.request_timeout = request_timeout
+        self.api_url = api_url
+        self.max_workers = max_workers
+        
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.http = self._build_http_session()
+        
+        # زمن الاستجابة لآخر الطلبات بالثواني
+        self._latencies = deque(maxlen=500)
+        self._http_requests = 0
+        
+        # الرسائل المعلقة لكل محادثة: (bot_token, chat_id) -> heap of (priority, seq, message)
+        self._queues = {}
+        self._chat_ready_at = {}
+        self._chats_in_flight = set()
+        
+        self._condition = threading.Condition()
+        self._dispatcher = None
+        self._executor = None
+        self._running = False
+        
+        self.stats = {'sent': 0, 'failed': 0, 'rate_limited': 0, 'retried': 0}
+    
+    # ------------------------------------------------------------------
+    # اتصال HTTP
+    # ------------------------------------------------------------------
+    
+    def _build_http_session(self):
+        """
+        جلسة HTTP مشتركة تعيد استخدام الاتصالات (keep-alive)
+        
+        حجم المجمع يساوي عدد خيوط الإرسال حتى لا يُفتح اتصال جديد لكل رسالة،
+        وتُعاد المحاولة تلقائياً عند فشل الاتصال فقط لأن الطلب لم يصل بعد.
+        """
+        session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=4,
+            pool_maxsize=self.max_workers,
+            max_retries=Retry(total=2, connect=2, read=0, status=0, backoff_factor=0.3)
+        )
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        return session
+    
+    def get_http_metrics(self):
+        """إحصائيات إعادة استخدام الاتصالات وزمن الاستجابة"""
+        new_connections = 0
+        for adapter in set(self.http.adapters.values()):
+            for key in list(adapter.poolmanager.pools.keys()):
+                pool = adapter.poolmanager.pools.get(key)
+                if pool is not None:
+                    new_connections += pool.num_connections
+        
+        with self._condition:
+            latencies = sorted(self._latencies)
+            requests_count = self._http_requests
+        
+        def percentile(p):
+            if not latencies:
+                return None
+            return round(latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000, 1)
+        
+        return {
+            'requests': requests_count,
+            'new_connections': new_connections,
+            'reused_connections': max(0, requests_count - new_connections),
+            'reuse_ratio': round(1 - new_connections / requests_count, 3) if requests_count else None,
+            'latency_avg_ms': round(sum(latencies) / len(latencies) * 1000, 1) if latencies else None,
+            'latency_p50_ms': percentile(0.5),
+            'latency_p95_ms': percentile(0.95),
+            'latency_max_ms': round(latencies[-1] * 1000, 1) if latencies else None
+        }
+    
+    # ------------------------------------------------------------------
+    # التخزين الدائم
+    # ------------------------------------------------------------------
+    
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=30)
+    
+    def _init_database(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+        
+        conn = self._connect()
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS telegram_outbox (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                api_url TEXT NOT NULL,
+                bot_token TEXT NOT NULL,
+                chat_id TEXT NOT NULL,
+                text TEXT NOT NULL,
+                parse_mode TEXT,
+                priority INTEGER DEFAULT 5,
+                attempts INTEGER DEFAULT 0,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        conn.commit()
+        conn.close()
+    
+    def _load_pending(self):
+        """تحميل الرسائل التي لم تُرسل قبل إعادة التشغيل"""
+        conn = self._connect()
+        rows = conn.execute('''
+            SELECT id, api_url, bot_token, chat_id, text, parse_mode, priority, attempts
+            FROM telegram_outbox ORDER BY id
+        ''').fetchall()
+        conn.close()
+        
+        for row in rows:
+            self._push({
+                'id': row[0],
+                'api_url': row[1],
+                'bot_token': row[2],
+                'chat_id': row[3],
+                'text': row[4],
+                'parse_mode': row[5],
+                'priority': row[6],
+                'attempts': row[7],
+                'future': Future()
+            })
+        
+        if rows:
+            logger.info(f"تم استرجاع {len(rows)} رسالة تليجرام معلقة")
+    
+    def _delete(self, message_id):
+        conn = self._connect()
+        conn.execute('DELETE FROM telegram_outbox WHERE id = ?', (message_id,))
+        conn.commit()
+        conn.close()
+    
+    def _update_attempts(self, message):
+        conn = self._connect()
+        conn.execute('UPDATE telegram_outbox SET attempts = ? WHERE id = ?',
+                     (message['attempts'], message['id']))
+        conn.commit()
+        conn.close()
+    
+    # ------------------------------------------------------------------
+    # الواجهة العامة
+    # ------------------------------------------------------------------
+    
+    def start(self):
+        """تشغيل خيط الجدولة (يُستدعى تلقائياً عند أول رسالة)"""
+        with self._condition:
+            if self._running:
+                return
+            
+            self._init_database()
+            self._load_pending()
+            
+            self._running = True
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                thread_name_prefix="telegram-send")
+            self._dispatcher = threading.Thread(target=self._dispatch_loop,
+                                                name="telegram-scheduler", daemon=True)
+            self._dispatcher.start()
+    
+    def stop(self, timeout=10):
+        """إيقاف الجدولة؛ الرسائل غير المرسلة تبقى محفوظة للتشغيل القادم"""
+        with self._condition:
+            if not self._running:
+                return
+            self._running = False
+            self._condition.notify_all()
+        
+        self._dispatcher.join(timeout)
+        self._executor.shutdown(wait=True)
+        
+        with self._condition:
+            # الرسائل تبقى في الطابور المحفوظ، لكن من ينتظر نتيجتها لا ينتظر حتى مهلته
+            for queue in self._queues.values():
+                for _, _, message in queue:
+                    if not message['future'].done():
+                        message['future'].set_result(self._stopped_result())
+            
+            self._queues.clear()
+            self._chat_ready_at.clear()
+            self._chats_in_flight.clear()
+    
+    @staticmethod
+    def _stopped_result():
+        return {'success': False, 'status': None, 'response': None, 'error': 'stopped'}
+    
+    def close(self):
+        """إيقاف الجدولة وإغلاق اتصالات HTTP المفتوحة"""
+        self.stop()
+        self.http.close()
+    
+    def enqueue(self, bot_token, chat_id, text, priority=PRIORITY_NORMAL,
+                parse_mode='HTML', api_url=None):
+        """
+        إضافة رسالة إلى طابور الإرسال
+        
+        Returns:
+            Future تُعيد قاموس النتيجة {'success', 'status', 'response', 'error'}
+        """
+        self.start()
+        
+        api_url = api_url or self.api_url
+        chat_id = str(chat_id)
+        
+        conn = self._connect()
+        cursor = conn.execute('''
+            INSERT INTO telegram_outbox (api_url, bot_token, chat_id, text, parse_mode, priority)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', (api_url, bot_token, chat_id, text, parse_mode, priority))
+        message_id = cursor.lastrowid
+        conn.commit()
+        conn.close()
+        
+        message = {
+            'id': message_id,
+            'api_url': api_url,
+            'bot_token': bot_token,
+            'chat_id': chat_id,
+            'text': text,
+            'parse_mode': parse_mode,
+            'priority': priority,
+            'attempts': 0,
+            'future': Future()
+        }
+        
+        with self._condition:
+            self._push(message)
+            self._condition.notify()
+        
+        return message['future']
+    
+    def send(self, bot_token, chat_id, text, priority=PRIORITY_NORMAL, parse_mode='HTML',
+             api_url=None, timeout=30):
+        """إرسال رسالة وانتظار نتيجتها"""
+        future = self.enqueue(bot_token, chat_id, text, priority, parse_mode, api_url)
+        try:
+            return future.result(timeout=timeout)
+        except Exception as e:
+            return {'success': False, 'status': None, 'response': None, 'error': str(e)}
+    
+    def get_status(self):
+        """حالة الطابور وإحصائيات الإرسال"""
+        with self._condition:
+            pending = sum(len(queue) for queue in self._queues.values())
+            return {
+                'running': self._running,
+                'pending': pending,
+                'in_flight': len(self._chats_in_flight),
+                **self.stats
+            }
+    
+    # ------------------------------------------------------------------
+    # الجدولة والإرسال
+    # ------------------------------------------------------------------
+    
+    def _push(self, message):
+        key = (message['bot_token'], message['chat_id'])
+        heapq.heappush(self._queues.setdefault(key, []),
+                       (message['priority'], message['id'], message))
+    
+    def _next_ready(self, now):
+        """
+        اختيار أعلى رسالة أولوية من المحادثات الجاهزة
+        
+        Returns:
+            (المحادثة، مدة الانتظار) - المحادثة None إذا لم تكن أي محادثة جاهزة
+        """
+        best_key = None
+        wait = None
+        
+        for key, queue in self._queues.items():
+            if not queue or key in self._chats_in_flight:
+                continue
+            
+            ready_in = self._chat_ready_at.get(key, 0) - now
+            if ready_in > 0:
+                wait = ready_in if wait is None else min(wait, ready_in)
+                continue
+            
+            if best_key is None or queue[0][:2] < self._queues[best_key][0][:2]:
+                best_key = key
+        
+        return best_key, wait
+    
+    def _dispatch_loop(self):
+        with self._condition:
+            while self._running:
+                now = time.monotonic()
+                key, wait = self._next_ready(now)
+                
+                if key is None:
+                    self._condition.wait(wait)
+                    continue
+                
+                global_wait = self.global_bucket.wait_time(now)
+                if global_wait > 0:
+                    self._condition.wait(global_wait)
+                    continue
+                
+                self.global_bucket.consume(now)
+                _, _, message = heapq.heappop(self._queues[key])
+                if not self._queues[key]:
+                    del self._queues[key]
+                
+                self._chats_in_flight.add(key)
+                self._chat_ready_at[key] = now + self.per_chat_interval
+                self._executor.submit(self._deliver, key, message)
+    
+    def _deliver(self, key, message):
+        result = {'success': False, 'status': None, 'response': None, 'error': None}
+        requeued = False
+        
+        try:
+            retry_in = self._post(message, result)
+            
+            if retry_in is not None and message['attempts'] < self.max_attempts:
+                # إعادة الرسالة إلى رأس طابور محادثتها بعد المهلة
+                self.stats['retried'] += 1
+                self._update_attempts(message)
+                
+                with self._condition:
+                    self._chat_ready_at[key] = time.monotonic() + retry_in
+                    requeued = self._running
+                    if requeued:
+                        self._push(message)
+                
+                if not requeued:
+                    # الجدولة متوقفة: تبقى الرسالة محفوظة وتُرسل في التشغيل القادم
+                    result.update(self._stopped_result())
+                return
+            
+            self._delete(message['id'])
+        
+        except Exception as e:
+            # خطأ غير متوقع (قاعدة البيانات مثلاً): تبقى الرسالة في الطابور المحفوظ لتُعاد بعد التشغيل التالي
+            result['error'] = result['error'] or str(e)
+            logger.error(f"خطأ في إرسال رسالة تليجرام إلى {message['chat_id']}: {str(e)}")
+        
+        finally:
+            # تحرير المحادثة دائماً حتى لا تتوقف رسائلها التالية
+            with self._condition:
+                self._chats_in_flight.discard(key)
+                self._condition.notify()
+            
+            if not requeued:
+                # الرسالة المتوقفة ليست فاشلة: تبقى محفوظة للتشغيل القادم
+                if result['error'] != 'stopped':
+                    self.stats['sent' if result['success'] else 'failed'] += 1
+                    
+                    if not result['success']:
+                        logger.error(f"فشل إرسال رسالة تليجرام إلى {message['chat_id']}: "
+                                     f"{result['error'] or result['status']}")
+                
+                if not message['future'].done():
+                    message['future'].set_result(result)
+    
+    def _post(self, message, result):
+        """
+        طلب إرسال واحد
+        
+        Returns:
+            مهلة إعادة المحاولة بالثواني، أو None إذا لا تُعاد الرسالة
+        """
+        try:
+            started_at = time.monotonic()
+            response = self.http.post(
+                f"{message['api_url']}/bot{message['bot_token']}/sendMessage",
+                data={
+                    'chat_id': message['chat_id'],
+                    'text': message['text'],
+                    'parse_mode': message['parse_mode']
+                },
+                timeout=self.request_timeout
+            )
+        except requests.RequestException as e:
+            result['error'] = str(e)
+            return self._backoff(message)
+        
+        with self._condition:
+            self._latencies.append(time.monotonic() - started_at)
+            self._http_requests += 1
+        
+        result['status'] = response.status_code
+        result['response'] = response.text
+        result['success'] = response.status_code == 200
+        
+        if response.status_code == 429:
+            # تُحسب ضمن المحاولات حتى لا تُعاد رسالة محادثة محظورة إلى ما لا نهاية
+            self.stats['rate_limited'] += 1
+            message['attempts'] += 1
+            try:
+                return float(response.json().get('parameters', {}).get('retry_after', 1))
+            except (ValueError, AttributeError):
+                return float(response.headers.get('Retry-After', 1))
+        
+        if response.status_code >= 500:
+            return self._backoff(message)
+        
+        return None
+    
+    def _backoff(self, message):
+        message['attempts'] += 1
+        return min(60, 2 ** message['attempts'])
+
+
+# مجدول مشترك بين خدمة التليجرام ونظام الإشعارات
+telegram_scheduler = TelegramSendScheduler()
+
+# إغلاق الاتصالات عند إغلاق البرنامج؛ الرسائل المعلقة تبقى في الطابور
+atexit.register(telegram_scheduler.close)
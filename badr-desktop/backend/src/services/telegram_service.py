@@ -1,36 +1,63 @@
-import requests
 import json
 from datetime import datetime
 import os
 
+from src.services.telegram_scheduler import (
+    telegram_scheduler, PRIORITY_ALERT, PRIORITY_NORMAL, PRIORITY_DIGEST
+)
+from src.services.low_stock_alerts import LowStockAlertCoalescer
+
 class TelegramService:
+    # أولوية الإشعارات العامة حسب نوعها
+    CATEGORY_PRIORITIES = {
+        'sale': PRIORITY_ALERT,
+        'order': PRIORITY_ALERT,
+        'summary': PRIORITY_DIGEST
+    }
+    
     def __init__(self):
         # يمكن تعديل هذه القيم من ملف الإعدادات أو متغيرات البيئة
         self.bot_token = os.getenv('TELEGRAM_BOT_TOKEN', '')
         self.chat_id = os.getenv('TELEGRAM_CHAT_ID', '')
         self.enabled = bool(self.bot_token and self.chat_id)
         
-    def send_message(self, message):
-        """إرسال رسالة إلى التليجرام"""
+        # تنبيهات المخزون القليل تُدمج في ملخصات دورية بدلاً من رسالة لكل عملية بيع
+        self.low_stock_alerts = LowStockAlertCoalescer(send_digest=self.send_low_stock_digest)
+        
+    def send_message(self, message, priority=PRIORITY_NORMAL, wait=False):
+        """
+        إرسال رسالة إلى التليجرام عبر المجدول المشترك
+        
+        افتراضياً تُحفظ الرسالة في الطابور وتُرسل في الخلفية ضمن حدود المعدل،
+        ومع wait=True يُنتظر رد التليجرام الفعلي.
+        """
         if not self.enabled:
             print(f"Telegram not configured. Message: {message}")
             return False
             
         try:
-            url = f"https://api.telegram.org/bot{self.bot_token}/sendMessage"
-            data = {
-                'chat_id': self.chat_id,
-                'text': message,
-                'parse_mode': 'HTML'
-            }
+            if wait:
+                result = telegram_scheduler.send(self.bot_token, self.chat_id, message, priority)
+                return result['success']
             
-            response = requests.post(url, data=data, timeout=10)
-            return response.status_code == 200
+            telegram_scheduler.enqueue(self.bot_token, self.chat_id, message, priority)
+            return True
             
         except Exception as e:
             print(f"Error sending Telegram message: {e}")
             return False
     
+    def send_notification(self, message, category=None):
+        """إرسال إشعار عام بأولوية حسب نوعه (product, inventory, warranty, ...)"""
+        return self.send_message(message, self.CATEGORY_PRIORITIES.get(category, PRIORITY_NORMAL))
+    
+    def get_metrics(self):
+        """إحصائيات طابور الإرسال واتصالات HTTP"""
+        return {
+            'queue': telegram_scheduler.get_status(),
+            'http': telegram_scheduler.get_http_metrics()
+        }
+    
     def send_sale_notification(self, sale_data):
         """إرسال إشعار عملية بيع"""
         try:
@@ -51,7 +78,7 @@ class TelegramService:
 🏪 <i>البدر للإنارة</i>
             """.strip()
             
-            return self.send_message(message)
+            return self.send_message(message, PRIORITY_ALERT)
             
         except Exception as e:
             print(f"Error sending sale notification: {e}")
@@ -115,9 +142,18 @@ class TelegramService:
             print(f"Error sending expense notification: {e}")
             return False
     
-    def send_low_stock_alert(self, product_data):
-        """إرسال تنبيه مخزون قليل"""
+    def send_low_stock_alert(self, product_data, immediate=False):
+        """
+        إرسال تنبيه مخزون قليل
+        
+        افتراضياً يُسجَّل المنتج في ملخص المخزون القليل التالي مع منع التكرار،
+        ومع immediate=True تُرسل رسالة منفصلة فوراً.
+        """
         try:
+            if not immediate:
+                self.low_stock_alerts.report(product_data)
+                return True
+            
             product_name = product_data.get('name', 'منتج غير محدد')
             current_quantity = product_data.get('quantity', 0)
             min_quantity = product_data.get('min_quantity', 5)
@@ -140,6 +176,37 @@ class TelegramService:
             print(f"Error sending low stock alert: {e}")
             return False
     
+    def send_low_stock_digest(self, items, remaining_count=0):
+        """إرسال ملخص بالمنتجات ذات المخزون القليل"""
+        try:
+            lines = []
+            for item in items:
+                line = f"• {item['name']}: <b>{item['quantity']}</b> (الحد الأدنى {item['min_quantity']})"
+                if item.get('hits', 0) > 1:
+                    line += f" - {item['hits']} تنبيهات"
+                lines.append(line)
+            
+            if remaining_count > 0:
+                lines.append(f"• و {remaining_count} منتجات أخرى")
+            
+            products_text = "\n".join(lines)
+            
+            message = f"""
+⚠️ <b>ملخص المخزون القليل</b>
+
+{products_text}
+
+🔄 <i>يُنصح بإعادة التخزين</i>
+
+🏪 <i>البدر للإنارة</i>
+            """.strip()
+            
+            return self.send_message(message, PRIORITY_DIGEST)
+            
+        except Exception as e:
+            print(f"Error sending low stock digest: {e}")
+            return False
+    
     def send_warranty_expiry_alert(self, warranty_data):
         """إرسال تنبيه انتهاء ضمان"""
         try:
@@ -185,12 +252,12 @@ class TelegramService:
 🏪 <i>البدر للإنارة</i>
             """.strip()
             
-            return self.send_message(message)
+            return self.send_message(message, PRIORITY_DIGEST)
             
         except Exception as e:
             print(f"Error sending daily summary: {e}")
             return False
 
-# إنشاء مثيل عام للخدمة
+# إنشاء مثيل عام للخدمة؛ تستخدمه جميع المسارات بدلاً من إنشاء مثيل لكل طلب
 telegram_service = TelegramService()
 
@@ -6,11 +6,22 @@
 import sqlite3
 import hashlib
 import secrets
+import threading
+import time
 from datetime import datetime, timedelta
+from functools import wraps
 from typing import Dict, List, Optional, Set
 import logging
 import json
 
+from flask import request, jsonify, g
+
+try:
+    from src.audit_log_writer import audit_log_writer
+except ImportError:
+    # التشغيل المستقل من داخل مجلد src
+    from audit_log_writer import audit_log_writer
+
 # إعداد نظام السجلات
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -18,16 +29,42 @@ logger = logging.getLogger(__name__)
 class UserPermissionsManager:
     """نظام إدارة صلاحيات المستخدمين"""
     
-    def __init__(self, db_path: str = "users.sqlite"):
+    def __init__(self, db_path: str = "users.sqlite", cache_ttl_seconds: int = 300,
+                 session_duration_hours: int = 24, sweep_sessions: bool = True):
         """
         تهيئة نظام إدارة المستخدمين
         
         Args:
             db_path: مسار قاعدة البيانات
+            cache_ttl_seconds: مدة صلاحية ذاكرة الصلاحيات والجلسات المؤقتة بالثواني
+            session_duration_hours: مدة الجلسة الافتراضية بالساعات (تُمدد تلقائياً مع الاستخدام)
+            sweep_sessions: تشغيل منظف الجلسات المنتهية في الخلفية (False لمن يديره بنفسه)
         """
         self.db_path = db_path
+        self.cache_ttl_seconds = cache_ttl_seconds
+        self.session_duration_hours = session_duration_hours
+        
+        # منظف الجلسات المنتهية في الخلفية
+        self._sweeper_thread = None
+        self._sweeper_stop = threading.Event()
+        
+        # ذاكرة مؤقتة للصلاحيات والجلسات
+        # _permission_bits: اسم الصلاحية -> رقم البت
+        # _role_cache: معرف الدور -> (قناع بتات الصلاحيات، وقت التحميل)
+        # _user_cache: معرف المستخدم -> (معرف الدور، وقت التحميل) أو None للمستخدم غير النشط
+        # _session_cache: رمز الجلسة -> (بيانات المستخدم، وقت انتهاء الجلسة، وقت التحميل، مدة الجلسة بالساعات)
+        self._cache_lock = threading.RLock()
+        self._permission_bits: Dict[str, int] = {}
+        self._role_cache: Dict[int, tuple] = {}
+        self._user_cache: Dict[int, tuple] = {}
+        self._session_cache: Dict[str, tuple] = {}
+        
         self.init_database()
         self.create_default_admin()
+        
+        # حذف الجلسات المنتهية يبقى السلوك الافتراضي كما كان عند تسجيل الدخول
+        if sweep_sessions:
+            self.start_session_sweeper()
     
     def init_database(self):
         """إنشاء جداول قاعدة البيانات"""
@@ -94,11 +131,22 @@ class UserPermissionsManager:
                     user_id INTEGER NOT NULL,
                     session_token TEXT UNIQUE NOT NULL,
                     expires_at TIMESTAMP NOT NULL,
+                    duration_hours REAL,
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                     FOREIGN KEY (user_id) REFERENCES users (id)
                 )
             ''')
             
+            # مدة كل جلسة لقواعد البيانات المنشأة قبل إضافتها (الفارغة تأخذ المدة الافتراضية)
+            cursor.execute("PRAGMA table_info(user_sessions)")
+            if 'duration_hours' not in [column[1] for column in cursor.fetchall()]:
+                cursor.execute("ALTER TABLE user_sessions ADD COLUMN duration_hours REAL")
+            
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_user_sessions_expires
+                ON user_sessions (expires_at)
+            ''')
+            
             # جدول سجل العمليات
             cursor.execute('''
                 CREATE TABLE IF NOT EXISTS user_activity_log (
@@ -489,13 +537,16 @@ class UserPermissionsManager:
             logger.error(f"خطأ في مصادقة المستخدم: {str(e)}")
             return None
     
-    def create_session(self, user_id: int, duration_hours: int = 24) -> str:
+    def create_session(self, user_id: int, duration_hours: int = None) -> str:
         """
         إنشاء جلسة مستخدم
         
+        الجلسات المنتهية لا تُحذف هنا بل بواسطة منظف الخلفية
+        (start_session_sweeper) أو sweep_expired_sessions.
+        
         Args:
             user_id: معرف المستخدم
-            duration_hours: مدة الجلسة بالساعات
+            duration_hours: مدة الجلسة بالساعات (افتراضياً session_duration_hours)
             
         Returns:
             رمز الجلسة
@@ -506,16 +557,14 @@ class UserPermissionsManager:
             
             # إنشاء رمز جلسة فريد
             session_token = secrets.token_urlsafe(32)
+            duration_hours = duration_hours or self.session_duration_hours
             expires_at = datetime.now() + timedelta(hours=duration_hours)
             
-            # حذف الجلسات المنتهية الصلاحية
-            cursor.execute('DELETE FROM user_sessions WHERE expires_at < ?', (datetime.now().isoformat(),))
-            
             # إدراج الجلسة الجديدة
             cursor.execute('''
-                INSERT INTO user_sessions (user_id, session_token, expires_at)
-                VALUES (?, ?, ?)
-            ''', (user_id, session_token, expires_at.isoformat()))
+                INSERT INTO user_sessions (user_id, session_token, expires_at, duration_hours)
+                VALUES (?, ?, ?, ?)
+            ''', (user_id, session_token, expires_at.isoformat(), duration_hours))
             
             conn.commit()
             conn.close()
@@ -526,6 +575,145 @@ class UserPermissionsManager:
             logger.error(f"خطأ في إنشاء الجلسة: {str(e)}")
             return ""
     
+    def _is_fresh(self, loaded_at: float) -> bool:
+        """التحقق من أن عنصر الذاكرة المؤقتة لم يتجاوز مدة الصلاحية"""
+        return time.monotonic() - loaded_at < self.cache_ttl_seconds
+    
+    def _load_permission_bits(self, cursor):
+        """
+        تحميل أرقام بتات الصلاحيات من جدول الصلاحيات
+        
+        رقم البت هو معرف الصلاحية (AUTOINCREMENT فلا يُعاد استخدامه)، فلا تتغير
+        بتات الصلاحيات الموجودة عند حذف صلاحية أو إضافة أخرى. إن تغيرت الخريطة
+        مع ذلك (مثل إعادة تسمية صلاحية) تُبطل الأقنعة والجلسات المخزنة.
+        """
+        cursor.execute('SELECT id, name FROM permissions')
+        bits = {name: permission_id for permission_id, name in cursor.fetchall()}
+        
+        if any(bits.get(name) != bit for name, bit in self._permission_bits.items()):
+            self._role_cache.clear()
+            self._session_cache.clear()
+        
+        self._permission_bits = bits
+    
+    def _get_role_mask(self, role_id: int) -> int:
+        """
+        الحصول على قناع بتات صلاحيات الدور من الذاكرة المؤقتة أو من قاعدة البيانات
+        
+        Args:
+            role_id: معرف الدور
+            
+        Returns:
+            قناع البتات
+        """
+        with self._cache_lock:
+            cached = self._role_cache.get(role_id)
+            if cached and self._is_fresh(cached[1]):
+                return cached[0]
+        
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        
+        with self._cache_lock:
+            if not self._permission_bits:
+                self._load_permission_bits(cursor)
+            
+            cursor.execute('''
+                SELECT p.name
+                FROM role_permissions rp
+                JOIN permissions p ON rp.permission_id = p.id
+                WHERE rp.role_id = ?
+            ''', (role_id,))
+            names = [row[0] for row in cursor.fetchall()]
+            
+            # صلاحية أضيفت بعد آخر تحميل للبتات
+            if any(name not in self._permission_bits for name in names):
+                self._load_permission_bits(cursor)
+            
+            mask = 0
+            for name in names:
+                mask |= 1 << self._permission_bits[name]
+            
+            self._role_cache[role_id] = (mask, time.monotonic())
+        
+        conn.close()
+        return mask
+    
+    def _get_user_role(self, user_id: int) -> Optional[int]:
+        """
+        الحصول على دور المستخدم النشط من الذاكرة المؤقتة أو من قاعدة البيانات
+        
+        Args:
+            user_id: معرف المستخدم
+            
+        Returns:
+            معرف الدور أو None إذا كان المستخدم غير موجود أو غير نشط
+        """
+        with self._cache_lock:
+            cached = self._user_cache.get(user_id)
+            if cached and self._is_fresh(cached[1]):
+                return cached[0]
+        
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        
+        cursor.execute('SELECT role_id FROM users WHERE id = ? AND is_active = 1', (user_id,))
+        row = cursor.fetchone()
+        
+        conn.close()
+        
+        role_id = row[0] if row else None
+        with self._cache_lock:
+            self._user_cache[user_id] = (role_id, time.monotonic())
+        
+        return role_id
+    
+    def _mask_to_names(self, mask: int) -> Set[str]:
+        """تحويل قناع البتات إلى مجموعة أسماء الصلاحيات"""
+        with self._cache_lock:
+            return {name for name, bit in self._permission_bits.items() if mask >> bit & 1}
+    
+    def invalidate_permissions_cache(self, role_id: int = None):
+        """
+        إبطال الذاكرة المؤقتة للصلاحيات بعد تعديل الأدوار أو الصلاحيات
+        
+        Args:
+            role_id: معرف الدور المعدل (None لإبطال كل الأدوار)
+        """
+        with self._cache_lock:
+            if role_id is None:
+                self._role_cache.clear()
+            else:
+                self._role_cache.pop(role_id, None)
+            
+            # بيانات الجلسات تحمل قائمة الصلاحيات
+            self._session_cache.clear()
+    
+    def invalidate_user_cache(self, user_id: int):
+        """
+        إبطال الذاكرة المؤقتة لمستخدم وجلساته بعد تعديل دوره أو حالته
+        
+        Args:
+            user_id: معرف المستخدم
+        """
+        with self._cache_lock:
+            self._user_cache.pop(user_id, None)
+            for token in [token for token, cached in self._session_cache.items() if cached[0]['id'] == user_id]:
+                del self._session_cache[token]
+    
+    def invalidate_session_cache(self, session_token: str = None):
+        """
+        إبطال الذاكرة المؤقتة للجلسات
+        
+        Args:
+            session_token: رمز الجلسة (None لإبطال كل الجلسات)
+        """
+        with self._cache_lock:
+            if session_token is None:
+                self._session_cache.clear()
+            else:
+                self._session_cache.pop(session_token, None)
+    
     def validate_session(self, session_token: str) -> Optional[Dict]:
         """
         التحقق من صحة الجلسة
@@ -536,12 +724,27 @@ class UserPermissionsManager:
         Returns:
             بيانات المستخدم إذا كانت الجلسة صالحة، None خلاف ذلك
         """
+        if not session_token:
+            return None
+        
+        with self._cache_lock:
+            cached = self._session_cache.get(session_token)
+        
+        if cached and self._is_fresh(cached[2]):
+            user, expires_at, _, duration_hours = cached
+            if expires_at > datetime.now():
+                self._refresh_session_expiry(session_token, expires_at, duration_hours)
+                return user
+            self.invalidate_session_cache(session_token)
+            return None
+        
         try:
             conn = sqlite3.connect(self.db_path)
             cursor = conn.cursor()
             
             cursor.execute('''
-                SELECT s.user_id, u.username, u.full_name, u.role_id, r.name as role_name
+                SELECT s.user_id, u.username, u.full_name, u.role_id, r.name as role_name, s.expires_at,
+                       s.duration_hours
                 FROM user_sessions s
                 JOIN users u ON s.user_id = u.id
                 JOIN roles r ON u.role_id = r.id
@@ -553,16 +756,26 @@ class UserPermissionsManager:
             conn.close()
             
             if session_row:
-                user_id, username, full_name, role_id, role_name = session_row
+                user_id, username, full_name, role_id, role_name, expires_at, duration_hours = session_row
+                duration_hours = duration_hours or self.session_duration_hours
                 
-                return {
+                user = {
                     'id': user_id,
                     'username': username,
                     'full_name': full_name,
                     'role_id': role_id,
                     'role_name': role_name,
-                    'permissions': self.get_user_permissions(user_id)
+                    'permissions': self._mask_to_names(self._get_role_mask(role_id))
                 }
+                
+                with self._cache_lock:
+                    self._user_cache[user_id] = (role_id, time.monotonic())
+                    self._session_cache[session_token] = (
+                        user, datetime.fromisoformat(expires_at), time.monotonic(), duration_hours
+                    )
+                
+                self._refresh_session_expiry(session_token, datetime.fromisoformat(expires_at), duration_hours)
+                return user
             
             return None
             
@@ -570,34 +783,151 @@ class UserPermissionsManager:
             logger.error(f"خطأ في التحقق من الجلسة: {str(e)}")
             return None
     
-    def get_user_permissions(self, user_id: int) -> Set[str]:
+    def _refresh_session_expiry(self, session_token: str, expires_at: datetime, duration_hours: float):
         """
-        الحصول على صلاحيات المستخدم
+        تمديد الجلسة النشطة (انتهاء منزلق) بمدتها الخاصة
+        
+        لا تتم الكتابة إلا بعد مرور نصف مدة الجلسة، لذلك يكتب الطلب
+        الواحد من كل نصف مدة فقط بدلاً من كل طلب.
         
         Args:
-            user_id: معرف المستخدم
-            
-        Returns:
-            مجموعة صلاحيات المستخدم
+            session_token: رمز الجلسة
+            expires_at: وقت الانتهاء الحالي
+            duration_hours: مدة الجلسة التي أُنشئت بها
         """
+        duration = timedelta(hours=duration_hours)
+        now = datetime.now()
+        
+        if expires_at - now > duration / 2:
+            return
+        
+        new_expires_at = now + duration
+        
         try:
             conn = sqlite3.connect(self.db_path)
             cursor = conn.cursor()
             
             cursor.execute('''
-                SELECT p.name
-                FROM users u
-                JOIN roles r ON u.role_id = r.id
-                JOIN role_permissions rp ON r.id = rp.role_id
-                JOIN permissions p ON rp.permission_id = p.id
-                WHERE u.id = ?
-            ''', (user_id,))
+                UPDATE user_sessions SET expires_at = ? WHERE session_token = ?
+            ''', (new_expires_at.isoformat(), session_token))
+            
+            conn.commit()
+            conn.close()
+            
+            with self._cache_lock:
+                cached = self._session_cache.get(session_token)
+                if cached:
+                    self._session_cache[session_token] = (cached[0], new_expires_at, cached[2], cached[3])
+            
+        except Exception as e:
+            logger.error(f"خطأ في تمديد الجلسة: {str(e)}")
+    
+    def sweep_expired_sessions(self, batch_size: int = 500, pause_seconds: float = 0.05) -> int:
+        """
+        حذف الجلسات المنتهية على دفعات صغيرة عبر فهرس expires_at
+        
+        كل دفعة معاملة قصيرة مستقلة حتى لا يُحجز قفل الكتابة طويلاً.
+        
+        Args:
+            batch_size: عدد الجلسات المحذوفة في كل دفعة
+            pause_seconds: فترة الانتظار بين الدفعات
+            
+        Returns:
+            عدد الجلسات المحذوفة
+        """
+        deleted = 0
+        
+        try:
+            conn = sqlite3.connect(self.db_path)
+            cursor = conn.cursor()
             
-            permissions = {row[0] for row in cursor.fetchall()}
+            while not self._sweeper_stop.is_set():
+                cursor.execute('''
+                    DELETE FROM user_sessions WHERE id IN (
+                        SELECT id FROM user_sessions WHERE expires_at < ? LIMIT ?
+                    )
+                ''', (datetime.now().isoformat(), batch_size))
+                conn.commit()
+                
+                deleted += cursor.rowcount
+                if cursor.rowcount < batch_size:
+                    break
+                
+                time.sleep(pause_seconds)
             
             conn.close()
             
-            return permissions
+            if deleted:
+                logger.info(f"تم حذف {deleted} جلسة منتهية")
+            
+        except Exception as e:
+            logger.error(f"خطأ في حذف الجلسات المنتهية: {str(e)}")
+        
+        return deleted
+    
+    def start_session_sweeper(self, interval_seconds: int = 300, batch_size: int = 500):
+        """
+        تشغيل منظف الجلسات المنتهية في خيط خلفي
+        
+        Args:
+            interval_seconds: الفترة بين كل عملية تنظيف
+            batch_size: عدد الجلسات المحذوفة في كل دفعة
+        """
+        if self._sweeper_thread and self._sweeper_thread.is_alive():
+            return
+        
+        self._sweeper_stop.clear()
+        
+        def run():
+            while not self._sweeper_stop.is_set():
+                self.sweep_expired_sessions(batch_size)
+                self._sweeper_stop.wait(interval_seconds)
+        
+        self._sweeper_thread = threading.Thread(target=run, name="session-sweeper", daemon=True)
+        self._sweeper_thread.start()
+        
+        logger.info("تم تشغيل منظف الجلسات المنتهية")
+    
+    def stop_session_sweeper(self, timeout: float = 5):
+        """
+        إيقاف منظف الجلسات المنتهية
+        
+        Args:
+            timeout: مهلة انتظار توقف الخيط بالثواني
+            
+        Returns:
+            True إذا توقف الخيط، False إذا لم يتوقف خلال المهلة (يبقى طلب الإيقاف قائماً)
+        """
+        self._sweeper_stop.set()
+        
+        if self._sweeper_thread:
+            self._sweeper_thread.join(timeout)
+            if self._sweeper_thread.is_alive():
+                # لا يُعاد ضبط الحالة حتى لا يُشغَّل خيط ثانٍ بجانب الخيط الحالي
+                logger.warning("لم يتوقف خيط منظف الجلسات المنتهية خلال المهلة")
+                return False
+            self._sweeper_thread = None
+        
+        # السماح بالتنظيف اليدوي بعد الإيقاف
+        self._sweeper_stop.clear()
+        return True
+    
+    def get_user_permissions(self, user_id: int) -> Set[str]:
+        """
+        الحصول على صلاحيات المستخدم
+        
+        Args:
+            user_id: معرف المستخدم
+            
+        Returns:
+            مجموعة صلاحيات المستخدم
+        """
+        try:
+            role_id = self._get_user_role(user_id)
+            if role_id is None:
+                return set()
+            
+            return self._mask_to_names(self._get_role_mask(role_id))
             
         except Exception as e:
             logger.error(f"خطأ في الحصول على صلاحيات المستخدم: {str(e)}")
@@ -614,8 +944,121 @@ class UserPermissionsManager:
         Returns:
             True إذا كان المستخدم يملك الصلاحية، False خلاف ذلك
         """
-        permissions = self.get_user_permissions(user_id)
-        return permission in permissions
+        try:
+            role_id = self._get_user_role(user_id)
+            if role_id is None:
+                return False
+            
+            mask = self._get_role_mask(role_id)
+            bit = self._permission_bits.get(permission)
+            
+            return bit is not None and bool(mask >> bit & 1)
+            
+        except Exception as e:
+            logger.error(f"خطأ في التحقق من الصلاحية: {str(e)}")
+            return False
+    
+    def permission_required(self, permission: str):
+        """
+        مُزخرف لمسارات Flask يتحقق من الجلسة والصلاحية عبر الذاكرة المؤقتة
+        
+        يُقرأ رمز الجلسة من ترويسة Authorization (Bearer) أو X-Session-Token،
+        وتُحفظ بيانات المستخدم في flask.g.current_user.
+        
+        Args:
+            permission: اسم الصلاحية المطلوبة
+        """
+        def decorator(f):
+            @wraps(f)
+            def decorated_function(*args, **kwargs):
+                auth_header = request.headers.get('Authorization', '')
+                session_token = auth_header[7:] if auth_header.startswith('Bearer ') else \
+                    request.headers.get('X-Session-Token', '')
+                
+                user = self.validate_session(session_token)
+                if not user:
+                    return jsonify({'error': 'Authentication required'}), 401
+                
+                if permission not in user['permissions']:
+                    return jsonify({'error': 'Permission denied'}), 403
+                
+                g.current_user = user
+                return f(*args, **kwargs)
+            return decorated_function
+        return decorator
+    
+    def set_role_permissions(self, role_id: int, permission_names: List[str]) -> bool:
+        """
+        تعيين صلاحيات دور
+        
+        Args:
+            role_id: معرف الدور
+            permission_names: أسماء الصلاحيات الجديدة للدور
+            
+        Returns:
+            True إذا تم التعديل بنجاح، False خلاف ذلك
+        """
+        try:
+            conn = sqlite3.connect(self.db_path)
+            cursor = conn.cursor()
+            
+            cursor.execute('DELETE FROM role_permissions WHERE role_id = ?', (role_id,))
+            
+            for perm_name in permission_names:
+                cursor.execute('''
+                    INSERT OR IGNORE INTO role_permissions (role_id, permission_id)
+                    SELECT ?, id FROM permissions WHERE name = ?
+                ''', (role_id, perm_name))
+            
+            conn.commit()
+            conn.close()
+            
+            self.invalidate_permissions_cache(role_id)
+            
+            logger.info(f"تم تعديل صلاحيات الدور: {role_id}")
+            return True
+            
+        except Exception as e:
+            logger.error(f"خطأ في تعديل صلاحيات الدور: {str(e)}")
+            return False
+    
+    def update_user_role(self, user_id: int, role_id: int = None, is_active: bool = None) -> bool:
+        """
+        تعديل دور المستخدم أو حالته
+        
+        Args:
+            user_id: معرف المستخدم
+            role_id: معرف الدور الجديد (اختياري)
+            is_active: حالة المستخدم الجديدة (اختياري)
+            
+        Returns:
+            True إذا تم التعديل بنجاح، False خلاف ذلك
+        """
+        try:
+            conn = sqlite3.connect(self.db_path)
+            cursor = conn.cursor()
+            
+            if role_id is not None:
+                cursor.execute('''
+                    UPDATE users SET role_id = ?, updated_at = ? WHERE id = ?
+                ''', (role_id, datetime.now().isoformat(), user_id))
+            
+            if is_active is not None:
+                cursor.execute('''
+                    UPDATE users SET is_active = ?, updated_at = ? WHERE id = ?
+                ''', (is_active, datetime.now().isoformat(), user_id))
+            
+            conn.commit()
+            conn.close()
+            
+            self.invalidate_user_cache(user_id)
+            
+            logger.info(f"تم تعديل المستخدم: {user_id}")
+            return True
+            
+        except Exception as e:
+            logger.error(f"خطأ في تعديل المستخدم: {str(e)}")
+            return False
     
     def logout_user(self, session_token: str) -> bool:
         """
@@ -636,6 +1079,8 @@ class UserPermissionsManager:
             conn.commit()
             conn.close()
             
+            self.invalidate_session_cache(session_token)
+            
             logger.info("تم تسجيل خروج المستخدم")
             return True
             
@@ -647,6 +1092,8 @@ class UserPermissionsManager:
         """
         تسجيل نشاط المستخدم
         
+        يُضاف السجل إلى كاتب السجلات المشترك ويُكتب ضمن دفعة في الخلفية.
+        
         Args:
             user_id: معرف المستخدم
             action: العملية المنفذة
@@ -654,16 +1101,13 @@ class UserPermissionsManager:
             ip_address: عنوان IP
         """
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                INSERT INTO user_activity_log (user_id, action, details, ip_address)
-                VALUES (?, ?, ?, ?)
-            ''', (user_id, action, details, ip_address))
-            
-            conn.commit()
-            conn.close()
+            audit_log_writer.write(self.db_path, 'user_activity_log', {
+                'user_id': user_id,
+                'action': action,
+                'details': details,
+                'ip_address': ip_address,
+                'timestamp': audit_log_writer.current_timestamp()
+            })
             
         except Exception as e:
             logger.error(f"خطأ في تسجيل نشاط المستخدم: {str(e)}")
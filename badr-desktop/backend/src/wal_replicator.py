@@ -0,0 +1,614 @@
+"""
+نسخ سجل WAL المستمر لبرنامج البدر للإنارة
+ينسخ إطارات سجل WAL لقاعدة البيانات إلى مجلد نسخة متماثلة (قرص ثانٍ مثلاً) كل ثانية
+مع لقطات دورية، فيمكن استرجاع قاعدة البيانات إلى أي لحظة بدلاً من آخر نسخة يومية
+"""
+
+import json
+import os
+import shutil
+import sqlite3
+import struct
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+import logging
+
+# إعداد نظام السجلات
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+WAL_HEADER_SIZE = 32
+WAL_FRAME_HEADER_SIZE = 24
+
+# قيمة magic في رأس WAL تحدد ترتيب بايتات المجموع الاختباري
+WAL_MAGIC_LITTLE_ENDIAN = 0x377f0682
+WAL_MAGIC_BIG_ENDIAN = 0x377f0683
+
+
+def _wal_checksum(data: bytes, s0: int, s1: int, big_endian: bool) -> Tuple[int, int]:
+    """المجموع الاختباري المتسلسل لإطارات WAL كما تحسبه SQLite"""
+    words = struct.unpack(f"{'>' if big_endian else '<'}{len(data) // 4}I", data)
+    for i in range(0, len(words), 2):
+        s0 = (s0 + words[i] + s1) & 0xFFFFFFFF
+        s1 = (s1 + words[i + 1] + s0) & 0xFFFFFFFF
+    return s0, s1
+
+
+class WalReplicator:
+    """
+    نسخ متماثل مستمر لقاعدة بيانات SQLite بأسلوب Litestream
+    
+    - تُحوَّل قاعدة البيانات إلى وضع WAL، وتُنسخ المعاملات المكتملة من ملف WAL
+      إلى مقاطع في مجلد النسخة كل interval ثانية
+    - يبقى اتصال قراءة مفتوحاً حتى لا يُعاد ملف WAL من بدايته قبل نسخه، ويتولى
+      الناسخ نقطة التفتيش (checkpoint) بنفسه بعد نسخ كل الإطارات
+    - لقطة كاملة دورية تبدأ منها الاستعادة، وكل انقطاع في تسلسل WAL يبدأ جيلاً جديداً بلقطة جديدة
+    """
+    
+    def __init__(self, db_path: str, replica_dir: str, interval: float = 1.0,
+                 checkpoint_interval: float = 60, checkpoint_wal_bytes: int = 4 * 1024 * 1024,
+                 snapshot_interval: float = 6 * 3600, retention_seconds: float = 3 * 24 * 3600):
+        """
+        تهيئة الناسخ
+        
+        Args:
+            db_path: مسار قاعدة البيانات
+            replica_dir: مجلد النسخة المتماثلة (يُفضل على قرص آخر)
+            interval: الفترة بالثواني بين كل نسخ لإطارات WAL (أقصى بيانات قد تضيع)
+            checkpoint_interval: الفترة بالثواني بين نقاط التفتيش
+            checkpoint_wal_bytes: حجم WAL الذي يُطلق نقطة تفتيش مبكرة
+            snapshot_interval: الفترة بالثواني بين اللقطات الكاملة
+            retention_seconds: مدة الاحتفاظ باللقطات والمقاطع
+        """
+        self.db_path = db_path
+        self.wal_path = db_path + "-wal"
+        self.replica_dir = replica_dir
+        self.interval = interval
+        self.checkpoint_interval = checkpoint_interval
+        self.checkpoint_wal_bytes = checkpoint_wal_bytes
+        self.snapshot_interval = snapshot_interval
+        self.retention_seconds = retention_seconds
+        
+        self._reader = None
+        self._lock_file = None
+        self._lock = threading.RLock()
+        self._stop = threading.Event()
+        self._thread = None
+        
+        # موضع النسخ في ملف WAL الحالي
+        self._generation = None
+        self._salt = None
+        self._offset = 0
+        self._checksum = (0, 0)
+        self._big_endian = False
+        self._page_size = 0
+        self._next_segment = 0
+        self._expect_reset = False
+        
+        self._last_checkpoint = 0.0
+        self._last_snapshot = 0.0
+        
+        self.stats = {
+            'segments': 0, 'frames': 0, 'bytes': 0, 'checkpoints': 0,
+            'snapshots': 0, 'generations': 0, 'last_sync': None, 'last_error': None
+        }
+    
+    # ------------------------------------------------------------------
+    # التشغيل والإيقاف
+    # ------------------------------------------------------------------
+    
+    def start(self):
+        """تحويل قاعدة البيانات إلى WAL وبدء جيل جديد وخيط النسخ"""
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            
+            os.makedirs(self.replica_dir, exist_ok=True)
+            self._acquire_process_lock()
+            
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            mode = conn.execute("PRAGMA journal_mode=WAL").fetchone()[0]
+            conn.close()
+            
+            if mode.lower() != "wal":
+                self._release_process_lock()
+                raise RuntimeError(f"تعذر تحويل قاعدة البيانات إلى وضع WAL: {mode}")
+            
+            self._reader = sqlite3.connect(self.db_path, timeout=30, isolation_level=None,
+                                           check_same_thread=False)
+            self._begin_read()
+            self._new_generation("start")
+            
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="wal-replicator", daemon=True)
+            self._thread.start()
+            
+            logger.info(f"بدأ النسخ المستمر لسجل WAL إلى: {self.replica_dir}")
+    
+    def close(self, timeout: float = 10):
+        """إيقاف الخيط بعد نسخ آخر الإطارات"""
+        self._stop.set()
+        
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+        
+        with self._lock:
+            if self._reader:
+                try:
+                    self.sync()
+                except Exception as e:
+                    logger.error(f"خطأ في النسخ الأخير لسجل WAL: {str(e)}")
+                self._end_read()
+                self._reader.close()
+                self._reader = None
+            
+            self._release_process_lock()
+    
+    def _acquire_process_lock(self):
+        """
+        قفل حصري على مجلد النسخة حتى لا تنسخ عمليتان نفس قاعدة البيانات
+        
+        قفل نظام التشغيل يُحرر تلقائياً عند انتهاء العملية فلا تبقى أقفال قديمة.
+        """
+        lock_file = open(os.path.join(self.replica_dir, ".replicator.lock"), 'a+')
+        try:
+            if os.name == 'nt':
+                import msvcrt
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_NBLCK, 1)
+            else:
+                import fcntl
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            raise RuntimeError(f"يوجد ناسخ آخر يعمل على مجلد النسخة: {self.replica_dir}")
+        
+        self._lock_file = lock_file
+    
+    def _release_process_lock(self):
+        if self._lock_file:
+            self._lock_file.close()
+            self._lock_file = None
+    
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.sync()
+                
+                now = time.monotonic()
+                wal_size = os.path.getsize(self.wal_path) if os.path.exists(self.wal_path) else 0
+                
+                if now - self._last_snapshot >= self.snapshot_interval:
+                    self.snapshot()
+                elif (now - self._last_checkpoint >= self.checkpoint_interval
+                      or wal_size >= self.checkpoint_wal_bytes):
+                    self.checkpoint()
+                
+                self.stats['last_error'] = None
+            except Exception as e:
+                self.stats['last_error'] = str(e)
+                logger.error(f"خطأ في النسخ المستمر لسجل WAL: {str(e)}")
+    
+    def _begin_read(self):
+        # معاملة قراءة مفتوحة تمنع إعادة WAL من بدايته قبل نسخ إطاراته
+        self._reader.execute("BEGIN")
+        self._reader.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+    
+    def _end_read(self):
+        if self._reader.in_transaction:
+            self._reader.execute("COMMIT")
+    
+    # ------------------------------------------------------------------
+    # نسخ الإطارات
+    # ------------------------------------------------------------------
+    
+    @property
+    def _generation_dir(self) -> str:
+        return os.path.join(self.replica_dir, "generations", self._generation)
+    
+    def _read_wal_header(self, f) -> Optional[Dict]:
+        f.seek(0)
+        header = f.read(WAL_HEADER_SIZE)
+        if len(header) < WAL_HEADER_SIZE:
+            return None
+        
+        magic, _, page_size, _, salt1, salt2, c0, c1 = struct.unpack(">8I", header)
+        if magic not in (WAL_MAGIC_LITTLE_ENDIAN, WAL_MAGIC_BIG_ENDIAN):
+            return None
+        
+        big_endian = magic == WAL_MAGIC_BIG_ENDIAN
+        if _wal_checksum(header[:24], 0, 0, big_endian) != (c0, c1):
+            return None
+        
+        return {'page_size': page_size, 'salt': (salt1, salt2), 'checksum': (c0, c1), 'big_endian': big_endian}
+    
+    def _scan_committed(self, f) -> Tuple[bytes, int, Tuple[int, int], int, float]:
+        """
+        قراءة الإطارات الصحيحة بعد الموضع الحالي حتى آخر إطار commit
+        
+        Returns:
+            (الإطارات, الموضع الجديد, المجموع الاختباري عنده, عدد الإطارات, وقت القراءة)
+        """
+        frame_size = WAL_FRAME_HEADER_SIZE + self._page_size
+        f.seek(self._offset)
+        
+        checksum = self._checksum
+        committed = []
+        pending = []
+        offset = self._offset
+        commit_offset, commit_checksum = self._offset, self._checksum
+        
+        while True:
+            frame = f.read(frame_size)
+            if len(frame) < frame_size:
+                break
+            
+            _, db_size, salt1, salt2, c0, c1 = struct.unpack(">6I", frame[:WAL_FRAME_HEADER_SIZE])
+            if (salt1, salt2) != self._salt:
+                break
+            
+            checksum = _wal_checksum(frame[:8] + frame[WAL_FRAME_HEADER_SIZE:], *checksum, self._big_endian)
+            if checksum != (c0, c1):
+                # إطار غير مكتمل الكتابة أو بقايا من دورة سابقة
+                break
+            
+            pending.append(frame)
+            offset += frame_size
+            
+            if db_size:
+                committed.extend(pending)
+                pending = []
+                commit_offset, commit_checksum = offset, checksum
+        
+        return b"".join(committed), commit_offset, commit_checksum, len(committed), time.time()
+    
+    def sync(self) -> int:
+        """
+        نسخ المعاملات المكتملة الجديدة إلى مقطع جديد
+        
+        Returns:
+            عدد الإطارات المنسوخة
+        """
+        with self._lock:
+            if not os.path.exists(self.wal_path):
+                return 0
+            
+            with open(self.wal_path, 'rb') as f:
+                header = self._read_wal_header(f)
+                if header is None:
+                    return 0
+                
+                if header['salt'] != self._salt:
+                    if not self._expect_reset:
+                        # أُعيد WAL دون نقطة تفتيش منا: التسلسل منقطع فيبدأ جيل جديد
+                        logger.warning("انقطع تسلسل سجل WAL، سيبدأ جيل جديد بلقطة كاملة")
+                        self._new_generation("wal-reset")
+                        return 0
+                    
+                    self._set_wal_position(header)
+                
+                frames, offset, checksum, count, copied_at = self._scan_committed(f)
+            
+            if not count:
+                return 0
+            
+            self._write_segment(frames, count, copied_at)
+            self._offset, self._checksum = offset, checksum
+            self._expect_reset = False
+            
+            return count
+    
+    def _set_wal_position(self, header: Dict):
+        self._salt = header['salt']
+        self._checksum = header['checksum']
+        self._big_endian = header['big_endian']
+        self._page_size = header['page_size']
+        self._offset = WAL_HEADER_SIZE
+    
+    def _write_segment(self, frames: bytes, count: int, copied_at: float):
+        seq = self._next_segment
+        wal_dir = os.path.join(self._generation_dir, "wal")
+        segment_path = os.path.join(wal_dir, f"{seq:010d}.frames")
+        
+        with open(segment_path, 'wb') as f:
+            f.write(frames)
+            f.flush()
+            os.fsync(f.fileno())
+        
+        with open(os.path.join(self._generation_dir, "segments.jsonl"), 'a', encoding='utf-8') as f:
+            f.write(json.dumps({
+                'seq': seq, 'time': copied_at, 'frames': count, 'page_size': self._page_size
+            }) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        
+        self._next_segment += 1
+        self.stats['segments'] += 1
+        self.stats['frames'] += count
+        self.stats['bytes'] += len(frames)
+        self.stats['last_sync'] = datetime.fromtimestamp(copied_at).isoformat()
+    
+    # ------------------------------------------------------------------
+    # نقاط التفتيش واللقطات
+    # ------------------------------------------------------------------
+    
+    def _with_writers_paused(self, action):
+        """
+        تنفيذ عملية والكتابة موقوفة: تُنسخ آخر الإطارات أولاً فلا يضيع شيء بينها وبين العملية
+        """
+        with self._lock:
+            blocker = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            try:
+                blocker.execute("BEGIN IMMEDIATE")
+                self.sync()
+                self._end_read()
+                try:
+                    return action()
+                finally:
+                    self._begin_read()
+            finally:
+                if blocker.in_transaction:
+                    blocker.execute("ROLLBACK")
+                blocker.close()
+    
+    def checkpoint(self) -> bool:
+        """
+        نقل إطارات WAL المنسوخة إلى ملف قاعدة البيانات حتى لا يكبر WAL
+        
+        Returns:
+            True إذا اكتملت نقطة التفتيش (سيُعاد WAL من بدايته مع أول كتابة)
+        """
+        def run():
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            try:
+                busy, log_frames, checkpointed = conn.execute("PRAGMA wal_checkpoint(PASSIVE)").fetchone()
+            finally:
+                conn.close()
+            
+            complete = not busy and log_frames == checkpointed
+            self._expect_reset = self._expect_reset or complete
+            return complete
+        
+        complete = self._with_writers_paused(run)
+        self._last_checkpoint = time.monotonic()
+        self.stats['checkpoints'] += 1
+        return complete
+    
+    def snapshot(self) -> str:
+        """
+        لقطة كاملة متسقة مع موضع النسخ الحالي تبدأ منها الاستعادة
+        
+        تتوقف الكتابة لحظياً فقط لنسخ آخر الإطارات وتثبيت معاملة القراءة عندها، ثم تُنسخ
+        قاعدة البيانات من معاملة القراءة المثبتة والكتابة مستمرة.
+        
+        Returns:
+            مسار اللقطة
+        """
+        with self._lock:
+            # معاملة القراءة الجديدة تطابق تماماً الحالة عند المقطع التالي
+            next_segment = self._with_writers_paused(lambda: self._next_segment)
+            
+            snapshot_path = os.path.join(self._generation_dir, "snapshots", f"{next_segment:010d}.sqlite")
+            temp_path = snapshot_path + ".tmp"
+            
+            target = sqlite3.connect(temp_path)
+            try:
+                self._reader.backup(target)
+            finally:
+                target.close()
+            
+            os.replace(temp_path, snapshot_path)
+            
+            with open(os.path.join(self._generation_dir, "snapshots.jsonl"), 'a', encoding='utf-8') as f:
+                f.write(json.dumps({'next_segment': next_segment, 'time': time.time()}) + "\n")
+        
+        self._last_snapshot = time.monotonic()
+        self.stats['snapshots'] += 1
+        
+        self.prune()
+        return snapshot_path
+    
+    def _new_generation(self, reason: str):
+        """بدء جيل جديد: موضع WAL الحالي ولقطة كاملة تطابقه"""
+        with self._lock:
+            self._generation = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+            os.makedirs(os.path.join(self._generation_dir, "wal"), exist_ok=True)
+            os.makedirs(os.path.join(self._generation_dir, "snapshots"), exist_ok=True)
+            
+            self._next_segment = 0
+            self._expect_reset = False
+            self._salt = None
+            
+            # بداية الجيل من آخر إطار مكتمل حالياً دون نسخ ما قبله (تحويه اللقطة)
+            if os.path.exists(self.wal_path):
+                with open(self.wal_path, 'rb') as f:
+                    header = self._read_wal_header(f)
+                    if header:
+                        self._set_wal_position(header)
+                        _, self._offset, self._checksum, _, _ = self._scan_committed(f)
+            
+            # أول sync بعد إعادة WAL يقبل الرأس الجديد لأن اللقطة ستشمل كل ما قبله
+            self._expect_reset = True
+            self.stats['generations'] += 1
+            
+            logger.info(f"جيل جديد للنسخ المستمر ({reason}): {self._generation}")
+            self.snapshot()
+    
+    def prune(self):
+        """حذف الأجيال والمقاطع الأقدم من مدة الاحتفاظ مع إبقاء ما تحتاجه آخر لقطة"""
+        cutoff = time.time() - self.retention_seconds
+        generations_dir = os.path.join(self.replica_dir, "generations")
+        
+        for generation in sorted(os.listdir(generations_dir)):
+            if generation == self._generation:
+                continue
+            
+            snapshots = _read_jsonl(os.path.join(generations_dir, generation, "snapshots.jsonl"))
+            segments = _read_jsonl(os.path.join(generations_dir, generation, "segments.jsonl"))
+            last_time = max([item['time'] for item in snapshots + segments] or [0])
+            
+            if last_time < cutoff:
+                shutil.rmtree(os.path.join(generations_dir, generation), ignore_errors=True)
+                logger.info(f"تم حذف جيل نسخ مستمر قديم: {generation}")
+        
+        # داخل الجيل الحالي: المقاطع السابقة لأقدم لقطة محتفظ بها لا حاجة لها
+        snapshots = _read_jsonl(os.path.join(self._generation_dir, "snapshots.jsonl"))
+        kept = [item for item in snapshots if item['time'] >= cutoff] or snapshots[-1:]
+        oldest = kept[0]['next_segment'] if kept else 0
+        
+        for item in snapshots:
+            if item['next_segment'] < oldest:
+                path = os.path.join(self._generation_dir, "snapshots", f"{item['next_segment']:010d}.sqlite")
+                if os.path.exists(path):
+                    os.remove(path)
+        
+        wal_dir = os.path.join(self._generation_dir, "wal")
+        for filename in os.listdir(wal_dir):
+            if int(filename.split(".")[0]) < oldest:
+                os.remove(os.path.join(wal_dir, filename))
+    
+    def get_status(self) -> Dict:
+        """حالة الناسخ وإحصائياته"""
+        wal_size = os.path.getsize(self.wal_path) if os.path.exists(self.wal_path) else 0
+        
+        return {
+            'running': bool(self._thread and self._thread.is_alive()),
+            'generation': self._generation,
+            'next_segment': self._next_segment,
+            'wal_bytes': wal_size,
+            'pending_wal_bytes': max(wal_size - self._offset, 0) if self._salt else 0,
+            **self.stats
+        }
+
+
+def _read_jsonl(path: str) -> List[Dict]:
+    if not os.path.exists(path):
+        return []
+    
+    with open(path, 'r', encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def list_restore_points(replica_dir: str) -> List[Dict]:
+    """
+    الفترات الزمنية المتاحة للاستعادة في كل جيل
+    
+    Returns:
+        [{'generation', 'from', 'to'}] من الأقدم إلى الأحدث
+    """
+    generations_dir = os.path.join(replica_dir, "generations")
+    points = []
+    
+    for generation in sorted(os.listdir(generations_dir)):
+        snapshots = _read_jsonl(os.path.join(generations_dir, generation, "snapshots.jsonl"))
+        segments = _read_jsonl(os.path.join(generations_dir, generation, "segments.jsonl"))
+        
+        available = [item for item in snapshots
+                     if os.path.exists(os.path.join(generations_dir, generation, "snapshots",
+                                                    f"{item['next_segment']:010d}.sqlite"))]
+        if not available:
+            continue
+        
+        points.append({
+            'generation': generation,
+            'from': datetime.fromtimestamp(available[0]['time']).isoformat(),
+            'to': datetime.fromtimestamp(max(item['time'] for item in available + segments)).isoformat()
+        })
+    
+    return points
+
+
+def restore_to_time(replica_dir: str, target_path: str, timestamp: Optional[datetime] = None) -> Dict:
+    """
+    استعادة قاعدة البيانات كما كانت في لحظة محددة
+    
+    تُنسخ أحدث لقطة قبل اللحظة المطلوبة ثم تُطبق عليها صفحات المعاملات المنسوخة
+    حتى تلك اللحظة بالترتيب.
+    
+    Args:
+        replica_dir: مجلد النسخة المتماثلة
+        target_path: مسار قاعدة البيانات المستعادة (يجب ألا تكون القاعدة العاملة)
+        timestamp: اللحظة المطلوبة (آخر لحظة منسوخة إذا لم تُحدد)
+    
+    Returns:
+        {'generation', 'snapshot_time', 'restored_to', 'segments', 'transactions'}
+    """
+    target_time = timestamp.timestamp() if timestamp else float('inf')
+    generations_dir = os.path.join(replica_dir, "generations")
+    
+    # أحدث لقطة قبل اللحظة المطلوبة عبر جميع الأجيال
+    best = None
+    for generation in sorted(os.listdir(generations_dir)):
+        for item in _read_jsonl(os.path.join(generations_dir, generation, "snapshots.jsonl")):
+            path = os.path.join(generations_dir, generation, "snapshots", f"{item['next_segment']:010d}.sqlite")
+            if item['time'] <= target_time and os.path.exists(path):
+                if best is None or item['time'] >= best[1]['time']:
+                    best = (generation, item, path)
+    
+    if best is None:
+        raise ValueError("لا توجد لقطة قبل اللحظة المطلوبة")
+    
+    generation, snapshot, snapshot_path = best
+    generation_dir = os.path.join(generations_dir, generation)
+    
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(target_path + suffix):
+            os.remove(target_path + suffix)
+    shutil.copyfile(snapshot_path, target_path)
+    
+    segments = [item for item in _read_jsonl(os.path.join(generation_dir, "segments.jsonl"))
+                if item['seq'] >= snapshot['next_segment'] and item['time'] <= target_time]
+    
+    transactions = 0
+    restored_to = snapshot['time']
+    
+    with open(target_path, 'r+b') as db:
+        for segment in sorted(segments, key=lambda item: item['seq']):
+            page_size = segment['page_size']
+            frame_size = WAL_FRAME_HEADER_SIZE + page_size
+            
+            with open(os.path.join(generation_dir, "wal", f"{segment['seq']:010d}.frames"), 'rb') as f:
+                data = f.read()
+            
+            for offset in range(0, len(data), frame_size):
+                page_number, db_size = struct.unpack(">2I", data[offset:offset + 8])
+                db.seek((page_number - 1) * page_size)
+                db.write(data[offset + WAL_FRAME_HEADER_SIZE:offset + frame_size])
+                
+                if db_size:
+                    db.truncate(db_size * page_size)
+                    transactions += 1
+            
+            restored_to = segment['time']
+    
+    conn = sqlite3.connect(target_path)
+    integrity = conn.execute("PRAGMA integrity_check").fetchone()[0]
+    conn.close()
+    
+    if integrity != 'ok':
+        raise RuntimeError(f"فشل فحص سلامة قاعدة البيانات المستعادة: {integrity}")
+    
+    logger.info(f"تمت استعادة قاعدة البيانات إلى {datetime.fromtimestamp(restored_to).isoformat()}")
+    
+    return {
+        'generation': generation,
+        'snapshot_time': datetime.fromtimestamp(snapshot['time']).isoformat(),
+        'restored_to': datetime.fromtimestamp(restored_to).isoformat(),
+        'segments': len(segments),
+        'transactions': transactions
+    }
+
+
+# الاستعادة من سطر الأوامر:
+# python wal_replicator.py restore <مجلد النسخة> <ملف الاستعادة> [2024-01-31T18:45:00]
+if __name__ == "__main__":
+    import sys
+    
+    if len(sys.argv) in (4, 5) and sys.argv[1] == "restore":
+        target = datetime.fromisoformat(sys.argv[4]) if len(sys.argv) == 5 else None
+        print(json.dumps(restore_to_time(sys.argv[2], sys.argv[3], target), ensure_ascii=False, indent=2))
+    else:
+        print(json.dumps(list_restore_points(sys.argv[1]) if len(sys.argv) == 2 else [], ensure_ascii=False, indent=2))